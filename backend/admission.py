@@ -0,0 +1,221 @@
+import asyncio
+import math
+import os
+import re
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+from fastapi import HTTPException
+
+import metrics
+
+# Admission control for the expensive routes (bcrypt in /auth, bulk writes in
+# /import). RateLimit is a token bucket per key (client IP or user id) that
+# answers 429 with Retry-After once the bucket is empty. ConcurrencyLimit caps
+# how many requests of a route run at once in this worker and answers 503
+# with Retry-After when no slot frees up in time, so a burst of imports cannot
+# take every pooled connection from the cheap routes.
+#
+# Buckets live in this worker's memory by default. RATE_LIMIT_STORE=postgres
+# keeps them in the rate_limits table (migrations/0007) so the limits hold
+# across workers and instances; any object with the MemoryStore.take
+# signature can be passed to RateLimit instead.
+
+RATE_LIMIT_STORE = os.getenv("RATE_LIMIT_STORE", "memory")
+RATE_LIMIT_MEMORY_KEYS = int(os.getenv("RATE_LIMIT_MEMORY_KEYS", "100000"))
+RATE_LIMIT_PRUNE_EVERY = int(os.getenv("RATE_LIMIT_PRUNE_EVERY", "1000"))
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+RATE_SPEC = re.compile(r"^\s*(\d+)\s*/\s*(second|minute|hour|day)\s*$")
+
+
+def parse_rate(spec):
+    # "30/minute" -> (0.5 tokens per second, burst of 30); "" or "0/..." disables
+    if not spec or not spec.strip():
+        return None
+    match = RATE_SPEC.match(spec)
+    if not match:
+        raise ValueError(f"Invalid rate limit {spec!r}, expected e.g. 30/minute")
+    count, period = int(match.group(1)), PERIODS[match.group(2)]
+    if count == 0:
+        return None
+    return count / period, count
+
+
+def retry_after_header(seconds):
+    return {"Retry-After": str(max(1, math.ceil(seconds)))}
+
+
+class MemoryStore:
+    def __init__(self, max_keys=RATE_LIMIT_MEMORY_KEYS, clock=time.monotonic):
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets = OrderedDict()
+
+    async def take(self, key, rate, burst, cost=1, connection=None):
+        # Returns (allowed, seconds until cost tokens are available)
+        now = self.clock()
+        tokens, updated = self._buckets.get(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        # The least recently used keys go first; a forgotten bucket is full
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return allowed, 0.0 if allowed else (cost - tokens) / rate
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+# One statement per check: the bucket is refilled and charged in the upsert,
+# and left alone when it holds too few tokens (no row returned)
+RATE_LIMIT_TAKE_QUERY = """
+    INSERT INTO rate_limits AS r (key, tokens, updated_at)
+    VALUES ($1, $3::float8 - $4::float8, now())
+    ON CONFLICT (key) DO UPDATE
+        SET tokens = least($3::float8, r.tokens + extract(epoch FROM now() - r.updated_at) * $2::float8) - $4::float8,
+            updated_at = now()
+        WHERE least($3::float8, r.tokens + extract(epoch FROM now() - r.updated_at) * $2::float8) >= $4::float8
+    RETURNING tokens
+"""
+RATE_LIMIT_RETRY_AFTER_QUERY = """
+    SELECT ($3::float8 - least($2::float8, tokens + extract(epoch FROM now() - updated_at) * $4::float8)) / $4::float8
+    FROM rate_limits
+    WHERE key = $1
+"""
+RATE_LIMIT_PRUNE_QUERY = "DELETE FROM rate_limits WHERE updated_at < now() - make_interval(secs => $1)"
+
+
+class PostgresStore:
+    def __init__(self, database, prune_every=RATE_LIMIT_PRUNE_EVERY, idle_seconds=86400):
+        self.database = database
+        self.prune_every = prune_every
+        self.idle_seconds = idle_seconds
+        self._takes = 0
+
+    async def take(self, key, rate, burst, cost=1, connection=None):
+        # Uses the request's connection when it has one, so a request still
+        # holds at most one pooled connection
+        if connection is None:
+            async with self.database.acquire() as connection:
+                return await self.take(key, rate, burst, cost, connection)
+        # Keys come from clients, so new ones can arrive as fast as requests
+        # do; pruning every Nth check keeps the table in step with them
+        self._takes += 1
+        if self.prune_every > 0 and self._takes % self.prune_every == 0:
+            await self.prune(self.idle_seconds, connection)
+        tokens = await connection.fetchval(RATE_LIMIT_TAKE_QUERY, key, rate, burst, cost)
+        if tokens is not None:
+            return True, 0.0
+        wait = await connection.fetchval(RATE_LIMIT_RETRY_AFTER_QUERY, key, burst, cost, rate)
+        return False, max(wait or 0.0, 0.0)
+
+    async def prune(self, idle_seconds=86400, connection=None):
+        # A bucket idle for a day has refilled under any rate PERIODS allows,
+        # so dropping it loses nothing
+        if connection is None:
+            async with self.database.acquire() as connection:
+                return await self.prune(idle_seconds, connection)
+        status = await connection.execute(RATE_LIMIT_PRUNE_QUERY, float(idle_seconds))
+        return int(status.split()[-1])
+
+
+def make_store(kind=RATE_LIMIT_STORE):
+    if kind == "memory":
+        return MemoryStore()
+    if kind == "postgres":
+        from database import database
+        return PostgresStore(database)
+    raise ValueError(f"Unknown RATE_LIMIT_STORE {kind!r}, expected memory or postgres")
+
+
+store = make_store()
+
+# Every limit created, for stats() and /health
+limits = []
+
+
+class RateLimit:
+    def __init__(self, name, spec, store=None):
+        self.name = name
+        self.limit = parse_rate(spec)
+        self.store = store
+        self.rejected = 0
+        limits.append(self)
+
+    async def check(self, key, connection=None, cost=1):
+        if self.limit is None:
+            return
+        rate, burst = self.limit
+        backend = self.store if self.store is not None else store
+        allowed, retry_after = await backend.take(f"{self.name}:{key}", rate, burst, cost, connection)
+        if not allowed:
+            self.rejected += 1
+            metrics.count_admission_rejection(self.name, "rate_limited")
+            raise HTTPException(
+                status_code=429,
+                detail="Too many requests, please retry later",
+                headers=retry_after_header(retry_after),
+            )
+
+    def stats(self):
+        rate, burst = self.limit or (0.0, 0)
+        return {"rate_per_second": rate, "burst": burst, "rejected": self.rejected}
+
+
+class ConcurrencyLimit:
+    def __init__(self, name, limit, queue_timeout=0.0, retry_after=1):
+        self.name = name
+        self.limit = limit
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.active = 0
+        self.rejected = 0
+        limits.append(self)
+        self._semaphore = asyncio.Semaphore(limit) if limit > 0 else None
+
+    async def acquire(self):
+        if self._semaphore is None:
+            return
+        try:
+            if self.queue_timeout > 0:
+                await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+            elif self._semaphore.locked():
+                raise asyncio.TimeoutError()
+            else:
+                await self._semaphore.acquire()
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            metrics.count_admission_rejection(self.name, "busy")
+            raise HTTPException(
+                status_code=503,
+                detail="Server busy, please retry shortly",
+                headers=retry_after_header(self.retry_after),
+            )
+        self.active += 1
+
+    def release(self):
+        if self._semaphore is None:
+            return
+        self.active -= 1
+        self._semaphore.release()
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self):
+        return {"limit": self.limit, "active": self.active, "rejected": self.rejected}
+
+
+def stats():
+    return {"store": type(store).__name__, "limits": {limit.name: limit.stats() for limit in limits}}
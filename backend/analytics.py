@@ -0,0 +1,187 @@
+import datetime
+import os
+
+import numpy as np
+
+# Trend statistics over a user's measurement history. Inputs are expected in
+# measurement_date order (the trends query sorts them), which lets every
+# statistic be computed with linear NumPy passes and binary searches instead
+# of re-sorting or nested loops.
+
+WEEK_DAYS = 7
+MONTH_DAYS = 30
+
+# "stats" reads the trigger-maintained user_weight_stats row, "sql" aggregates
+# the history in Postgres and transfers one row, "python" fetches the history
+# and aggregates it here with NumPy
+TRENDS_ENGINE = os.getenv("TRENDS_ENGINE", "stats")
+
+
+# Postgres does the conversion: day is the date's ordinal (date.toordinal())
+# and weight is already a float8, so building the arrays is a plain copy.
+TRENDS_QUERY = """
+    SELECT measurement_date - DATE '0001-01-01' + 1 AS day, weight::float8 AS weight
+    FROM weight_measurements
+    WHERE user_id = $1
+    ORDER BY measurement_date
+"""
+
+# The same statistics as compute_trends in a single statement. Islands of
+# consecutive days share measurement_date - dense_rank(), so the current streak
+# is the size of the island holding the latest date.
+TRENDS_SUMMARY_QUERY = f"""
+    WITH m AS (
+        SELECT measurement_date, weight::float8 AS weight
+        FROM weight_measurements
+        WHERE user_id = $1
+    ),
+    islands AS (
+        SELECT measurement_date,
+               measurement_date - (dense_rank() OVER (ORDER BY measurement_date))::int AS island
+        FROM m
+    ),
+    stats AS (
+        SELECT count(*) AS total_measurements,
+               avg(weight) AS average_weight,
+               min(measurement_date) AS first_date,
+               max(measurement_date) AS last_date,
+               regr_slope(weight, measurement_date - DATE '0001-01-01') AS trend_slope
+        FROM m
+    )
+    SELECT
+        u.height,
+        s.total_measurements,
+        s.average_weight,
+        s.first_date,
+        s.last_date,
+        coalesce(s.trend_slope, 0) AS trend_slope,
+        (SELECT avg(weight) FROM m WHERE measurement_date > s.last_date - {WEEK_DAYS}) AS weekly_average,
+        (SELECT avg(weight) FROM m WHERE measurement_date > s.last_date - {MONTH_DAYS}) AS monthly_average,
+        (SELECT weight FROM m ORDER BY measurement_date DESC LIMIT 1) AS latest_weight,
+        (SELECT count(DISTINCT measurement_date) FROM islands
+         WHERE island = (SELECT island FROM islands ORDER BY measurement_date DESC LIMIT 1)) AS current_streak
+    FROM users u
+    CROSS JOIN stats s
+    WHERE u.id = $1
+"""
+
+# Reads the running sums in user_weight_stats; the columns match
+# TRENDS_SUMMARY_QUERY so both go through trends_from_summary.
+TRENDS_STATS_QUERY = """
+    SELECT
+        u.height,
+        coalesce(s.measurement_count, 0) AS total_measurements,
+        (s.sum_y / nullif(s.measurement_count, 0))::float8 AS average_weight,
+        s.first_date,
+        s.last_date,
+        coalesce(((s.measurement_count * s.sum_xy - s.sum_x * s.sum_y)
+                  / nullif(s.measurement_count * s.sum_xx - s.sum_x * s.sum_x, 0))::float8, 0) AS trend_slope,
+        s.weekly_average::float8 AS weekly_average,
+        s.monthly_average::float8 AS monthly_average,
+        s.latest_weight::float8 AS latest_weight,
+        s.current_streak
+    FROM users u
+    LEFT JOIN user_weight_stats s ON s.user_id = u.id
+    WHERE u.id = $1
+"""
+
+TRENDS_ENGINE_QUERIES = {
+    "stats": TRENDS_STATS_QUERY,
+    "sql": TRENDS_SUMMARY_QUERY,
+}
+
+
+def arrays_from_records(records):
+    count = len(records)
+    days = np.fromiter((r["day"] for r in records), dtype=np.int64, count=count)
+    weights = np.fromiter((r["weight"] for r in records), dtype=np.float64, count=count)
+    return days, weights
+
+
+def regression_slope(days, weights):
+    # Least-squares slope in kg per day. x is centred on its mean so the sums
+    # stay well conditioned for ordinal day numbers.
+    if days.size < 2:
+        return 0.0
+    x = days - days.mean()
+    denominator = np.dot(x, x)
+    if denominator == 0:
+        return 0.0
+    return float(np.dot(x, weights - weights.mean()) / denominator)
+
+
+def window_average(days, weights, window):
+    # Mean of measurements within `window` days ending at the latest one
+    start = np.searchsorted(days, days[-1] - window + 1, side="left")
+    return float(weights[start:].mean())
+
+
+def current_streak(days):
+    # Consecutive calendar days with at least one measurement, ending at the
+    # latest measurement date
+    unique_days = days[np.concatenate(([True], np.diff(days) != 0))]
+    breaks = np.flatnonzero(np.diff(unique_days) != 1)
+    if breaks.size == 0:
+        return int(unique_days.size)
+    return int(unique_days.size - breaks[-1] - 1)
+
+
+def bmi(weight, height_cm):
+    if not height_cm:
+        return None
+    height_m = float(height_cm) / 100
+    return weight / (height_m ** 2)
+
+
+def format_trends(average, weekly, monthly, latest_weight, height, slope, total, first_date, last_date, streak):
+    latest_bmi = bmi(latest_weight, height)
+    return {
+        "average_weight": round(average, 2),
+        "weekly_average": round(weekly, 2),
+        "monthly_average": round(monthly, 2),
+        "bmi": round(latest_bmi, 2) if latest_bmi else None,
+        "trend_slope": round(slope, 4),  # kg per day
+        "total_measurements": total,
+        "date_range": f"{first_date} to {last_date}",
+        "current_streak": streak,
+    }
+
+
+def compute_trends(days, weights, height=None):
+    # days are proleptic Gregorian ordinals (date.toordinal()), weights in kg
+    return format_trends(
+        float(weights.mean()),
+        window_average(days, weights, WEEK_DAYS),
+        window_average(days, weights, MONTH_DAYS),
+        float(weights[-1]),
+        height,
+        regression_slope(days, weights),
+        int(weights.size),
+        datetime.date.fromordinal(int(days[0])),
+        datetime.date.fromordinal(int(days[-1])),
+        current_streak(days),
+    )
+
+
+def trends_from_records(records, height=None):
+    if not records:
+        return {}
+    days, weights = arrays_from_records(records)
+    return compute_trends(days, weights, height)
+
+
+def trends_from_summary(row):
+    if not row["total_measurements"]:
+        return {}
+    return format_trends(
+        row["average_weight"],
+        row["weekly_average"],
+        row["monthly_average"],
+        row["latest_weight"],
+        row["height"],
+        row["trend_slope"],
+        row["total_measurements"],
+        row["first_date"],
+        row["last_date"],
+        row["current_streak"],
+    )
@@ -1,26 +1,62 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request
 from fastapi.security import OAuth2PasswordBearer
 from models import UserCreate, UserLogin, UserResponse
-from database import database
-from passlib.context import CryptContext
-from jose import JWTError, jwt
+from database import database, get_connection, replica_read
+from cache import TTLCache
+import metrics
+from admission import RateLimit
+from passwords import hash_password, verify_password, password_executor
+from jose.exceptions import JWTError
 from datetime import datetime, timedelta
 from asyncpg.exceptions import IntegrityConstraintViolationError, UniqueViolationError
 import os
+import time
 
 router = APIRouter()
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+# Every protected route resolves the current user, so cache both the verified
+# token payload (skips HMAC verification) and the user row (skips the query).
+# Size 0 disables a cache.
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "1024"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "30"))
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "4096"))
+TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", "300"))
+user_cache = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+token_cache = TTLCache(TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL)
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+# Login and registration each cost a bcrypt hash, so they are rate limited
+# (429 with Retry-After) before any hashing: per client IP, and logins also
+# per username to slow down guessing one account from many addresses.
+# Concurrency is already bounded by password_executor. Empty disables a limit.
+LOGIN_IP_LIMIT = RateLimit("login_ip", os.getenv("RATE_LIMIT_LOGIN_IP", "30/minute"))
+LOGIN_USER_LIMIT = RateLimit("login_user", os.getenv("RATE_LIMIT_LOGIN_USER", "10/minute"))
+REGISTER_IP_LIMIT = RateLimit("register_ip", os.getenv("RATE_LIMIT_REGISTER_IP", "10/hour"))
+
+CURRENT_USER_QUERY = "SELECT id, username, email, height, age FROM users WHERE username = $1"
+REGISTER_QUERY = """
+    INSERT INTO users (username, password_hash, email, height, age)
+    VALUES ($1, $2, $3, $4, $5)
+    RETURNING id, username, email, height, age
+"""
+LOGIN_QUERY = "SELECT id, password_hash FROM users WHERE username = $1"
+REHASH_QUERY = "UPDATE users SET password_hash = $1 WHERE id = $2"
+UPDATE_PROFILE_QUERY = """
+    UPDATE users
+    SET email = $1, height = $2, age = $3, data_version = data_version + 1
+    WHERE id = $4
+    RETURNING id, username, email, height, age
+"""
+
+def forget_user(change):
+    # invalidation.py subscriber: drop users whose cached fields changed in
+    # any worker. Measurement and goal writes leave the cached row alone.
+    if change.get("profile"):
+        user_cache.pop(change["username"])
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
@@ -29,41 +65,72 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
     to_encode.update({"exp": expire})
+    # python-jose loads its RSA/EC crypto backends on import; only HS256 is
+    # used, so that cost is paid by the first token rather than worker startup
+    from jose import jwt
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):
+def decode_token(token: str):
+    payload = token_cache.get(token)
+    if payload is None:
+        from jose import jwt
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        # Never keep a payload around past the token's own expiry
+        exp = payload.get("exp")
+        token_cache.set(token, payload, ttl=exp - time.time() if exp else None)
+    return payload
+
+async def get_current_user(token: str = Depends(oauth2_scheme), connection=Depends(get_connection)):
     credentials_exception = HTTPException(
         status_code=401,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_token(token)
         username: str = payload.get("sub")
         if username is None:
+            metrics.count_auth_failure("invalid_token")
             raise credentials_exception
     except JWTError:
+        metrics.count_auth_failure("invalid_token")
         raise credentials_exception
-    query = "SELECT id, username, email, height, age FROM users WHERE username = $1"
-    async with database.pool.acquire() as connection:
-        user = await connection.fetchrow(query, username)
+    user = user_cache.get(username)
     if user is None:
-        raise credentials_exception
+        row = await connection.fetchrow(CURRENT_USER_QUERY, username)
+        if row is None:
+            metrics.count_auth_failure("unknown_user")
+            raise credentials_exception
+        user = dict(row)
+        user_cache.set(username, user)
     return dict(user)
 
+def request_username(request):
+    # Sticky key for replica routing (see database.get_connection): the user
+    # the bearer token belongs to, or None; get_current_user does the checking
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        return decode_token(token).get("sub")
+    except JWTError:
+        return None
+
+def client_address(request):
+    # The peer address; behind a proxy run the server with --forwarded-allow-ips
+    # so this is the real client rather than the proxy
+    return request.client.host if request.client else "unknown"
+
 @router.post("/register", response_model=UserResponse)
-async def register(user: UserCreate):
+async def register(user: UserCreate, request: Request):
+    await REGISTER_IP_LIMIT.check(client_address(request))
+    password_executor.check_capacity()
     print(f"Registration attempt for username: {user.username}, email: {user.email}")
-    hashed_password = get_password_hash(user.password)
-    query = """
-        INSERT INTO users (username, password_hash, email, height, age)
-        VALUES ($1, $2, $3, $4, $5)
-        RETURNING id, username, email, height, age
-    """
+    hashed_password = await hash_password(user.password)
     try:
-        async with database.pool.acquire() as connection:
-            row = await connection.fetchrow(query, user.username, hashed_password, user.email, user.height, user.age)
+        async with database.acquire() as connection:
+            row = await connection.fetchrow(REGISTER_QUERY, user.username, hashed_password, user.email, user.height, user.age)
         print(f"Registration successful for user: {user.username}")
         return dict(row)
     except (IntegrityConstraintViolationError, UniqueViolationError) as e:
@@ -79,12 +146,23 @@ async def register(user: UserCreate):
         raise HTTPException(status_code=400, detail=f"User registration failed: {e}")
 
 @router.post("/login")
-async def login(user: UserLogin):
-    query = "SELECT password_hash FROM users WHERE username = $1"
-    async with database.pool.acquire() as connection:
-        row = await connection.fetchrow(query, user.username)
-    if not row or not verify_password(user.password, row["password_hash"]):
+async def login(user: UserLogin, request: Request):
+    await LOGIN_IP_LIMIT.check(client_address(request))
+    await LOGIN_USER_LIMIT.check(user.username)
+    password_executor.check_capacity()
+    async with database.acquire() as connection:
+        row = await connection.fetchrow(LOGIN_QUERY, user.username)
+    if not row:
+        metrics.count_auth_failure("unknown_user")
+        raise HTTPException(status_code=401, detail="Incorrect username or password")
+    valid, new_hash = await verify_password(user.password, row["password_hash"])
+    if not valid:
+        metrics.count_auth_failure("bad_password")
         raise HTTPException(status_code=401, detail="Incorrect username or password")
+    if new_hash:
+        # Stored hash uses an outdated cost factor; upgrade it while we have the password
+        async with database.acquire() as connection:
+            await connection.execute(REHASH_QUERY, new_hash, row["id"])
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
         data={"sub": user.username}, expires_delta=access_token_expires
@@ -92,23 +170,22 @@ async def login(user: UserLogin):
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.get("/me", response_model=UserResponse)
+@replica_read
 async def read_users_me(current_user: dict = Depends(get_current_user)):
     return current_user
 
 @router.put("/me", response_model=UserResponse)
-async def update_user_profile(user_update: UserCreate, current_user: dict = Depends(get_current_user)):
+async def update_user_profile(user_update: UserCreate, current_user: dict = Depends(get_current_user), connection=Depends(get_connection)):
     # Update user profile (excluding password for now)
-    query = """
-        UPDATE users
-        SET email = $1, height = $2, age = $3
-        WHERE id = $4
-        RETURNING id, username, email, height, age
-    """
     try:
-        async with database.pool.acquire() as connection:
-            row = await connection.fetchrow(query, user_update.email, user_update.height, user_update.age, current_user["id"])
-            if row is None:
-                raise HTTPException(status_code=404, detail="User not found")
+        row = await connection.fetchrow(UPDATE_PROFILE_QUERY, user_update.email, user_update.height, user_update.age, current_user["id"])
+        if row is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        user_cache.pop(current_user["username"])
         return dict(row)
     except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Profile update failed: {e}")
\ No newline at end of file
+        raise HTTPException(status_code=400, detail=f"Profile update failed: {e}")
+
+@router.get("/cache-stats")
+async def cache_stats(current_user: dict = Depends(get_current_user)):
+    return {"user_cache": user_cache.stats(), "token_cache": token_cache.stats()}
@@ -0,0 +1,84 @@
+import datetime
+import os
+from decimal import Decimal, InvalidOperation
+
+from importer import MAX_WEIGHT, WEIGHT_QUANTUM
+
+# Batch writes for sync clients (scales, offline queues). Every item is
+# validated up front, then all valid items are upserted by date with a single
+# unnest-based statement, so a batch costs one round-trip and fires the
+# weight_measurements triggers once. Re-sending a reading that is already
+# stored unchanged does not rewrite the row.
+
+MAX_BATCH_SIZE = int(os.getenv("MEASUREMENTS_MAX_BATCH_SIZE", "500"))
+
+# Dates the user already had are looked up first: a partitioned table cannot
+# return xmax to tell inserted rows from updated ones
+UPSERT_QUERY = """
+    WITH existing AS (
+        SELECT measurement_date FROM weight_measurements
+        WHERE user_id = $1 AND measurement_date = ANY($2::date[])
+    )
+    INSERT INTO weight_measurements AS w (user_id, measurement_date, weight, notes)
+    SELECT $1, b.measurement_date, b.weight, b.notes
+    FROM unnest($2::date[], $3::numeric[], $4::text[]) AS b(measurement_date, weight, notes)
+    ON CONFLICT (user_id, measurement_date) DO UPDATE
+        SET weight = EXCLUDED.weight, notes = EXCLUDED.notes
+        WHERE (w.weight, w.notes) IS DISTINCT FROM (EXCLUDED.weight, EXCLUDED.notes)
+    RETURNING w.id, w.measurement_date, w.measurement_date NOT IN (SELECT measurement_date FROM existing) AS inserted
+"""
+
+
+def validate(measurement):
+    try:
+        measurement_date = datetime.datetime.strptime(measurement.measurement_date, "%Y-%m-%d").date()
+    except ValueError:
+        return None, "Invalid date, expected YYYY-MM-DD"
+    try:
+        weight = Decimal(str(measurement.weight)).quantize(WEIGHT_QUANTUM)
+    except InvalidOperation:
+        return None, "Invalid weight"
+    if not weight.is_finite() or not 0 < weight <= MAX_WEIGHT:
+        return None, f"Weight must be between 0 and {MAX_WEIGHT}"
+    return (measurement_date, weight, measurement.notes or ""), None
+
+
+async def upsert_measurements(connection, user_id, measurements):
+    results = [None] * len(measurements)
+    # Later items win when a batch repeats a date; ON CONFLICT cannot touch
+    # the same row twice in one statement anyway
+    latest = {}
+    for index, measurement in enumerate(measurements):
+        row, error = validate(measurement)
+        if error:
+            results[index] = {"index": index, "status": "invalid", "error": error}
+            continue
+        previous = latest.get(row[0])
+        if previous is not None:
+            results[previous[0]] = {"index": previous[0], "status": "superseded", "by": index}
+        latest[row[0]] = (index, row)
+
+    written = {}
+    if latest:
+        rows = [row for _, row in latest.values()]
+        records = await connection.fetch(
+            UPSERT_QUERY,
+            user_id,
+            [row[0] for row in rows],
+            [row[1] for row in rows],
+            [row[2] for row in rows],
+        )
+        written = {record["measurement_date"]: record for record in records}
+
+    for measurement_date, (index, _) in latest.items():
+        record = written.get(measurement_date)
+        if record is None:
+            results[index] = {"index": index, "status": "unchanged"}
+        else:
+            status = "created" if record["inserted"] else "updated"
+            results[index] = {"index": index, "status": status, "id": record["id"]}
+
+    counts = {status: 0 for status in ("created", "updated", "unchanged", "superseded", "invalid")}
+    for result in results:
+        counts[result["status"]] += 1
+    return {"results": results, **counts}
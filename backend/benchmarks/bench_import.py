@@ -0,0 +1,103 @@
+# Compares the streaming COPY import against the old row-by-row INSERT loop.
+#
+#   python -m benchmarks.bench_import --rows 50000           # parsing only
+#   python -m benchmarks.bench_import --rows 50000 --db      # against DB_* settings
+#
+# The --db mode creates a throwaway user and deletes it again afterwards.
+import argparse
+import asyncio
+import csv
+import datetime
+import io
+import time
+import uuid
+
+from fastapi import UploadFile
+
+import importer
+from database import database
+
+
+def make_csv(rows):
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(["Date", "Weight", "Notes"])
+    start = datetime.date(2000, 1, 1)
+    for i in range(rows):
+        writer.writerow([start + datetime.timedelta(days=i), f"{70 + (i % 200) / 10:.1f}", "bench"])
+    return output.getvalue().encode("utf-8")
+
+
+async def legacy_import(connection, user_id, content):
+    csv_reader = csv.DictReader(io.StringIO(content.decode('utf-8')))
+    for row in csv_reader:
+        try:
+            date = datetime.datetime.strptime(row["Date"], "%Y-%m-%d").date()
+            weight = float(row["Weight"])
+            notes = row.get("Notes", "")
+            await connection.execute("""
+                INSERT INTO weight_measurements (user_id, measurement_date, weight, notes)
+                VALUES ($1, $2, $3, $4)
+                ON CONFLICT DO NOTHING
+            """, user_id, date, weight, notes)
+        except Exception:
+            continue
+
+
+async def bench_parse(content):
+    start = time.perf_counter()
+    rows = 0
+    upload = UploadFile(file=io.BytesIO(content), filename="bench.csv")
+    async for batch, _ in importer.iter_batches(upload):
+        rows += len(batch)
+    return rows, time.perf_counter() - start
+
+
+async def bench_db(content, rows):
+    await database.connect()
+    results = {}
+    try:
+        async with database.acquire() as connection:
+            name = f"bench_{uuid.uuid4().hex[:12]}"
+            user_id = await connection.fetchval(
+                "INSERT INTO users (username, password_hash, email) VALUES ($1, 'x', $2) RETURNING id",
+                name, f"{name}@example.com",
+            )
+            try:
+                start = time.perf_counter()
+                await legacy_import(connection, user_id, content)
+                results["legacy"] = time.perf_counter() - start
+                await connection.execute("DELETE FROM weight_measurements WHERE user_id = $1", user_id)
+
+                upload = UploadFile(file=io.BytesIO(content), filename="bench.csv")
+                start = time.perf_counter()
+                counts = await importer.import_csv(connection, user_id, upload)
+                results["streaming"] = time.perf_counter() - start
+                assert counts["inserted"] == rows, counts
+            finally:
+                await connection.execute("DELETE FROM weight_measurements WHERE user_id = $1", user_id)
+                await connection.execute("DELETE FROM users WHERE id = $1", user_id)
+    finally:
+        await database.disconnect()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--db", action="store_true", help="load into the configured database")
+    args = parser.parse_args()
+
+    content = make_csv(args.rows)
+    rows, elapsed = asyncio.run(bench_parse(content))
+    print(f"parse+validate: {rows} rows in {elapsed:.3f}s ({rows / elapsed:,.0f} rows/sec)")
+
+    if args.db:
+        results = asyncio.run(bench_db(content, args.rows))
+        for name, elapsed in results.items():
+            print(f"{name:>9}: {args.rows} rows in {elapsed:.3f}s ({args.rows / elapsed:,.0f} rows/sec)")
+        print(f"  speedup: {results['legacy'] / results['streaming']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
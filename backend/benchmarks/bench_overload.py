@@ -0,0 +1,97 @@
+# Latency of a cheap route while a flood of expensive requests competes with
+# it for the same pooled connections, with and without a ConcurrencyLimit on
+# the expensive route (admission.py). In-process, against a synthetic app
+# whose "pool" is a semaphore, so it needs no database:
+#
+#   python -m benchmarks.bench_overload --output overload.json
+#
+# Without the limit the cheap requests queue behind the imports for the pool;
+# with it the surplus imports get 503 and the cheap ones keep a free slot.
+import argparse
+import asyncio
+import time
+
+import httpx
+from fastapi import FastAPI
+
+from admission import ConcurrencyLimit
+from benchmarks.common import latency_summary, write_results
+
+
+def overload_app(limit, pool_size, import_seconds):
+    # As in the real app, where /import and GET /measurements share the pool
+    app = FastAPI()
+    pool = asyncio.Semaphore(pool_size)
+
+    @app.post("/import")
+    async def expensive():
+        async with limit.slot():
+            async with pool:
+                await asyncio.sleep(import_seconds)
+        return {"ok": True}
+
+    @app.get("/measurements")
+    async def cheap():
+        async with pool:
+            await asyncio.sleep(0.001)
+        return {"ok": True}
+
+    return app
+
+
+async def run_overload(limit, args):
+    app = overload_app(limit, args.pool_size, args.import_seconds)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def timed_get():
+            began = time.perf_counter()
+            response = await client.get("/measurements")
+            response.raise_for_status()
+            return time.perf_counter() - began
+
+        async def cheap_clients():
+            # Once the imports hold the pool
+            await asyncio.sleep(args.import_seconds / 10)
+            return await asyncio.gather(*(timed_get() for _ in range(args.cheap)))
+
+        start = time.perf_counter()
+        flood = [client.post("/import") for _ in range(args.imports)]
+        *imports, samples = await asyncio.gather(*flood, cheap_clients())
+        elapsed = time.perf_counter() - start
+    statuses = [response.status_code for response in imports]
+    return {
+        "cheap": latency_summary(samples, elapsed),
+        "imports_accepted": statuses.count(200),
+        "imports_rejected": statuses.count(503),
+    }
+
+
+async def run(args):
+    return {
+        "unlimited": await run_overload(ConcurrencyLimit("bench_unlimited", 0), args),
+        "limited": await run_overload(ConcurrencyLimit("bench_limited", args.limit), args),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--imports", type=int, default=40, help="concurrent expensive requests")
+    parser.add_argument("--cheap", type=int, default=40, help="concurrent cheap requests sent during the flood")
+    parser.add_argument("--limit", type=int, default=2, help="expensive requests allowed at once in the limited run")
+    parser.add_argument("--pool-size", type=int, default=4)
+    parser.add_argument("--import-seconds", type=float, default=0.2, help="how long an expensive request holds its connection")
+    parser.add_argument("--output", help="write the JSON result here instead of stdout")
+    args = parser.parse_args()
+    results = asyncio.run(run(args))
+    for name, result in results.items():
+        print(f"{name:>9}: cheap p99 {result['cheap']['p99_ms']:8.1f}ms, "
+              f"imports {result['imports_accepted']} accepted / {result['imports_rejected']} rejected")
+    write_results(
+        "overload", results, args.output,
+        imports=args.imports, cheap=args.cheap, limit=args.limit,
+        pool_size=args.pool_size, import_seconds=args.import_seconds,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+# Plain vs year-partitioned weight_measurements (migrations 0009/0010) on a
+# synthetic dataset built in two scratch schemas of the DB_* database:
+#
+#   python -m benchmarks.bench_partitions --output partitions.json
+#
+# Both schemas get the same rows: --users users with a reading on each of the
+# last --days days. The defaults build ~700k rows in well under a minute; the
+# sizes the partitioning was designed for take --users 27500 --days 3650
+# (~100M rows, ~15 GB per schema) and an hour or more to load, so run those
+# against a dedicated instance. --keep leaves the schemas for later runs with
+# --reuse.
+#
+# Reported per layout: latency of the per-user reads (/measurements pages,
+# /trends history, recent /measurements/series window), a cross-user scan of
+# the last 30 days, and how long VACUUM takes after --churn of the recent
+# rows were rewritten, for the whole table and (partitioned) for the hot
+# partition autovacuum would actually visit.
+import argparse
+import asyncio
+import datetime
+import random
+import sys
+import time
+
+import analytics
+import measurements
+import series
+from benchmarks.common import latency_summary, write_results
+from database import database
+
+SCHEMAS = ("bench_plain", "bench_part")
+
+TABLE_COLUMNS = """
+    id BIGINT NOT NULL,
+    user_id INTEGER NOT NULL,
+    measurement_date DATE NOT NULL,
+    weight NUMERIC(5, 2) NOT NULL,
+    notes TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+"""
+
+# Daily readings ending today, with ids in date order as if written day by day
+FILL_QUERY = """
+    INSERT INTO weight_measurements (id, user_id, measurement_date, weight, notes)
+    SELECT ($3::int - 1 - day)::bigint * $4::int + user_id, user_id, CURRENT_DATE - day,
+           round((70 + user_id % 40 + sin(day / 30.0) * 3)::numeric, 2), ''
+    FROM generate_series($1::int, $2::int) AS user_id,
+         generate_series(0, $3::int - 1) AS day
+"""
+
+RECENT_WINDOW_QUERY = """
+    SELECT count(*), avg(weight)::float8
+    FROM weight_measurements
+    WHERE measurement_date >= CURRENT_DATE - 30
+"""
+
+CHURN_QUERY = """
+    UPDATE weight_measurements SET notes = 'edited'
+    WHERE measurement_date >= CURRENT_DATE - 30 AND random() < $1
+"""
+
+
+async def build(connection, schema, users, days, partitioned):
+    await connection.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+    await connection.execute(f"CREATE SCHEMA {schema}")
+    await connection.execute(f"SET search_path TO {schema}")
+    if partitioned:
+        await connection.execute(
+            f"CREATE TABLE weight_measurements ({TABLE_COLUMNS}, PRIMARY KEY (id, measurement_date)) "
+            "PARTITION BY RANGE (measurement_date)"
+        )
+        await connection.execute(
+            "CREATE INDEX weight_measurements_date_brin ON weight_measurements USING brin (measurement_date)"
+        )
+        # The layout 0009 leaves behind: the years holding readings, next
+        # year and a default partition for everything else
+        today = datetime.date.today()
+        first_year = (today - datetime.timedelta(days=days)).year
+        for year in range(first_year, today.year + 2):
+            await connection.execute(
+                f"CREATE TABLE weight_measurements_y{year} PARTITION OF weight_measurements "
+                f"FOR VALUES FROM ('{year}-01-01') TO ('{year + 1}-01-01')"
+            )
+        await connection.execute("CREATE TABLE weight_measurements_default PARTITION OF weight_measurements DEFAULT")
+    else:
+        await connection.execute(f"CREATE TABLE weight_measurements ({TABLE_COLUMNS}, PRIMARY KEY (id))")
+    await connection.execute(
+        "CREATE UNIQUE INDEX weight_measurements_user_date_key "
+        "ON weight_measurements (user_id, measurement_date) INCLUDE (weight)"
+    )
+    # Loads in slices of users so a 100M-row run does not need one huge transaction
+    start = time.perf_counter()
+    step = max(1, 2_000_000 // days)
+    for first in range(1, users + 1, step):
+        await connection.execute(FILL_QUERY, first, min(users, first + step - 1), days, users)
+    await connection.execute("VACUUM (ANALYZE) weight_measurements")
+    return time.perf_counter() - start
+
+
+async def time_queries(connection, query, make_args, requests):
+    await connection.fetch(query, *make_args())
+    samples = []
+    start = time.perf_counter()
+    for _ in range(requests):
+        args = make_args()
+        began = time.perf_counter()
+        await connection.fetch(query, *args)
+        samples.append(time.perf_counter() - began)
+    return latency_summary(samples, time.perf_counter() - start)
+
+
+async def time_vacuum(connection, table):
+    start = time.perf_counter()
+    await connection.execute(f"VACUUM {table}")
+    return round((time.perf_counter() - start) * 1000, 1)
+
+
+async def table_bytes(connection):
+    return await connection.fetchval(
+        """
+        SELECT coalesce(sum(pg_total_relation_size(c.oid)), 0)
+        FROM pg_class c
+        WHERE c.relnamespace = current_schema()::regnamespace AND c.relkind IN ('r', 'p')
+        """
+    )
+
+
+async def measure(connection, schema, args):
+    await connection.execute(f"SET search_path TO {schema}")
+    rng = random.Random(0)
+    today = datetime.date.today()
+
+    def user():
+        return (rng.randint(1, args.users),)
+
+    def recent_window():
+        return (rng.randint(1, args.users), today - datetime.timedelta(days=90), today)
+
+    page = measurements.list_query(("id", "measurement_date", "weight", "notes"), False, False, True)
+    results = {
+        "bytes": await table_bytes(connection),
+        "measurements_page": await time_queries(connection, page, lambda: (*user(), 50), args.requests),
+        "trends_history": await time_queries(connection, analytics.TRENDS_QUERY, user, args.requests),
+        "series_last_90_days": await time_queries(connection, series.RAW_SERIES_QUERY, recent_window, args.requests),
+        "all_users_last_30_days": await time_queries(connection, RECENT_WINDOW_QUERY, lambda: (), 5),
+    }
+
+    await connection.execute(CHURN_QUERY, args.churn)
+    results["vacuum_after_churn_ms"] = await time_vacuum(connection, "weight_measurements")
+    if schema == "bench_part":
+        await connection.execute(CHURN_QUERY, args.churn)
+        results["vacuum_hot_partition_after_churn_ms"] = await time_vacuum(
+            connection, f"weight_measurements_y{today.year}"
+        )
+    return results
+
+
+async def run(args):
+    await database.connect()
+    try:
+        async with database.acquire() as connection:
+            results = {}
+            for schema in SCHEMAS:
+                if not args.reuse:
+                    seconds = await build(connection, schema, args.users, args.days, schema == "bench_part")
+                    print(f"Built {schema} in {seconds:.1f}s", file=sys.stderr)
+                results[schema] = await measure(connection, schema, args)
+            if not args.keep:
+                for schema in SCHEMAS:
+                    await connection.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+            await connection.execute("RESET search_path")
+    finally:
+        await database.disconnect()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--days", type=int, default=3650)
+    parser.add_argument("--requests", type=int, default=200, help="queries timed per per-user read")
+    parser.add_argument("--churn", type=float, default=0.5, help="share of the last 30 days' rows rewritten before VACUUM")
+    parser.add_argument("--keep", action="store_true", help="leave the bench_* schemas in place")
+    parser.add_argument("--reuse", action="store_true", help="measure schemas kept by an earlier --keep run")
+    parser.add_argument("--output", help="write the JSON result here instead of stdout")
+    args = parser.parse_args()
+    results = asyncio.run(run(args))
+    write_results(
+        "partitions", results, args.output,
+        users=args.users, days=args.days, requests=args.requests, churn=args.churn,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# Serialization cost of a 10k-row /measurements response: the old path (a dict
+# per row, Decimal weights, jsonable_encoder, json.dumps) against the orjson
+# response with float8 weights and records passed through as they are.
+#
+#   python -m benchmarks.bench_serialization                # synthetic dict rows
+#   python -m benchmarks.bench_serialization --db           # real asyncpg records from DB_*
+import argparse
+import asyncio
+import datetime
+import json
+import time
+from decimal import Decimal
+
+from fastapi.encoders import jsonable_encoder
+
+from database import database
+from responses import JSONResponse
+from benchmarks.common import write_results
+
+FIELDS = ("id", "measurement_date", "weight", "notes")
+
+ROWS_QUERY = """
+    SELECT g AS id, DATE '2000-01-01' + g AS measurement_date, {weight} AS weight, 'weekly check-in' AS notes
+    FROM generate_series(1, $1) AS g
+"""
+NUMERIC_WEIGHT = "(70 + (g % 200) / 10.0)::numeric(5, 2)"
+FLOAT_WEIGHT = "(70 + (g % 200) / 10.0)::numeric(5, 2)::float8"
+
+
+def make_rows(count, weight_type):
+    start = datetime.date(2000, 1, 1)
+    return [
+        {
+            "id": i,
+            "measurement_date": start + datetime.timedelta(days=i),
+            "weight": weight_type(f"{70 + (i % 200) / 10:.2f}"),
+            "notes": "weekly check-in",
+        }
+        for i in range(1, count + 1)
+    ]
+
+
+def legacy_render(rows):
+    # What the handler and FastAPI's default JSONResponse used to do
+    content = jsonable_encoder({"measurements": [{field: row[field] for field in FIELDS} for row in rows]})
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def orjson_render(rows):
+    return JSONResponse({"measurements": rows}).body
+
+
+def best_of(func, rows, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = func(rows)
+        best = min(best, time.perf_counter() - start)
+    return best, len(body)
+
+
+async def fetch_rows(count):
+    await database.connect()
+    try:
+        async with database.acquire() as connection:
+            numeric = await connection.fetch(ROWS_QUERY.format(weight=NUMERIC_WEIGHT), count)
+            floats = await connection.fetch(ROWS_QUERY.format(weight=FLOAT_WEIGHT), count)
+    finally:
+        await database.disconnect()
+    return numeric, floats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--db", action="store_true", help="serialize real asyncpg records from the configured database")
+    parser.add_argument("--output", help="write the JSON result here instead of stdout")
+    args = parser.parse_args()
+
+    if args.db:
+        numeric_rows, float_rows = asyncio.run(fetch_rows(args.rows))
+    else:
+        numeric_rows, float_rows = make_rows(args.rows, Decimal), make_rows(args.rows, float)
+
+    legacy, legacy_size = best_of(legacy_render, numeric_rows, args.repeat)
+    fast, fast_size = best_of(orjson_render, float_rows, args.repeat)
+    results = {
+        "legacy": {"seconds": round(legacy, 6), "bytes": legacy_size},
+        "orjson": {"seconds": round(fast, 6), "bytes": fast_size},
+        "speedup": round(legacy / fast, 1),
+    }
+    print(f"legacy: {legacy * 1000:8.2f}ms  orjson: {fast * 1000:8.2f}ms  speedup: {legacy / fast:.1f}x")
+    write_results("serialization", results, args.output, rows=args.rows, db=args.db)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# Cold start cost of a worker: wall time and peak RSS of `import main` in a
+# fresh interpreter, the slowest imports (from -X importtime), and with
+# --serve the time from spawning uvicorn until /health answers.
+#
+#   python -m benchmarks.bench_startup --runs 10 --output startup.json
+#   python -m benchmarks.bench_startup --serve      # needs the DB_* database
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+from benchmarks.common import write_results
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in the child: time the import and report peak RSS (KiB on Linux)
+IMPORT_SCRIPT = """
+import resource, time
+start = time.perf_counter()
+import main
+print(time.perf_counter() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def run_import():
+    output = subprocess.run(
+        [sys.executable, "-W", "ignore", "-c", IMPORT_SCRIPT],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+    ).stdout.split()
+    return float(output[0]), int(output[1])
+
+
+def slowest_imports(top):
+    # Cumulative time of the packages imported directly by the app modules
+    stderr = subprocess.run(
+        [sys.executable, "-W", "ignore", "-X", "importtime", "-c", "import main"],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+    ).stderr
+    modules = {}
+    for line in stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match and len(match.group(3)) <= 5:
+            modules[match.group(4)] = int(match.group(2)) / 1000
+    ranked = sorted(modules.items(), key=lambda item: item[1], reverse=True)
+    return {name: round(ms, 1) for name, ms in ranked[:top]}
+
+
+def time_to_ready(port, timeout=60):
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port)],
+        cwd=BACKEND_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                if httpx.get(f"http://127.0.0.1:{port}/health", timeout=1).status_code == 200:
+                    return time.perf_counter() - start
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.02)
+        raise SystemExit(f"Server did not answer /health within {timeout}s")
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure import time, memory and readiness of a fresh worker")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--top", type=int, default=10, help="slowest imports to list")
+    parser.add_argument("--serve", action="store_true", help="also time uvicorn startup until /health answers")
+    parser.add_argument("--port", type=int, default=8102)
+    parser.add_argument("--output", help="write the JSON result here instead of stdout")
+    args = parser.parse_args()
+
+    samples = [run_import() for _ in range(args.runs)]
+    seconds = [s for s, _ in samples]
+    rss = [r for _, r in samples]
+    results = {
+        "import_main_ms": {
+            "median": round(statistics.median(seconds) * 1000, 1),
+            "min": round(min(seconds) * 1000, 1),
+            "max": round(max(seconds) * 1000, 1),
+        },
+        "peak_rss_mib": round(statistics.median(rss) / 1024, 1),
+        "slowest_imports_ms": slowest_imports(args.top),
+    }
+    print(f"import main: {results['import_main_ms']['median']:.1f} ms median, {results['peak_rss_mib']:.1f} MiB peak RSS")
+    if args.serve:
+        ready = [time_to_ready(args.port) for _ in range(max(1, args.runs // 5))]
+        results["time_to_ready_ms"] = round(statistics.median(ready) * 1000, 1)
+        print(f"uvicorn ready: {results['time_to_ready_ms']:.1f} ms median")
+    write_results("startup", results, args.output, runs=args.runs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+# Micro-benchmark for the /trends computation over synthetic histories.
+#
+#   python -m benchmarks.bench_trends
+#
+# The old implementation is quadratic, so it is only timed up to --legacy-max points.
+import argparse
+import datetime
+import random
+import time
+
+import analytics
+
+
+def make_records(points, seed=0):
+    rng = random.Random(seed)
+    start = datetime.date(2000, 1, 1)
+    records = []
+    day = 0
+    weight = 90.0
+    for _ in range(points):
+        day += 1 if rng.random() < 0.9 else rng.randint(2, 5)
+        weight += rng.uniform(-0.3, 0.25)
+        records.append({
+            "day": (start + datetime.timedelta(days=day)).toordinal(),
+            "weight": round(weight, 2),
+        })
+    return records
+
+
+def legacy_trends(measurements, height):
+    weights = [float(m["weight"]) for m in measurements]
+    dates = [datetime.date.fromordinal(m["day"]) for m in measurements]
+    avg_weight = sum(weights) / len(weights)
+    bmi = None
+    if height:
+        bmi = weights[-1] / ((float(height) / 100) ** 2)
+    if len(weights) > 1:
+        x = list(range(len(weights)))
+        slope = (sum((xi - sum(x)/len(x)) * (yi - avg_weight) for xi, yi in zip(x, weights)) /
+                 sum((xi - sum(x)/len(x))**2 for xi in x)) if sum((xi - sum(x)/len(x))**2 for xi in x) != 0 else 0
+    else:
+        slope = 0
+    sorted_dates = sorted(set(dates))
+    current_streak = 0
+    for i in range(len(sorted_dates) - 1):
+        if (sorted_dates[i+1] - sorted_dates[i]).days == 1:
+            current_streak += 1
+        else:
+            current_streak = 0
+    return avg_weight, bmi, slope, current_streak + 1
+
+
+def timeit(func, *args, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1000, 100000])
+    parser.add_argument("--legacy-max", type=int, default=5000)
+    args = parser.parse_args()
+
+    print(f"{'points':>8} {'legacy':>12} {'numpy':>12} {'numpy core':>12}")
+    for size in args.sizes:
+        records = make_records(size)
+        days, weights = analytics.arrays_from_records(records)
+        new = timeit(analytics.trends_from_records, records, 175)
+        core = timeit(analytics.compute_trends, days, weights, 175)
+        if size <= args.legacy_max:
+            legacy = f"{timeit(legacy_trends, records, 175) * 1000:10.3f}ms"
+        else:
+            legacy = "skipped"
+        print(f"{size:>8} {legacy:>12} {new * 1000:10.3f}ms {core * 1000:10.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+# Shared helpers for the benchmark scripts: latency percentiles and JSON
+# result files that carry enough context (commit, time, interpreter) to be
+# compared across runs with benchmarks.compare.
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+
+BENCH_PREFIX = "bench"
+BENCH_PASSWORD = "bench-password"
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def latency_summary(samples, elapsed):
+    if not samples:
+        return {"requests": 0, "throughput_rps": 0.0}
+    return {
+        "requests": len(samples),
+        "throughput_rps": round(len(samples) / elapsed, 1),
+        **{f"p{pct}_ms": round(percentile(samples, pct) * 1000, 3) for pct in (50, 95, 99)},
+        "max_ms": round(max(samples) * 1000, 3),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(name, results, output=None, **parameters):
+    document = {
+        "benchmark": name,
+        "commit": git_commit(),
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": parameters,
+        "results": results,
+    }
+    text = json.dumps(document, indent=2, default=str)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        print(f"Results written to {output}", file=sys.stderr)
+    else:
+        print(text)
+    return document
@@ -0,0 +1,58 @@
+# Compares two JSON result files from the same benchmark, e.g. runs of
+# benchmarks.load or benchmarks.micro on two commits.
+#
+#   python -m benchmarks.compare before.json after.json
+#
+# Lower is better for latencies and per-call times, higher for throughput.
+# Changes beyond --threshold percent are flagged, and --fail makes the exit
+# status non-zero when anything regressed.
+import argparse
+import json
+import sys
+
+HIGHER_IS_BETTER = ("throughput_rps", "calls_per_sec", "rows_per_sec")
+COMPARED = ("p50_ms", "p95_ms", "p99_ms", "per_call_us", "seconds", *HIGHER_IS_BETTER)
+
+
+def load(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def compare(before, after, threshold):
+    rows = []
+    for case, old in before["results"].items():
+        new = after["results"].get(case)
+        if not isinstance(old, dict) or not isinstance(new, dict):
+            continue
+        for metric in COMPARED:
+            if not old.get(metric) or metric not in new:
+                continue
+            change = (new[metric] - old[metric]) / old[metric] * 100
+            worse = -change if metric in HIGHER_IS_BETTER else change
+            verdict = "regressed" if worse > threshold else "improved" if worse < -threshold else ""
+            rows.append((case, metric, old[metric], new[metric], change, verdict))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=10.0, help="percent change worth flagging")
+    parser.add_argument("--fail", action="store_true", help="exit with status 1 on any regression")
+    args = parser.parse_args()
+
+    before, after = load(args.before), load(args.after)
+    if before["benchmark"] != after["benchmark"]:
+        raise SystemExit(f"Cannot compare {before['benchmark']} results with {after['benchmark']} results")
+    print(f"{before['benchmark']}: {before.get('commit')} -> {after.get('commit')}")
+    rows = compare(before, after, args.threshold)
+    for case, metric, old, new, change, verdict in rows:
+        print(f"{case:<22} {metric:<15} {old:>12} {new:>12} {change:+8.1f}%  {verdict}")
+    if args.fail and any(row[-1] == "regressed" for row in rows):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
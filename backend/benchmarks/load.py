@@ -0,0 +1,142 @@
+# HTTP load scenarios against a running server, reporting throughput and
+# p50/p95/p99 latency per endpoint as JSON. Seed the users first:
+#
+#   python -m benchmarks.seed --users 100 --days 730
+#   uvicorn main:app --port 8000 &
+#   python -m benchmarks.load --concurrency 16 --duration 10 --output before.json
+#   ... change something, restart the server ...
+#   python -m benchmarks.load --concurrency 16 --duration 10 --output after.json
+#   python -m benchmarks.compare before.json after.json
+#
+# Each scenario runs on its own for --duration seconds with --concurrency
+# clients cycling through the seeded users. The import and batch scenarios
+# write the same 30 recent dates every time, so after the first request they
+# exercise validation and the duplicate/unchanged checks without growing the
+# data set between runs.
+#
+# Every client logs in from the same address, so start the server with the
+# login and import rate limits disabled (RATE_LIMIT_LOGIN_IP= RATE_LIMIT_LOGIN_USER=
+# RATE_LIMIT_IMPORT_USER=) unless the 429s are what you want to measure.
+import argparse
+import asyncio
+import datetime
+import itertools
+import time
+
+import httpx
+
+from benchmarks.common import BENCH_PASSWORD, BENCH_PREFIX, latency_summary, write_results
+from benchmarks.seed import usernames
+
+
+def import_payload(rows=30):
+    end = datetime.date.today()
+    lines = ["Date,Weight,Notes"]
+    for offset in range(rows):
+        lines.append(f"{end - datetime.timedelta(days=offset)},{80 + offset / 10:.1f},load test")
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+IMPORT_PAYLOAD = import_payload()
+# The same readings as JSON for /measurements/batch
+BATCH_PAYLOAD = [
+    {"measurement_date": line.split(",")[0], "weight": float(line.split(",")[1])}
+    for line in IMPORT_PAYLOAD.decode("utf-8").splitlines()[1:]
+]
+
+SCENARIOS = {
+    "trends": lambda client, user: client.get("/trends", headers=user["headers"]),
+    "measurements": lambda client, user: client.get("/measurements", headers=user["headers"]),
+    "measurements_page": lambda client, user: client.get(
+        "/measurements", params={"limit": 50}, headers=user["headers"]
+    ),
+    "series": lambda client, user: client.get("/measurements/series", headers=user["headers"]),
+    "goals": lambda client, user: client.get("/goals", headers=user["headers"]),
+    "import": lambda client, user: client.post(
+        "/import", files={"file": ("load.csv", IMPORT_PAYLOAD, "text/csv")}, headers=user["headers"]
+    ),
+    "batch": lambda client, user: client.post("/measurements/batch", json=BATCH_PAYLOAD, headers=user["headers"]),
+    "login": lambda client, user: client.post("/auth/login", json=user["credentials"]),
+}
+
+
+async def log_in(client, names, password):
+    users = []
+    for name in names:
+        credentials = {"username": name, "password": password}
+        response = await client.post("/auth/login", json=credentials)
+        if response.status_code != 200:
+            raise SystemExit(f"Login failed for {name} ({response.status_code}); run benchmarks.seed first")
+        token = response.json()["access_token"]
+        users.append({"credentials": credentials, "headers": {"Authorization": f"Bearer {token}"}})
+    return users
+
+
+async def worker(client, request, users, deadline, samples, statuses):
+    while time.perf_counter() < deadline:
+        user = next(users)
+        start = time.perf_counter()
+        try:
+            response = await request(client, user)
+            status = response.status_code
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        elapsed = time.perf_counter() - start
+        statuses[status] = statuses.get(status, 0) + 1
+        if status == 200:
+            samples.append(elapsed)
+
+
+async def run_scenario(client, request, users, concurrency, duration):
+    samples = []
+    statuses = {}
+    cycle = itertools.cycle(users)
+    start = time.perf_counter()
+    deadline = start + duration
+    await asyncio.gather(*(
+        worker(client, request, cycle, deadline, samples, statuses) for _ in range(concurrency)
+    ))
+    elapsed = time.perf_counter() - start
+    return {**latency_summary(samples, elapsed), "statuses": {str(k): v for k, v in sorted(statuses.items(), key=str)}}
+
+
+async def run(args):
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=60) as client:
+        users = await log_in(client, usernames(args.prefix, args.users), args.password)
+        results = {}
+        for name in args.scenarios:
+            if args.warmup:
+                await run_scenario(client, SCENARIOS[name], users, args.concurrency, args.warmup)
+            results[name] = await run_scenario(client, SCENARIOS[name], users, args.concurrency, args.duration)
+            summary = results[name]
+            print(
+                f"{name:<18} {summary['requests']:7d} ok  {summary['throughput_rps']:9.1f} req/s  "
+                + "  ".join(f"p{pct}={summary.get(f'p{pct}_ms', 0):.1f}ms" for pct in (50, 95, 99)),
+                flush=True,
+            )
+    write_results(
+        "load", results, args.output,
+        base_url=args.base_url, users=args.users, concurrency=args.concurrency, duration=args.duration,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run HTTP load scenarios against a running server")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--users", type=int, default=20, help="seeded users to spread the load over")
+    parser.add_argument("--prefix", default=BENCH_PREFIX)
+    parser.add_argument("--password", default=BENCH_PASSWORD)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per scenario")
+    parser.add_argument("--warmup", type=float, default=1.0, help="unmeasured seconds before each scenario")
+    parser.add_argument(
+        "--scenarios", nargs="+", choices=list(SCENARIOS),
+        default=["trends", "measurements_page", "series", "goals", "import", "batch", "login"],
+    )
+    parser.add_argument("--output", help="write the JSON result here instead of stdout")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+# Measures /measurements latency on its own and again while a storm of logins
+# runs against the same server. With bcrypt on the event loop the storm drags
+# p99 up to several bcrypt rounds; with the hashing pool it should stay flat.
+#
+#   uvicorn main:app --port 8000 &
+#   python -m benchmarks.load_login_storm --base-url http://localhost:8000
+import argparse
+import asyncio
+import time
+import uuid
+
+import httpx
+
+from benchmarks.common import percentile
+
+
+def summary(samples):
+    return " ".join(f"p{pct}={percentile(samples, pct) * 1000:.1f}ms" for pct in (50, 95, 99))
+
+
+async def probe(client, headers, duration):
+    samples = []
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        response = await client.get("/measurements", headers=headers)
+        response.raise_for_status()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+async def login_loop(client, credentials, stop, counts):
+    while not stop.is_set():
+        response = await client.post("/auth/login", json=credentials)
+        counts[response.status_code] = counts.get(response.status_code, 0) + 1
+        if "Retry-After" in response.headers:
+            await asyncio.sleep(float(response.headers["Retry-After"]))
+
+
+async def run(args):
+    limits = httpx.Limits(max_connections=args.logins + 4)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=60) as client:
+        name = f"storm_{uuid.uuid4().hex[:10]}"
+        credentials = {"username": name, "password": "storm-password"}
+        response = await client.post("/auth/register", json={**credentials, "email": f"{name}@example.com"})
+        response.raise_for_status()
+        response = await client.post("/auth/login", json=credentials)
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        baseline = await probe(client, headers, args.duration)
+        print(f"baseline       {len(baseline):6d} requests  {summary(baseline)}")
+
+        stop = asyncio.Event()
+        counts = {}
+        storm = [asyncio.create_task(login_loop(client, credentials, stop, counts)) for _ in range(args.logins)]
+        await asyncio.sleep(0.5)
+        loaded = await probe(client, headers, args.duration)
+        stop.set()
+        await asyncio.gather(*storm)
+        print(f"login storm    {len(loaded):6d} requests  {summary(loaded)}")
+        print(f"login responses by status: {dict(sorted(counts.items()))}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--logins", type=int, default=32, help="concurrent login loops")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per phase")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+# Micro-benchmarks for the pure-Python pieces of the request path, no database
+# needed. Each case reports the best time per call over --repeat rounds.
+#
+#   python -m benchmarks.micro --output micro.json
+#   python -m benchmarks.micro --cases parse_row lttb_100k
+import argparse
+import asyncio
+import datetime
+import io
+import timeit
+
+from fastapi import UploadFile
+
+import analytics
+import exporter
+import importer
+import pagination
+import series
+from cache import TTLCache
+from benchmarks.bench_import import make_csv
+from benchmarks.bench_trends import make_records
+from benchmarks.common import write_results
+
+
+def csv_batches(content):
+    async def consume():
+        upload = UploadFile(file=io.BytesIO(content), filename="bench.csv")
+        async for _ in importer.iter_batches(upload):
+            pass
+    asyncio.run(consume())
+
+
+def export_chunks(rows):
+    async def source():
+        for row in rows:
+            yield row
+
+    async def consume():
+        async for _ in exporter.iter_chunks(source(), "csv"):
+            pass
+    asyncio.run(consume())
+
+
+def make_cases():
+    records_10k = make_records(10_000)
+    days_10k, weights_10k = analytics.arrays_from_records(records_10k)
+    records_100k = make_records(100_000)
+    days_100k, weights_100k = analytics.arrays_from_records(records_100k)
+    csv_10k = make_csv(10_000)
+    export_rows = [
+        {"measurement_date": datetime.date(2000, 1, 1) + datetime.timedelta(days=i), "weight": 80.5, "notes": "note"}
+        for i in range(10_000)
+    ]
+    cache = TTLCache(1024, 60)
+    cache.set("johndoe", {"id": 1})
+
+    return {
+        "parse_row": lambda: importer.parse_row(["2024-01-15", "75.5", "note"], (0, 1, 2), 1),
+        "import_parse_10k": lambda: csv_batches(csv_10k),
+        "export_csv_10k": lambda: export_chunks(export_rows),
+        "trends_records_10k": lambda: analytics.trends_from_records(records_10k, 175),
+        "trends_compute_100k": lambda: analytics.compute_trends(days_100k, weights_100k, 175),
+        "lttb_100k": lambda: series.lttb(days_100k, weights_100k, 500),
+        "downsample_10k": lambda: series.downsample(records_10k, 500),
+        "parse_cursor": lambda: pagination.parse_cursor("2024-01-15:12345", 0),
+        "cache_hit": lambda: cache.get("johndoe"),
+        "regression_slope_10k": lambda: analytics.regression_slope(days_10k, weights_10k),
+    }
+
+
+def measure(func, repeat):
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    best = min(timer.repeat(repeat=repeat, number=number)) / number
+    return {"per_call_us": round(best * 1e6, 3), "calls_per_sec": round(1 / best, 1), "loops": number}
+
+
+def main():
+    cases = make_cases()
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for pure-Python code paths")
+    parser.add_argument("--cases", nargs="+", choices=list(cases), default=list(cases))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="write the JSON result here instead of stdout")
+    args = parser.parse_args()
+
+    results = {}
+    for name in args.cases:
+        results[name] = measure(cases[name], args.repeat)
+        print(f"{name:<22} {results[name]['per_call_us']:14.3f} us/call", flush=True)
+    write_results("micro", results, args.output, repeat=args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# Throughput as the number of gunicorn workers grows. For each worker count a
+# fresh server is started on --port, the load scenarios run against it (see
+# benchmarks.load) and it is stopped again; the result lists requests/s and
+# latency per scenario plus the speedup over the first worker count.
+#
+#   python -m benchmarks.seed --users 100 --days 730
+#   python -m benchmarks.scaling --workers 1 2 4 --concurrency 32 --output scaling.json
+#
+# The scaling you see is bounded by the cores on the machine, which also runs
+# Postgres and the load generator; compare runs made on the same host.
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+from benchmarks import load
+from benchmarks.common import BENCH_PASSWORD, BENCH_PREFIX, write_results
+from benchmarks.seed import usernames
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def start_server(workers, port):
+    env = {**os.environ, "WEB_CONCURRENCY": str(workers), "BIND": f"127.0.0.1:{port}"}
+    return subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "main:app"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+
+async def wait_until_ready(base_url, timeout=30):
+    deadline = time.perf_counter() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.perf_counter() < deadline:
+            try:
+                if (await client.get("/health")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise SystemExit(f"Server at {base_url} did not come up within {timeout}s")
+
+
+async def measure(args, workers):
+    base_url = f"http://127.0.0.1:{args.port}"
+    server = start_server(workers, args.port)
+    try:
+        await wait_until_ready(base_url)
+        limits = httpx.Limits(max_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+            users = await load.log_in(client, usernames(args.prefix, args.users), args.password)
+            results = {}
+            for name in args.scenarios:
+                request = load.SCENARIOS[name]
+                if args.warmup:
+                    await load.run_scenario(client, request, users, args.concurrency, args.warmup)
+                results[name] = await load.run_scenario(client, request, users, args.concurrency, args.duration)
+                print(
+                    f"{workers:2d} worker(s)  {name:<18} {results[name]['throughput_rps']:9.1f} req/s  "
+                    f"p99={results[name].get('p99_ms', 0):.1f}ms",
+                    flush=True,
+                )
+            return results
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+async def run(args):
+    results = {}
+    for workers in args.workers:
+        results[str(workers)] = await measure(args, workers)
+    baseline = results[str(args.workers[0])]
+    for scenarios in results.values():
+        for name, summary in scenarios.items():
+            base = baseline[name]["throughput_rps"]
+            summary["speedup"] = round(summary["throughput_rps"] / base, 2) if base else None
+    write_results(
+        "scaling", results, args.output,
+        workers=args.workers, cpus=os.cpu_count(), users=args.users,
+        concurrency=args.concurrency, duration=args.duration,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure throughput for increasing gunicorn worker counts")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--prefix", default=BENCH_PREFIX)
+    parser.add_argument("--password", default=BENCH_PASSWORD)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per scenario")
+    parser.add_argument("--warmup", type=float, default=1.0)
+    parser.add_argument("--scenarios", nargs="+", choices=list(load.SCENARIOS), default=["trends", "series", "goals"])
+    parser.add_argument("--output", help="write the JSON result here instead of stdout")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
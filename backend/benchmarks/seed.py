@@ -0,0 +1,127 @@
+# Seeds a local database with N users x M days of measurements for the load
+# scenarios. Users are named <prefix>_00000, <prefix>_00001, ... and share one
+# password; existing users with the prefix are removed first, so a run always
+# starts from the same data for a given --seed.
+#
+#   docker compose up -d db
+#   python -m benchmarks.seed --users 100 --days 730
+#   python -m benchmarks.seed --reset-only
+import argparse
+import asyncio
+import datetime
+import random
+import time
+from decimal import Decimal
+
+from database import database
+from passwords import password_context
+from benchmarks.common import BENCH_PASSWORD, BENCH_PREFIX, write_results
+
+COPY_BATCH_ROWS = 50_000
+
+USERS_QUERY = "SELECT id FROM users WHERE username LIKE $1"
+
+
+def username_pattern(prefix):
+    return prefix.replace("_", "\\_") + "\\_%"
+
+
+def usernames(prefix, count):
+    return [f"{prefix}_{i:05d}" for i in range(count)]
+
+
+def generate_measurements(user_id, days, end, rng):
+    # A noisy downward walk with the odd skipped day
+    weight = rng.uniform(60, 110)
+    drift = rng.uniform(-0.05, 0.01)
+    start = end - datetime.timedelta(days=days - 1)
+    for offset in range(days):
+        weight = min(max(weight + drift + rng.gauss(0, 0.3), 40), 200)
+        if rng.random() < 0.05:
+            continue
+        yield (user_id, start + datetime.timedelta(days=offset), Decimal(f"{weight:.2f}"), "")
+
+
+async def reset(connection, prefix):
+    pattern = username_pattern(prefix)
+    async with connection.transaction():
+        await connection.execute(f"DELETE FROM goals WHERE user_id IN ({USERS_QUERY})", pattern)
+        await connection.execute(f"DELETE FROM weight_measurements WHERE user_id IN ({USERS_QUERY})", pattern)
+        status = await connection.execute("DELETE FROM users WHERE username LIKE $1", pattern)
+    return int(status.split()[-1])
+
+
+async def seed(connection, users, days, prefix, password, rng_seed):
+    password_hash = password_context().hash(password)
+    names = usernames(prefix, users)
+    rows = await connection.fetch(
+        """
+        INSERT INTO users (username, password_hash, email, height, age)
+        SELECT name, $2, name || '@example.com', 150 + random() * 50, 18 + (random() * 60)::int
+        FROM unnest($1::text[]) AS name
+        RETURNING id
+        """,
+        names, password_hash,
+    )
+    end = datetime.date.today()
+    batch = []
+    inserted = 0
+    for index, row in enumerate(rows):
+        rng = random.Random(rng_seed * 1_000_003 + index)
+        batch.extend(generate_measurements(row["id"], days, end, rng))
+        if len(batch) >= COPY_BATCH_ROWS or index == len(rows) - 1:
+            await connection.copy_records_to_table(
+                "weight_measurements",
+                records=batch,
+                columns=["user_id", "measurement_date", "weight", "notes"],
+            )
+            inserted += len(batch)
+            batch = []
+    await connection.execute(
+        """
+        INSERT INTO goals (user_id, target_weight, target_date, start_weight)
+        SELECT id, 70, CURRENT_DATE + 90, 85 FROM unnest($1::int[]) AS id
+        """,
+        [row["id"] for row in rows],
+    )
+    await connection.execute("ANALYZE users, weight_measurements, goals")
+    return inserted
+
+
+async def run(args):
+    await database.connect()
+    try:
+        async with database.acquire() as connection:
+            removed = await reset(connection, args.prefix)
+            print(f"Removed {removed} existing {args.prefix}_* user(s)")
+            if args.reset_only:
+                return
+            start = time.perf_counter()
+            inserted = await seed(connection, args.users, args.days, args.prefix, args.password, args.seed)
+            elapsed = time.perf_counter() - start
+    finally:
+        await database.disconnect()
+    print(f"Seeded {args.users} users with {inserted} measurements in {elapsed:.1f}s")
+    write_results(
+        "seed",
+        {"users": args.users, "measurements": inserted, "seconds": round(elapsed, 3),
+         "rows_per_sec": round(inserted / elapsed, 1) if elapsed else None},
+        args.output,
+        users=args.users, days=args.days, seed=args.seed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed benchmark users and measurements")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--days", type=int, default=365, help="daily measurements per user (about 5%% are skipped)")
+    parser.add_argument("--prefix", default=BENCH_PREFIX)
+    parser.add_argument("--password", default=BENCH_PASSWORD)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--reset-only", action="store_true", help="only remove previously seeded users")
+    parser.add_argument("--output", help="write the JSON result here instead of stdout")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
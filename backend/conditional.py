@@ -0,0 +1,48 @@
+import hashlib
+
+from fastapi import Depends, HTTPException, Request
+
+from auth import get_current_user
+from database import get_connection
+
+# Conditional GETs for polled read endpoints. The ETag combines the user's
+# data_version (bumped by triggers on every write, see migrations/0005) with a
+# digest of the request path and query, since each parameter combination is
+# its own representation. A matching If-None-Match costs one primary-key
+# lookup and returns 304 before the handler queries or serializes anything.
+
+VERSION_QUERY = "SELECT data_version FROM users WHERE id = $1"
+
+# Browsers keep the response but revalidate on every poll
+CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(user_id, version, request):
+    representation = f"{request.url.path}?{request.url.query}".encode("utf-8")
+    digest = hashlib.blake2b(representation, digest_size=8).hexdigest()
+    return f'"{user_id}-{version}-{digest}"'
+
+
+def etag_matches(header, etag):
+    # If-None-Match uses the weak comparison, so a W/ prefix is ignored
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(candidate.strip().removeprefix("W/") == etag for candidate in header.split(","))
+
+
+async def data_etag(
+    request: Request,
+    current_user: dict = Depends(get_current_user),
+    connection=Depends(get_connection),
+):
+    version = await connection.fetchval(VERSION_QUERY, current_user["id"])
+    etag = make_etag(current_user["id"], version, request)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        raise HTTPException(status_code=304, headers=cache_headers(etag))
+    return etag
+
+
+def cache_headers(etag):
+    return {"ETag": etag, "Cache-Control": CACHE_CONTROL}
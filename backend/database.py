@@ -1,6 +1,10 @@
 import asyncio
 import os
-from asyncpg import create_pool
+import time
+from contextlib import asynccontextmanager
+from asyncpg import InterfaceError, PostgresError, create_pool
+from fastapi import HTTPException, Request
+from queries import RegisteredConnection
 
 # Database connection settings
 DB_HOST = os.getenv("DB_HOST", "localhost")
@@ -9,29 +13,342 @@ DB_USER = os.getenv("DB_USER", "myuser")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "mypassword")
 DB_PORT = int(os.getenv("DB_PORT", "5432"))
 
+# Pool settings. Each request holds at most one connection (see get_connection),
+# so DB_POOL_MAX_SIZE is also the number of requests that can query at once;
+# keep it times the number of workers below the server's max_connections.
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+DB_COMMAND_TIMEOUT = float(os.getenv("DB_COMMAND_TIMEOUT", "30"))
+DB_MAX_INACTIVE_LIFETIME = float(os.getenv("DB_MAX_INACTIVE_LIFETIME", "300"))
+DB_ACQUIRE_TIMEOUT = float(os.getenv("DB_ACQUIRE_TIMEOUT", "10"))
+# Startup: keep retrying for up to DB_CONNECT_TIMEOUT seconds, starting with
+# short delays so a worker is ready as soon as Postgres accepts connections,
+# then open DB_POOL_WARMUP connections before serving so the first burst of
+# requests does not wait on connection setup.
+DB_CONNECT_TIMEOUT = float(os.getenv("DB_CONNECT_TIMEOUT", "30"))
+DB_CONNECT_RETRY_MAX_DELAY = float(os.getenv("DB_CONNECT_RETRY_MAX_DELAY", "2"))
+DB_POOL_WARMUP = int(os.getenv("DB_POOL_WARMUP", str(DB_POOL_MIN_SIZE)))
+
+# Read replicas, as comma-separated host[:port] with the same database name and
+# credentials; each gets a pool sized like the primary's. Handlers marked with
+# replica_read query a healthy replica, except for users who wrote in the last
+# DB_REPLICA_STICKY_SECONDS, who keep reading from the primary so they see
+# their own writes. A replica further behind than DB_REPLICA_MAX_LAG seconds,
+# or unreachable, gets no reads until a later health check finds it caught up.
+DB_REPLICA_HOSTS = [host.strip() for host in os.getenv("DB_REPLICA_HOSTS", "").split(",") if host.strip()]
+DB_REPLICA_STICKY_SECONDS = float(os.getenv("DB_REPLICA_STICKY_SECONDS", "5"))
+DB_REPLICA_MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", str(DB_REPLICA_STICKY_SECONDS)))
+DB_REPLICA_CHECK_INTERVAL = float(os.getenv("DB_REPLICA_CHECK_INTERVAL", "5"))
+
+# Seconds the replica is behind; 0 when it has replayed everything received
+# (an idle primary sends nothing, so the replay timestamp alone would grow)
+# and for a server that is not in recovery, such as a stand-in copy
+REPLICA_LAG_QUERY = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE coalesce(extract(epoch FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END::float8
+"""
+
+
+class Replica:
+    def __init__(self, address):
+        host, _, port = address.partition(":")
+        self.host = host
+        self.port = int(port) if port else DB_PORT
+        self.pool = None
+        self.healthy = False
+        self.lag = None
+        self.acquired = 0
+        self.failures = 0
+
+    @property
+    def name(self):
+        return f"{self.host}:{self.port}"
+
+    def stats(self):
+        return {
+            "host": self.name,
+            "healthy": self.healthy,
+            "lag_seconds": self.lag,
+            "size": self.pool.get_size() if self.pool is not None else 0,
+            "free": self.pool.get_idle_size() if self.pool is not None else 0,
+            "acquired": self.acquired,
+            "failures": self.failures,
+        }
+
 class Database:
-    def __init__(self):
+    def __init__(self, replica_hosts=None, clock=time.monotonic):
         self.pool = None
+        self.replicas = [Replica(address) for address in (DB_REPLICA_HOSTS if replica_hosts is None else replica_hosts)]
+        self.clock = clock
+        # Request -> sticky key (the user), set by the app; see get_connection
+        self.session_key = None
+        # Sticky key -> time until which its reads stay on the primary
+        self.recent_writes = {}
+        self.all_writes_until = 0.0
+        self.replica_connections = {}
+        self.next_replica = 0
+        self.replica_fallbacks = 0
+        self._check_task = None
+        self.acquire_count = 0
+        self.acquire_timeouts = 0
+        self.acquire_wait_total = 0.0
+        self.acquire_wait_max = 0.0
+        self.waiting = 0
+        # Callbacks passed to Connection.add_query_logger on every new connection
+        self.query_loggers = []
 
     async def connect(self):
-        retry_attempts = 5
-        for attempt in range(1, retry_attempts + 1):
+        deadline = time.monotonic() + DB_CONNECT_TIMEOUT
+        delay = 0.1
+        while True:
             try:
-                self.pool = await create_pool(
-                    host=DB_HOST,
-                    database=DB_NAME,
-                    user=DB_USER,
-                    password=DB_PASSWORD,
-                    port=DB_PORT,
-                )
-                return
-            except Exception:
-                if attempt == retry_attempts:
+                self.pool = await self.create_pool(DB_HOST, DB_PORT)
+                break
+            except Exception as e:
+                if time.monotonic() + delay > deadline:
                     raise
-                await asyncio.sleep(2)
+                print(f"Database not ready ({e}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, DB_CONNECT_RETRY_MAX_DELAY)
+        await self.warm_up(DB_POOL_WARMUP)
+        if self.replicas:
+            # An unreachable replica does not hold up startup; the periodic
+            # check keeps trying and reads go to the primary meanwhile
+            await self.check_replicas()
+            self._check_task = asyncio.get_running_loop().create_task(self.check_replicas_periodically())
+
+    def create_pool(self, host, port, **kwargs):
+        return create_pool(
+            host=host,
+            database=DB_NAME,
+            user=DB_USER,
+            password=DB_PASSWORD,
+            port=port,
+            min_size=DB_POOL_MIN_SIZE,
+            max_size=DB_POOL_MAX_SIZE,
+            statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+            command_timeout=DB_COMMAND_TIMEOUT or None,
+            max_inactive_connection_lifetime=DB_MAX_INACTIVE_LIFETIME,
+            init=self.init_connection,
+            connection_class=RegisteredConnection,
+            **kwargs,
+        )
+
+    async def check_replica(self, replica):
+        try:
+            if replica.pool is None:
+                # Read-only like a hot standby, so a write routed here by
+                # mistake fails even against a stand-in copy of the primary
+                replica.pool = await self.create_pool(
+                    replica.host, replica.port,
+                    timeout=DB_REPLICA_CHECK_INTERVAL,
+                    server_settings={"default_transaction_read_only": "on"},
+                )
+            async with replica.pool.acquire(timeout=DB_REPLICA_CHECK_INTERVAL) as connection:
+                replica.lag = await connection.fetchval(REPLICA_LAG_QUERY, timeout=DB_REPLICA_CHECK_INTERVAL)
+            healthy = replica.lag <= DB_REPLICA_MAX_LAG
+            reason = f"{replica.lag:.1f}s behind"
+        except (OSError, PostgresError, InterfaceError, asyncio.TimeoutError) as e:
+            replica.lag = None
+            healthy = False
+            reason = str(e) or type(e).__name__
+        if healthy != replica.healthy:
+            print(f"Replica {replica.name} {'in rotation' if healthy else 'taken out of rotation'} ({reason})")
+        replica.healthy = healthy
+
+    async def check_replicas(self):
+        await asyncio.gather(*(self.check_replica(replica) for replica in self.replicas))
+
+    async def check_replicas_periodically(self):
+        while True:
+            await asyncio.sleep(DB_REPLICA_CHECK_INTERVAL)
+            await self.check_replicas()
+
+    async def warm_up(self, size):
+        # min_size connections are already open; holding `size` at once makes
+        # the pool open the rest, and a round-trip on each checks it is usable
+        size = min(size, DB_POOL_MAX_SIZE)
+        if size <= 0:
+            return
+        acquired = await asyncio.gather(*(self.pool.acquire() for _ in range(size)), return_exceptions=True)
+        connections = [c for c in acquired if not isinstance(c, BaseException)]
+        try:
+            for result in acquired:
+                if isinstance(result, BaseException):
+                    raise result
+            await asyncio.gather(*(connection.execute("SELECT 1") for connection in connections))
+        finally:
+            await asyncio.gather(*(self.pool.release(connection) for connection in connections))
+
+    async def init_connection(self, connection):
+        for callback in self.query_loggers:
+            connection.add_query_logger(callback)
+        # Registered statements are prepared into the statement cache, so
+        # there is nothing to keep them in when it is disabled
+        if DB_STATEMENT_CACHE_SIZE:
+            await connection.prepare_registered()
 
     async def disconnect(self):
+        if self._check_task is not None:
+            self._check_task.cancel()
+            self._check_task = None
+        for replica in self.replicas:
+            if replica.pool is not None:
+                await replica.pool.close()
+                replica.pool = None
+            replica.healthy = False
         if self.pool:
             await self.pool.close()
 
+    def mark_written(self, key):
+        if not self.replicas or key is None:
+            return
+        now = self.clock()
+        if len(self.recent_writes) > 10_000:
+            self.recent_writes = {k: until for k, until in self.recent_writes.items() if until > now}
+        self.recent_writes[key] = now + DB_REPLICA_STICKY_SECONDS
+
+    def note_change(self, change):
+        # invalidation.py subscriber: a write in any worker keeps that user's
+        # reads on the primary here too
+        self.mark_written(change.get("username"))
+
+    def forget_writes(self):
+        # invalidation.py reset: changes may have been missed, so every user
+        # reads from the primary for one sticky window
+        self.all_writes_until = self.clock() + DB_REPLICA_STICKY_SECONDS
+
+    def wrote_recently(self, key):
+        now = self.clock()
+        return now < self.all_writes_until or self.recent_writes.get(key, 0.0) > now
+
+    def pick_replica(self, key):
+        if self.wrote_recently(key):
+            return None
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            return None
+        self.next_replica += 1
+        return healthy[self.next_replica % len(healthy)]
+
+    async def acquire_replica(self, replica, timeout):
+        try:
+            connection = await replica.pool.acquire(timeout=timeout)
+        except asyncio.TimeoutError:
+            # Busy, not broken; TimeoutError is an OSError, so this comes first
+            return None
+        except (OSError, PostgresError, InterfaceError) as e:
+            # Until the next check finds it reachable again
+            replica.healthy = False
+            replica.failures += 1
+            print(f"Replica {replica.name} taken out of rotation ({e})")
+            return None
+        replica.acquired += 1
+        self.replica_connections[connection] = replica
+        return connection
+
+    async def acquire_connection(self, timeout=DB_ACQUIRE_TIMEOUT, read_only=False, key=None):
+        # pool.acquire() with the time spent queueing for a free connection
+        # recorded; read_only connections come from a replica when one is
+        # healthy and the key (user) has not written recently. A busy replica
+        # gets half of timeout, and the primary what is left, so the fallback
+        # stays within one timeout.
+        start = time.perf_counter()
+        self.waiting += 1
+        try:
+            connection = None
+            replica = self.pick_replica(key) if read_only and self.replicas else None
+            if replica is not None:
+                connection = await self.acquire_replica(replica, timeout / 2 if timeout else None)
+                if connection is None:
+                    self.replica_fallbacks += 1
+            if connection is None:
+                remaining = None
+                if timeout:
+                    remaining = timeout - (time.perf_counter() - start)
+                    if remaining <= 0:
+                        raise asyncio.TimeoutError()
+                connection = await self.pool.acquire(timeout=remaining)
+        except asyncio.TimeoutError:
+            self.acquire_timeouts += 1
+            raise
+        finally:
+            self.waiting -= 1
+        wait = time.perf_counter() - start
+        self.acquire_count += 1
+        self.acquire_wait_total += wait
+        self.acquire_wait_max = max(self.acquire_wait_max, wait)
+        return connection
+
+    async def release(self, connection):
+        replica = self.replica_connections.pop(connection, None)
+        await (replica.pool if replica is not None else self.pool).release(connection)
+
+    @asynccontextmanager
+    async def acquire(self, timeout=DB_ACQUIRE_TIMEOUT, read_only=False, key=None):
+        connection = await self.acquire_connection(timeout, read_only, key)
+        try:
+            yield connection
+        finally:
+            await self.release(connection)
+
+    def stats(self):
+        stats = {
+            "size": 0,
+            "free": 0,
+            "min_size": DB_POOL_MIN_SIZE,
+            "max_size": DB_POOL_MAX_SIZE,
+            "waiting": self.waiting,
+            "acquired": self.acquire_count,
+            "acquire_timeouts": self.acquire_timeouts,
+            "acquire_wait_avg_ms": round(1000 * self.acquire_wait_total / self.acquire_count, 3) if self.acquire_count else 0.0,
+            "acquire_wait_max_ms": round(1000 * self.acquire_wait_max, 3),
+        }
+        if self.pool is not None:
+            stats["size"] = self.pool.get_size()
+            stats["free"] = self.pool.get_idle_size()
+        if self.replicas:
+            stats["replicas"] = [replica.stats() for replica in self.replicas]
+            stats["replica_fallbacks"] = self.replica_fallbacks
+            stats["sticky_users"] = sum(1 for until in self.recent_writes.values() if until > self.clock())
+        return stats
+
 database = Database()
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+def replica_read(endpoint=None, *, when=None):
+    # Marks a handler that only reads, so get_connection may give it (and the
+    # user lookup in get_current_user) a replica connection. when(request)
+    # limits that to some requests, for a handler that also writes.
+    if endpoint is None:
+        return lambda endpoint: replica_read(endpoint, when=when)
+    endpoint.replica_read = when or True
+    return endpoint
+
+async def get_connection(request: Request):
+    # Request-scoped connection: FastAPI caches dependencies per request, so
+    # get_current_user and the handler receive the same connection and a
+    # request never holds two.
+    replica = getattr(request.scope.get("endpoint"), "replica_read", False)
+    read_only = request.method in SAFE_METHODS and (replica(request) if callable(replica) else replica)
+    key = database.session_key(request) if database.replicas and database.session_key else None
+    try:
+        connection = await database.acquire_connection(read_only=read_only, key=key)
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=503,
+            detail="Database is busy, please retry",
+            headers={"Retry-After": "1"},
+        )
+    try:
+        yield connection
+    finally:
+        await database.release(connection)
+        if request.method not in SAFE_METHODS:
+            # Also announced through invalidation.py, but this worker may
+            # serve the user's next read before that notification arrives
+            database.mark_written(key)
@@ -0,0 +1,88 @@
+import csv
+import io
+import json
+import os
+
+# Streaming export: rows come off a server-side cursor inside a read-only
+# transaction and are written out in chunks of roughly EXPORT_CHUNK_SIZE bytes,
+# so memory stays bounded no matter how long the user's history is.
+
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", str(64 * 1024)))
+EXPORT_PREFETCH = int(os.getenv("EXPORT_PREFETCH", "1000"))
+
+FORMATS = {
+    "csv": ("text/csv", "weight_measurements.csv"),
+    "ndjson": ("application/x-ndjson", "weight_measurements.ndjson"),
+}
+
+EXPORT_QUERY = """
+    SELECT measurement_date, weight, notes
+    FROM weight_measurements
+    WHERE user_id = $1
+      AND ($2::date IS NULL OR measurement_date >= $2)
+      AND ($3::date IS NULL OR measurement_date <= $3)
+    ORDER BY measurement_date
+"""
+
+CSV_HEADER = ["Date", "Weight", "Notes"]
+
+
+def write_csv_row(writer, row):
+    writer.writerow([row["measurement_date"], row["weight"], row["notes"]])
+
+
+def write_ndjson_row(output, row):
+    output.write(json.dumps({
+        "measurement_date": row["measurement_date"].isoformat(),
+        "weight": float(row["weight"]),
+        "notes": row["notes"],
+    }))
+    output.write("\n")
+
+
+async def iter_rows(connection, user_id, date_from=None, date_to=None, readonly=True):
+    async with connection.transaction(readonly=readonly):
+        async for row in connection.cursor(
+            EXPORT_QUERY, user_id, date_from, date_to, prefetch=EXPORT_PREFETCH
+        ):
+            yield row
+
+
+async def iter_chunks(rows, fmt="csv", chunk_size=EXPORT_CHUNK_SIZE):
+    output = io.StringIO()
+    if fmt == "csv":
+        writer = csv.writer(output)
+        writer.writerow(CSV_HEADER)
+
+        def write(row):
+            write_csv_row(writer, row)
+    else:
+        def write(row):
+            write_ndjson_row(output, row)
+
+    async for row in rows:
+        write(row)
+        if output.tell() >= chunk_size:
+            yield output.getvalue()
+            output.seek(0)
+            output.truncate()
+    if output.tell():
+        yield output.getvalue()
+
+
+async def stream_export(connection, user_id, fmt="csv", date_from=None, date_to=None):
+    # Runs on the request's connection while the body is sent: FastAPI (since
+    # 0.118) releases dependencies with yield only after the response, so a
+    # streamed export holds one pooled connection like any other request
+    async for chunk in iter_chunks(iter_rows(connection, user_id, date_from, date_to), fmt):
+        yield chunk
+
+
+async def export_legacy_csv(connection, user_id, date_from=None, date_to=None):
+    rows = await connection.fetch(EXPORT_QUERY, user_id, date_from, date_to)
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(CSV_HEADER)
+    for row in rows:
+        write_csv_row(writer, row)
+    return output.getvalue()
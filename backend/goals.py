@@ -1,42 +1,96 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query
+from typing import Annotated, Optional
 from models import GoalCreate, GoalResponse
-from database import database
+from database import get_connection, replica_read
+from responses import JSONResponse
 from auth import get_current_user
+import conditional
 import datetime
+import os
 
 router = APIRouter()
 
+# include=progress: the latest reading and the regression slope over the last
+# GOAL_SLOPE_DAYS days come from two LATERAL lookups on the (user_id,
+# measurement_date) index, so the cost does not grow with the history. The
+# projection extends that slope from the latest reading to the target weight.
+GOAL_SLOPE_DAYS = int(os.getenv("GOAL_SLOPE_DAYS", "30"))
+GOAL_PROJECTION_MAX_DAYS = int(os.getenv("GOAL_PROJECTION_MAX_DAYS", "3650"))
+
+GOAL_PROGRESS_QUERY = """
+    SELECT id, target_weight, target_date, start_weight, current_weight, latest_date,
+           round(slope::numeric, 4)::float8 AS slope,
+           -- greatest() and least() skip NULLs, so no readings is handled first
+           CASE WHEN current_weight IS NULL THEN NULL
+                WHEN start_weight = target_weight THEN 100.0
+                ELSE round(100 * least(greatest(
+                    (start_weight - current_weight) / (start_weight - target_weight), 0), 1)::numeric, 1)::float8
+           END AS percent_complete,
+           CASE WHEN remaining < 0 THEN 0 ELSE round(remaining::numeric, 2)::float8 END AS kg_remaining,
+           remaining <= 0 AS reached,
+           CASE WHEN remaining > 0
+                 AND slope * (target_weight - current_weight) > 0
+                 AND (target_weight - current_weight) / slope <= $3
+                THEN latest_date + ceil(round(((target_weight - current_weight) / slope)::numeric, 6))::integer
+           END AS estimated_date
+    FROM (
+        SELECT g.id, g.target_weight::float8 AS target_weight, g.target_date, g.start_weight::float8 AS start_weight,
+               latest.weight AS current_weight, latest.measurement_date AS latest_date, recent.slope,
+               -- kg still to go in the goal's direction; <= 0 once it is reached
+               (latest.weight - g.target_weight::float8) * sign(g.start_weight - g.target_weight) AS remaining
+        FROM goals g
+        LEFT JOIN LATERAL (
+            SELECT measurement_date, weight::float8 AS weight
+            FROM weight_measurements
+            WHERE user_id = g.user_id
+            ORDER BY measurement_date DESC
+            LIMIT 1
+        ) latest ON true
+        LEFT JOIN LATERAL (
+            SELECT regr_slope(weight::float8, (measurement_date - latest.measurement_date)::float8) AS slope
+            FROM weight_measurements
+            WHERE user_id = g.user_id
+              AND measurement_date > latest.measurement_date - $2::integer
+        ) recent ON true
+        WHERE g.user_id = $1
+    ) p
+    ORDER BY target_date DESC
+"""
+
+CREATE_GOAL_QUERY = """
+    INSERT INTO goals (user_id, target_weight, target_date, start_weight)
+    VALUES ($1, $2, $3, $4)
+    RETURNING id, target_weight::float8, target_date::text, start_weight::float8
+"""
+GOALS_QUERY = """
+    SELECT id, target_weight::float8 AS target_weight, target_date, start_weight::float8 AS start_weight
+    FROM goals
+    WHERE user_id = $1
+    ORDER BY target_date DESC
+"""
+
 @router.post("/goals", response_model=GoalResponse)
-async def create_goal(goal: GoalCreate, current_user: dict = Depends(get_current_user)):
+async def create_goal(goal: GoalCreate, current_user: dict = Depends(get_current_user), connection=Depends(get_connection)):
     try:
         target_date = datetime.datetime.strptime(goal.target_date, "%Y-%m-%d").date()
-        query = """
-            INSERT INTO goals (user_id, target_weight, target_date, start_weight)
-            VALUES ($1, $2, $3, $4)
-            RETURNING id, target_weight, target_date, start_weight
-        """
-        async with database.pool.acquire() as connection:
-            row = await connection.fetchrow(query, current_user["id"], goal.target_weight, target_date, goal.start_weight)
-        return {
-            "id": row["id"],
-            "target_weight": float(row["target_weight"]),
-            "target_date": row["target_date"].isoformat(),
-            "start_weight": float(row["start_weight"])
-        }
+        row = await connection.fetchrow(CREATE_GOAL_QUERY, current_user["id"], goal.target_weight, target_date, goal.start_weight)
+        return dict(row)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Goal creation failed: {e}")
 
 @router.get("/goals")
-async def get_goals(current_user: dict = Depends(get_current_user)):
-    query = "SELECT id, target_weight, target_date, start_weight FROM goals WHERE user_id = $1 ORDER BY target_date DESC"
-    async with database.pool.acquire() as connection:
-        rows = await connection.fetch(query, current_user["id"])
-    goals = []
-    for row in rows:
-        goals.append({
-            "id": row["id"],
-            "target_weight": float(row["target_weight"]),
-            "target_date": row["target_date"].isoformat(),
-            "start_weight": float(row["start_weight"])
-        })
-    return {"goals": goals}
\ No newline at end of file
+@replica_read
+async def get_goals(
+    include: Annotated[Optional[str], Query(pattern="^progress$")] = None,
+    current_user: dict = Depends(get_current_user),
+    connection=Depends(get_connection),
+    etag: str = Depends(conditional.data_etag),
+):
+    if include == "progress":
+        rows = await connection.fetch(
+            GOAL_PROGRESS_QUERY, current_user["id"], GOAL_SLOPE_DAYS, GOAL_PROJECTION_MAX_DAYS
+        )
+        return JSONResponse({"goals": rows}, headers=conditional.cache_headers(etag))
+
+    rows = await connection.fetch(GOALS_QUERY, current_user["id"])
+    return JSONResponse({"goals": rows}, headers=conditional.cache_headers(etag))
@@ -0,0 +1,36 @@
+# Multi-process serving, one uvicorn worker per core:
+#
+#   gunicorn -c gunicorn.conf.py main:app
+#
+# Every worker runs the app lifespan, so each has its own Database pool and
+# caches. The caches are kept coherent through invalidation.py, and the
+# workers x DB_POOL_MAX_SIZE connections must stay below the server's
+# max_connections (each worker also holds one of its pool's connections for
+# LISTEN). Migrations are safe to run from every worker at once.
+import glob
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+worker_class = "uvicorn.workers.UvicornWorker"
+keepalive = int(os.getenv("KEEPALIVE", "5"))
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+
+# With PROMETHEUS_MULTIPROC_DIR set, workers write their metrics to files in
+# that directory and /metrics adds them up (see metrics.py). Files left by a
+# previous run or by dead workers would be counted too.
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+
+def on_starting(server):
+    if PROMETHEUS_MULTIPROC_DIR:
+        os.makedirs(PROMETHEUS_MULTIPROC_DIR, exist_ok=True)
+        for path in glob.glob(os.path.join(PROMETHEUS_MULTIPROC_DIR, "*.db")):
+            os.remove(path)
+
+
+def child_exit(server, worker):
+    if PROMETHEUS_MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
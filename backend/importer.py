@@ -0,0 +1,186 @@
+import codecs
+import csv
+import datetime
+import os
+from decimal import Decimal, InvalidOperation
+
+# Streaming CSV import: the upload is decoded and parsed chunk by chunk, rows are
+# validated in batches and COPYed into a temporary staging table, and a single
+# INSERT ... SELECT moves the new dates into weight_measurements. Everything runs
+# inside one transaction so a failed import leaves no partial data behind.
+
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", str(64 * 1024)))
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "5000"))
+
+MAX_WEIGHT = Decimal("999.99")  # weight is NUMERIC(5, 2)
+WEIGHT_QUANTUM = Decimal("0.01")
+
+STAGING_TABLE = "import_staging"
+STAGING_COLUMNS = ["seq", "measurement_date", "weight", "notes"]
+
+CREATE_STAGING_QUERY = f"""
+    CREATE TEMP TABLE {STAGING_TABLE} (
+        seq INTEGER NOT NULL,
+        measurement_date DATE NOT NULL,
+        weight NUMERIC(5, 2) NOT NULL,
+        notes TEXT
+    ) ON COMMIT DROP
+"""
+
+# Keep the first row of the file for each date and skip dates the user already has.
+MERGE_STAGING_QUERY = f"""
+    INSERT INTO weight_measurements (user_id, measurement_date, weight, notes)
+    SELECT $1, s.measurement_date, s.weight, s.notes
+    FROM (
+        SELECT DISTINCT ON (measurement_date) measurement_date, weight, notes
+        FROM {STAGING_TABLE}
+        ORDER BY measurement_date, seq
+    ) s
+    WHERE NOT EXISTS (
+        SELECT 1 FROM weight_measurements w
+        WHERE w.user_id = $1 AND w.measurement_date = s.measurement_date
+    )
+    ON CONFLICT DO NOTHING
+"""
+
+
+class CSVFormatError(ValueError):
+    pass
+
+
+def resolve_columns(header):
+    names = [name.strip().lower() for name in header]
+    try:
+        date_idx = names.index("date")
+        weight_idx = names.index("weight")
+    except ValueError:
+        raise CSVFormatError("header must contain Date and Weight columns")
+    notes_idx = names.index("notes") if "notes" in names else None
+    return date_idx, weight_idx, notes_idx
+
+
+def parse_row(fields, columns, seq):
+    date_idx, weight_idx, notes_idx = columns
+    try:
+        date_text = fields[date_idx].strip()
+        weight_text = fields[weight_idx].strip()
+    except IndexError:
+        return None
+    # fromisoformat also accepts forms like 20240101; only take YYYY-MM-DD
+    if len(date_text) != 10:
+        return None
+    try:
+        measurement_date = datetime.date.fromisoformat(date_text)
+        weight = Decimal(weight_text)
+        if not weight.is_finite():
+            return None
+        weight = weight.quantize(WEIGHT_QUANTUM)
+    except (ValueError, InvalidOperation):
+        return None
+    if not 0 < weight <= MAX_WEIGHT:
+        return None
+    notes = ""
+    if notes_idx is not None and notes_idx < len(fields):
+        notes = fields[notes_idx]
+    return (seq, measurement_date, weight, notes)
+
+
+async def iter_record_chunks(file, chunk_size=IMPORT_CHUNK_SIZE):
+    # Yields lists of complete CSV records. A record only ends on a newline that
+    # sits outside quotes, so quoted notes spanning several lines stay intact.
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buffer = ""
+    record = ""
+    offset = 0  # bytes read before the current chunk
+    line_count = 0  # complete lines before the buffer
+    while True:
+        chunk = await file.read(chunk_size)
+        pending = decoder.getstate()[0]
+        try:
+            buffer += decoder.decode(chunk, final=not chunk)
+        except UnicodeDecodeError as e:
+            # e.start counts from the bytes the decoder held back from the
+            # previous chunk
+            data = pending + chunk
+            line = line_count + buffer.count("\n") + data[:e.start].count(b"\n") + 1
+            raise CSVFormatError(
+                f"file is not UTF-8 encoded (invalid byte at offset {offset - len(pending) + e.start}, line {line})"
+            )
+        offset += len(chunk)
+        lines = buffer.split("\n")
+        buffer = lines.pop()
+        line_count += len(lines)
+        if not chunk and buffer:
+            lines.append(buffer)
+            buffer = ""
+        records = []
+        for line in lines:
+            record += line + "\n"
+            if record.count('"') % 2 == 0:
+                records.append(record)
+                record = ""
+        if records:
+            yield records
+        if not chunk:
+            break
+    if record:
+        raise CSVFormatError("unterminated quoted field")
+
+
+async def iter_batches(file, batch_size=IMPORT_BATCH_SIZE, chunk_size=IMPORT_CHUNK_SIZE):
+    # Yields (rows, rejected) where rows are tuples ready for the staging table
+    # and rejected counts the rows dropped by validation since the last batch.
+    columns = None
+    batch = []
+    rejected = 0
+    seq = 0
+    async for records in iter_record_chunks(file, chunk_size):
+        try:
+            for fields in csv.reader(records):
+                if not fields:
+                    continue
+                if columns is None:
+                    columns = resolve_columns(fields)
+                    continue
+                seq += 1
+                row = parse_row(fields, columns, seq)
+                if row is None:
+                    rejected += 1
+                    continue
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    yield batch, rejected
+                    batch = []
+                    rejected = 0
+        except csv.Error as e:
+            raise CSVFormatError(str(e))
+    if columns is None:
+        raise CSVFormatError("file is empty")
+    if batch or rejected:
+        yield batch, rejected
+
+
+async def import_csv(connection, user_id, file, batch_size=IMPORT_BATCH_SIZE, progress=None):
+    # progress, if given, is called with the number of data rows read so far
+    staged = 0
+    rejected = 0
+    async with connection.transaction():
+        await connection.execute(CREATE_STAGING_QUERY)
+        async for batch, batch_rejected in iter_batches(file, batch_size):
+            rejected += batch_rejected
+            if batch:
+                await connection.copy_records_to_table(
+                    STAGING_TABLE, records=batch, columns=STAGING_COLUMNS
+                )
+                staged += len(batch)
+            if progress is not None:
+                progress(staged + rejected)
+        inserted = 0
+        if staged:
+            status = await connection.execute(MERGE_STAGING_QUERY, user_id)
+            inserted = int(status.split()[-1])
+    return {
+        "inserted": inserted,
+        "duplicates": staged - inserted,
+        "rejected": rejected,
+    }
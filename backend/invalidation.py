@@ -0,0 +1,102 @@
+import asyncio
+import json
+import os
+
+# Cross-worker cache invalidation. Every worker process keeps its own caches
+# (see cache.py), so a profile update handled by one worker would leave stale
+# entries in the others until their TTL ran out. Migration 0006 makes Postgres
+# NOTIFY the user_changes channel whenever a users row changes, which includes
+# the data_version bump from every measurement and goal write. Each worker
+# holds one pooled connection that LISTENs and passes the changes on to the
+# subscribers. If that connection drops, notifications may have been missed,
+# so every subscriber is reset (caches cleared) once it is listening again.
+
+CHANNEL = "user_changes"
+INVALIDATION_ENABLED = os.getenv("INVALIDATION_ENABLED", "true").lower() in ("1", "true", "yes")
+INVALIDATION_RETRY_DELAY = float(os.getenv("INVALIDATION_RETRY_DELAY", "1"))
+
+
+class InvalidationBus:
+    def __init__(self, database, channel=CHANNEL):
+        self.database = database
+        self.channel = channel
+        self.connection = None
+        self.received = 0
+        self.resets = 0
+        # (on_change, on_reset) pairs; on_change gets the decoded payload
+        self.subscribers = []
+        self._reconnect_task = None
+        self._stopping = False
+
+    def subscribe(self, on_change, on_reset):
+        self.subscribers.append((on_change, on_reset))
+
+    async def start(self):
+        self._stopping = False
+        await self.listen()
+
+    async def listen(self):
+        connection = await self.database.acquire_connection()
+        try:
+            await connection.add_listener(self.channel, self.dispatch)
+        except Exception:
+            await self.database.release(connection)
+            raise
+        connection.add_termination_listener(self.connection_lost)
+        self.connection = connection
+
+    def dispatch(self, connection, pid, channel, payload):
+        self.received += 1
+        try:
+            change = json.loads(payload)
+        except ValueError:
+            print(f"Ignoring malformed {channel} notification: {payload!r}")
+            return
+        for on_change, _ in self.subscribers:
+            on_change(change)
+
+    def reset(self):
+        self.resets += 1
+        for _, on_reset in self.subscribers:
+            on_reset()
+
+    def connection_lost(self, connection):
+        self.connection = None
+        if not self._stopping:
+            self._reconnect_task = asyncio.get_running_loop().create_task(self.reconnect(connection))
+
+    async def reconnect(self, lost):
+        try:
+            await self.database.release(lost)
+        except Exception:
+            pass
+        while not self._stopping:
+            try:
+                await self.listen()
+            except Exception as e:
+                print(f"Invalidation listener could not reconnect: {e}")
+                await asyncio.sleep(INVALIDATION_RETRY_DELAY)
+                continue
+            print("Invalidation listener reconnected; clearing caches")
+            self.reset()
+            return
+
+    async def stop(self):
+        self._stopping = True
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+            self._reconnect_task = None
+        connection, self.connection = self.connection, None
+        if connection is not None:
+            connection.remove_termination_listener(self.connection_lost)
+            try:
+                await connection.remove_listener(self.channel, self.dispatch)
+            finally:
+                await self.database.release(connection)
+
+    def stats(self):
+        return {
+            "listening": self.connection is not None,
+            "received": self.received,
+            "resets": self.resets,
+        }
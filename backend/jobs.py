@@ -0,0 +1,374 @@
+import asyncio
+import datetime
+import json
+import os
+import signal
+import time
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+
+import exporter
+import importer
+import metrics
+from auth import get_current_user
+from database import database, get_connection
+from responses import JSONResponse
+
+# Background imports and exports. /import?background=true and
+# /export?background=true store a row in the jobs table (migrations/0008) and
+# answer 202 with the job id straight away; GET /jobs/{id} reports progress and
+# GET /jobs/{id}/result downloads an export's file. The file is written to
+# job_output (migrations/0011) chunk by chunk while the export runs, in the
+# transaction that reads the rows, and streamed back the same way.
+#
+# Every app process runs a JobRunner with up to JOB_WORKERS jobs at a time,
+# each holding one pooled connection while it runs. Runners claim jobs with
+# FOR UPDATE SKIP LOCKED, so several processes share the queue without a
+# broker, and the web workers can run none (JOB_WORKERS=0) while a separate
+# `python jobs.py` process does the work. A running job's heartbeat is
+# refreshed every JOB_HEARTBEAT_INTERVAL seconds together with its row count;
+# a job whose heartbeat is older than JOB_STALE_AFTER (its process died) is
+# claimed again, up to JOB_MAX_ATTEMPTS runs. Imports are safe to repeat since
+# dates that already exist are skipped.
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", "5"))
+JOB_STALE_AFTER = float(os.getenv("JOB_STALE_AFTER", "60"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETENTION_HOURS = float(os.getenv("JOB_RETENTION_HOURS", "24"))
+JOB_SHUTDOWN_TIMEOUT = float(os.getenv("JOB_SHUTDOWN_TIMEOUT", "10"))
+JOB_MAX_UPLOAD_BYTES = int(os.getenv("JOB_MAX_UPLOAD_BYTES", str(50 * 1024 * 1024)))
+# Output chunks (about EXPORT_CHUNK_SIZE each) fetched per round-trip of a download
+JOB_OUTPUT_PREFETCH = 4
+# Finished jobs older than the retention are deleted at most this often
+JOB_PRUNE_INTERVAL = 600
+
+ENQUEUE_JOB_QUERY = """
+    INSERT INTO jobs (user_id, kind, params, input)
+    VALUES ($1, $2, $3::jsonb, $4)
+    RETURNING id
+"""
+CLAIM_JOB_QUERY = """
+    UPDATE jobs
+    SET status = 'running', attempts = attempts + 1, started_at = now(), heartbeat_at = now()
+    WHERE id = (
+        SELECT id FROM jobs
+        WHERE status = 'queued'
+           OR (status = 'running' AND heartbeat_at < now() - make_interval(secs => $1))
+        ORDER BY id
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING id, user_id, kind, params, input, attempts
+"""
+HEARTBEAT_JOBS_QUERY = """
+    UPDATE jobs AS j
+    SET heartbeat_at = now(), rows_processed = p.rows
+    FROM unnest($1::bigint[], $2::int[]) AS p(id, rows)
+    WHERE j.id = p.id AND j.status = 'running'
+"""
+FINISH_JOB_QUERY = """
+    UPDATE jobs
+    SET status = 'succeeded', result = $2::jsonb, rows_processed = $3,
+        input = NULL, error = NULL, finished_at = now()
+    WHERE id = $1
+"""
+FAIL_JOB_QUERY = """
+    UPDATE jobs
+    SET status = 'failed', error = $2, input = NULL, finished_at = now()
+    WHERE id = $1
+"""
+RETRY_JOB_QUERY = "UPDATE jobs SET status = 'queued', error = $2 WHERE id = $1"
+# Jobs interrupted by a shutdown go back to the queue without using up an attempt
+REQUEUE_JOBS_QUERY = """
+    UPDATE jobs
+    SET status = 'queued', attempts = attempts - 1
+    WHERE id = ANY($1::bigint[]) AND status = 'running'
+"""
+PRUNE_JOBS_QUERY = "DELETE FROM jobs WHERE finished_at < now() - make_interval(secs => $1)"
+JOB_STATUS_QUERY = """
+    SELECT id, kind, status, params, result, error, rows_processed, attempts,
+           created_at, started_at, finished_at, kind = 'export' AND status = 'succeeded' AS has_output
+    FROM jobs
+    WHERE id = $1 AND user_id = $2
+"""
+JOB_RESULT_QUERY = "SELECT kind, status, params FROM jobs WHERE id = $1 AND user_id = $2"
+# A retried export starts over; the output of a run that died before the job
+# was marked finished may already be committed
+CLEAR_JOB_OUTPUT_QUERY = "DELETE FROM job_output WHERE job_id = $1"
+WRITE_JOB_OUTPUT_QUERY = "INSERT INTO job_output (job_id, seq, data) VALUES ($1, $2, $3)"
+READ_JOB_OUTPUT_QUERY = "SELECT data FROM job_output WHERE job_id = $1 ORDER BY seq"
+
+
+class UploadedFile:
+    # A stored upload with the async read() the importer expects from UploadFile
+    def __init__(self, data):
+        self.data = memoryview(data)
+        self.offset = 0
+
+    async def read(self, size=-1):
+        end = len(self.data) if size < 0 else self.offset + size
+        chunk = bytes(self.data[self.offset:end])
+        self.offset += len(chunk)
+        return chunk
+
+
+def parse_date(value):
+    return datetime.date.fromisoformat(value) if value else None
+
+
+class JobRunner:
+    def __init__(self, database, workers=JOB_WORKERS):
+        self.database = database
+        self.workers = workers
+        # Job id -> rows processed so far, for the heartbeat
+        self.progress = {}
+        self.tasks = {}
+        self.succeeded = 0
+        self.failed = 0
+        self.retried = 0
+        self._wakeup = asyncio.Event()
+        self._dispatcher = None
+        self._maintainer = None
+        self._last_prune = 0.0
+
+    async def start(self):
+        if self.workers <= 0:
+            return
+        self._dispatcher = asyncio.create_task(self.dispatch_loop())
+        self._maintainer = asyncio.create_task(self.maintain_loop())
+
+    def notify(self):
+        # A job was queued or one finished; other processes find new jobs by polling
+        self._wakeup.set()
+
+    async def dispatch_loop(self):
+        while True:
+            self._wakeup.clear()
+            if len(self.tasks) >= self.workers:
+                await self._wakeup.wait()
+                continue
+            try:
+                job = await self.claim()
+            except Exception as e:
+                print(f"Could not claim a job: {e}")
+                job = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self.progress[job["id"]] = 0
+            self.tasks[job["id"]] = asyncio.create_task(self.run(job))
+
+    async def claim(self):
+        async with self.database.acquire() as connection:
+            while True:
+                job = await connection.fetchrow(CLAIM_JOB_QUERY, JOB_STALE_AFTER)
+                if job is None or job["attempts"] <= JOB_MAX_ATTEMPTS:
+                    return job
+                # Reclaimed once too often; whatever kills its worker would kill the next one
+                await connection.execute(FAIL_JOB_QUERY, job["id"], f"Gave up after {JOB_MAX_ATTEMPTS} attempts")
+                self.failed += 1
+
+    async def run(self, job):
+        start = time.perf_counter()
+        status = "failed"
+        try:
+            async with self.database.acquire() as connection:
+                result = await self.execute(connection, job)
+                await connection.execute(FINISH_JOB_QUERY, job["id"], json.dumps(result), self.progress[job["id"]])
+            status = "succeeded"
+            self.succeeded += 1
+        except importer.CSVFormatError as e:
+            await self.record(FAIL_JOB_QUERY, job["id"], f"Invalid CSV file: {e}")
+            self.failed += 1
+        except asyncio.CancelledError:
+            status = "interrupted"
+            raise
+        except Exception as e:
+            print(f"Job {job['id']} ({job['kind']}) failed: {e}")
+            if job["attempts"] < JOB_MAX_ATTEMPTS:
+                status = "retried"
+                await self.record(RETRY_JOB_QUERY, job["id"], str(e))
+                self.retried += 1
+            else:
+                await self.record(FAIL_JOB_QUERY, job["id"], str(e))
+                self.failed += 1
+        finally:
+            metrics.observe_job(job["kind"], status, time.perf_counter() - start)
+            self.progress.pop(job["id"], None)
+            self.tasks.pop(job["id"], None)
+            self.notify()
+
+    async def execute(self, connection, job):
+        params = json.loads(job["params"])
+
+        def progress(rows):
+            self.progress[job["id"]] = rows
+
+        if job["kind"] == "import":
+            result = await importer.import_csv(
+                connection, job["user_id"], UploadedFile(job["input"]), progress=progress
+            )
+            metrics.count_import_rows(result)
+            return result
+
+        fmt = params.get("format", "csv")
+        rows = exporter.iter_rows(
+            connection, job["user_id"], parse_date(params.get("from")), parse_date(params.get("to")), readonly=False
+        )
+        seq = size = 0
+        # One transaction, so a run that fails halfway leaves no partial file
+        async with connection.transaction():
+            await connection.execute(CLEAR_JOB_OUTPUT_QUERY, job["id"])
+            chunks = exporter.iter_chunks(self.counted(rows, progress), fmt)
+            async for chunk in chunks:
+                data = chunk.encode("utf-8")
+                await connection.execute(WRITE_JOB_OUTPUT_QUERY, job["id"], seq, data)
+                seq += 1
+                size += len(data)
+        return {"format": fmt, "rows": self.progress[job["id"]], "bytes": size}
+
+    async def counted(self, rows, progress):
+        count = 0
+        async for row in rows:
+            count += 1
+            if count % 1000 == 0:
+                progress(count)
+            yield row
+        progress(count)
+
+    async def record(self, query, *args):
+        # Best effort: if the database is unreachable the job goes stale and
+        # is claimed again
+        try:
+            async with self.database.acquire() as connection:
+                await connection.execute(query, *args)
+        except Exception as e:
+            print(f"Could not update job {args[0]}: {e}")
+
+    async def maintain_loop(self):
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT_INTERVAL)
+            try:
+                await self.maintain()
+            except Exception as e:
+                print(f"Job heartbeat failed: {e}")
+
+    async def maintain(self):
+        prune = time.monotonic() - self._last_prune >= JOB_PRUNE_INTERVAL
+        if not self.progress and not prune:
+            return
+        async with self.database.acquire() as connection:
+            if self.progress:
+                ids = list(self.progress)
+                await connection.execute(HEARTBEAT_JOBS_QUERY, ids, [self.progress[i] for i in ids])
+            if prune:
+                self._last_prune = time.monotonic()
+                await connection.execute(PRUNE_JOBS_QUERY, JOB_RETENTION_HOURS * 3600)
+
+    async def stop(self):
+        loops = [task for task in (self._dispatcher, self._maintainer) if task is not None]
+        for task in loops:
+            task.cancel()
+        await asyncio.gather(*loops, return_exceptions=True)
+        self._dispatcher = self._maintainer = None
+        if not self.tasks:
+            return
+        running = dict(self.tasks)
+        _, pending = await asyncio.wait(running.values(), timeout=JOB_SHUTDOWN_TIMEOUT)
+        if not pending:
+            return
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        interrupted = [job_id for job_id, task in running.items() if task in pending]
+        print(f"Requeueing interrupted jobs {interrupted}")
+        await self.record(REQUEUE_JOBS_QUERY, interrupted)
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "running": len(self.tasks),
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "retried": self.retried,
+        }
+
+
+runner = JobRunner(database)
+
+
+async def enqueue(connection, user_id, kind, params, data=None):
+    job_id = await connection.fetchval(ENQUEUE_JOB_QUERY, user_id, kind, json.dumps(params), data)
+    runner.notify()
+    return job_id
+
+
+def accepted(job_id):
+    return JSONResponse(
+        {"job_id": job_id, "status": "queued", "status_url": f"/jobs/{job_id}"},
+        status_code=202,
+        headers={"Location": f"/jobs/{job_id}"},
+    )
+
+
+router = APIRouter()
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: int, current_user: dict = Depends(get_current_user), connection=Depends(get_connection)):
+    row = await connection.fetchrow(JOB_STATUS_QUERY, job_id, current_user["id"])
+    if row is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    job = dict(row)
+    job["params"] = json.loads(job["params"])
+    job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+    job["result_url"] = f"/jobs/{job_id}/result" if job.pop("has_output") else None
+    return job
+
+async def stream_output(connection, job_id):
+    # On the request's connection, like exporter.stream_export
+    async with connection.transaction(readonly=True):
+        async for row in connection.cursor(READ_JOB_OUTPUT_QUERY, job_id, prefetch=JOB_OUTPUT_PREFETCH):
+            yield row["data"]
+
+@router.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: int, current_user: dict = Depends(get_current_user), connection=Depends(get_connection)):
+    row = await connection.fetchrow(JOB_RESULT_QUERY, job_id, current_user["id"])
+    if row is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if row["kind"] != "export" or row["status"] != "succeeded":
+        if row["status"] in ("queued", "running"):
+            raise HTTPException(status_code=409, detail=f"Job is still {row['status']}")
+        raise HTTPException(status_code=404, detail="Job has no file to download")
+    media_type, filename = exporter.FORMATS[json.loads(row["params"]).get("format", "csv")]
+    return StreamingResponse(
+        stream_output(connection, job_id),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+async def serve():
+    # A process that only runs jobs, for deployments whose web workers set
+    # JOB_WORKERS=0. Migrations are left to the web app.
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+    await database.connect()
+    await runner.start()
+    print(f"Running up to {runner.workers} jobs at a time")
+    try:
+        await stopping.wait()
+    finally:
+        await runner.stop()
+        await database.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(serve())
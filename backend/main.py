@@ -3,17 +3,51 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from database import database
+from invalidation import INVALIDATION_ENABLED, InvalidationBus
+from passwords import password_executor
+from responses import JSONResponse
+import admission
+import metrics
+import migrate
+import partitions
+import queries
 import measurements
 import auth
 import goals
+import analytics
+import exporter
+import importer
+import jobs
+import series
+import batch
+import conditional
+import weight_stats
+
+RUN_MIGRATIONS = os.getenv("RUN_MIGRATIONS", "true").lower() in ("1", "true", "yes")
+
+invalidation_bus = InvalidationBus(database)
+invalidation_bus.subscribe(auth.forget_user, auth.user_cache.clear)
+# Replica routing: a user's writes, seen by any worker, pin their reads to the primary
+database.session_key = auth.request_username
+invalidation_bus.subscribe(database.note_change, database.forget_writes)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     await database.connect()
+    if RUN_MIGRATIONS:
+        async with database.acquire() as connection:
+            await migrate.apply_migrations(connection)
+            await partitions.ensure(connection)
+    if INVALIDATION_ENABLED:
+        await invalidation_bus.start()
+    await jobs.runner.start()
     yield
+    await jobs.runner.stop()
+    await invalidation_bus.stop()
     await database.disconnect()
+    password_executor.shutdown()
 
-app = FastAPI(lifespan=lifespan)
+app = FastAPI(lifespan=lifespan, default_response_class=JSONResponse)
 
 allowed_origins = [
     origin.strip()
@@ -29,11 +63,41 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+metrics.instrument(
+    app,
+    database,
+    caches={"user": auth.user_cache, "token": auth.token_cache},
+    password_executor=password_executor,
+)
+# Request-path statements are prepared on every pooled connection; the
+# import/export and maintenance ones are only named and timed
+queries.register_modules(auth, conditional, measurements, goals, analytics, series, batch, jobs)
+queries.register_modules(exporter, importer, weight_stats, prepare=False)
+queries.register_module(admission, prepare=admission.RATE_LIMIT_STORE == "postgres")
+
 # Include routers
 app.include_router(auth.router, prefix="/auth", tags=["auth"])
 app.include_router(measurements.router)
 app.include_router(goals.router)
+app.include_router(jobs.router, tags=["jobs"])
+
+@app.get("/health")
+async def health():
+    # Pool size, free connections and acquire wait times for monitoring
+    return {
+        "status": "ok",
+        "database": database.stats(),
+        "invalidation": invalidation_bus.stats(),
+        "admission": admission.stats(),
+        "jobs": jobs.runner.stats(),
+    }
+
+@app.get("/health/queries")
+async def query_stats():
+    # Calls, errors and timing per registered statement, slowest total first
+    return {"queries": queries.stats()}
 
 if __name__ == "__main__":
+    # A single process; see gunicorn.conf.py for one worker per core
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
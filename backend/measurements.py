@@ -1,210 +1,319 @@
-from fastapi import APIRouter, HTTPException, Depends, UploadFile, File
+from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Query
+from fastapi.responses import StreamingResponse
+from asyncpg.exceptions import UniqueViolationError
+from typing import Annotated, Optional
 from models import Measurement
-from database import database
+from responses import JSONResponse
+from database import get_connection, replica_read
 from auth import get_current_user
+import analytics
+from admission import ConcurrencyLimit, RateLimit
+import batch
+import conditional
+import importer
+import jobs
+import metrics
+import exporter
+import pagination
+import series
+import queries
 import datetime
-import csv
-import io
+import os
+from functools import lru_cache
 
 router = APIRouter()
 
-@router.get("/measurements")
-async def get_measurements(current_user: dict = Depends(get_current_user)):
-    query = """
-        SELECT w.id, w.measurement_date, w.weight, w.notes
-        FROM weight_measurements w
-        WHERE w.user_id = $1
-        ORDER BY w.measurement_date DESC;
+MEASUREMENT_FIELDS = ("id", "measurement_date", "weight", "notes")
+MEASUREMENT_COLUMNS = {
+    "id": "id",
+    "measurement_date": "measurement_date",
+    "weight": "weight::float8 AS weight",
+    "notes": "notes",
+}
+MAX_PAGE_SIZE = int(os.getenv("MEASUREMENTS_MAX_PAGE_SIZE", "1000"))
+
+# A CSV import holds a pooled connection for the whole upload, so only a few
+# run at once per worker and the rest get 503 with Retry-After rather than
+# queueing for connections the cheap routes need. Queued imports would still
+# hold their own connection, hence no queueing by default. Users are also
+# rate limited (429) on how often they import.
+IMPORT_CONCURRENCY = int(os.getenv("IMPORT_CONCURRENCY", "2"))
+IMPORT_QUEUE_TIMEOUT = float(os.getenv("IMPORT_QUEUE_TIMEOUT", "0"))
+IMPORT_SLOTS = ConcurrencyLimit("import", IMPORT_CONCURRENCY, IMPORT_QUEUE_TIMEOUT)
+IMPORT_USER_LIMIT = RateLimit("import_user", os.getenv("RATE_LIMIT_IMPORT_USER", "30/hour"))
+
+INSERT_MEASUREMENT_QUERY = """
+    INSERT INTO weight_measurements (user_id, measurement_date, weight, notes)
+    VALUES ($1, $2, $3, $4)
+"""
+UPDATE_MEASUREMENT_QUERY = """
+    UPDATE weight_measurements
+    SET measurement_date = $1, weight = $2, notes = $3
+    WHERE id = $4 AND user_id = $5
+"""
+DELETE_MEASUREMENT_QUERY = """
+    DELETE FROM weight_measurements
+    WHERE id = $1 AND user_id = $2
+"""
+
+@lru_cache(maxsize=256)
+def list_query(columns, before, after, limited):
+    # One text per combination of columns, cursors and limit, each registered
+    # as a variant of measurements.list. columns come in MEASUREMENT_FIELDS
+    # order, so there are at most 32 variants; only the 8 full-column ones
+    # (the default listing) are prepared on every connection, keeping the
+    # registry well inside the statement cache.
+    args = 1
+    conditions = ["user_id = $1"]
+    if before:
+        conditions.append(f"(measurement_date, id) < (${args + 1}, ${args + 2})")
+        args += 2
+    if after:
+        conditions.append(f"(measurement_date, id) > (${args + 1}, ${args + 2})")
+        args += 2
+    # Paging with only after= walks forward in time, so fetch the rows closest
+    # to the cursor first and flip them back to newest-first afterwards
+    order = "ASC" if after and not before else "DESC"
+    query = f"""
+        SELECT {", ".join(MEASUREMENT_COLUMNS[column] for column in columns)}
+        FROM weight_measurements
+        WHERE {" AND ".join(conditions)}
+        ORDER BY measurement_date {order}, id {order}
     """
-    async with database.pool.acquire() as connection:
-        rows = await connection.fetch(query, current_user["id"])
-    return {
-        "measurements": [
-            {
-                "id": row["id"],
-                "measurement_date": row["measurement_date"],
-                "weight": row["weight"],
-                "notes": row["notes"],
-            }
-            for row in rows
-        ]
-    }
+    if limited:
+        query += f"LIMIT ${args + 1}"
+    queries.register("measurements.list", query, prepare=columns == MEASUREMENT_FIELDS)
+    return query
+
+@router.get("/measurements")
+@replica_read
+async def get_measurements(
+    limit: Annotated[Optional[int], Query(ge=1, le=MAX_PAGE_SIZE)] = None,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    fields: Optional[str] = None,
+    current_user: dict = Depends(get_current_user),
+    connection=Depends(get_connection),
+    etag: str = Depends(conditional.data_etag),
+):
+    # Without limit the whole history is returned, as older clients expect
+    try:
+        selected = pagination.parse_fields(fields, MEASUREMENT_FIELDS)
+        before_key = pagination.parse_cursor(before, 0) if before else None
+        after_key = pagination.parse_cursor(after, pagination.MAX_ID) if after else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    args = [current_user["id"]]
+    if before_key:
+        args.extend(before_key)
+    if after_key:
+        args.extend(after_key)
+    if limit is not None:
+        args.append(limit + 1)
+    ascending = after_key is not None and before_key is None
+    # id and measurement_date are always fetched for the cursor; the column
+    # order is fixed so that fields= in any order maps to the same statement
+    columns = tuple(field for field in MEASUREMENT_FIELDS if field in selected or field in ("id", "measurement_date"))
+    query = list_query(columns, before_key is not None, after_key is not None, limit is not None)
+
+    rows = await connection.fetch(query, *args)
+
+    next_cursor = None
+    if limit is not None:
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = pagination.format_cursor(rows[-1])
+        if ascending:
+            rows = rows[::-1]
+    # The records go straight into the response unless cursor-only columns
+    # have to be dropped or the fields were asked for in another order
+    if list(columns) != selected:
+        rows = [{field: row[field] for field in selected} for row in rows]
+    result = {"measurements": rows}
+    if limit is not None:
+        result["next_cursor"] = next_cursor
+    return JSONResponse(result, headers=conditional.cache_headers(etag))
+
+@router.get("/measurements/series")
+@replica_read
+async def get_measurement_series(
+    points: Annotated[Optional[int], Query(ge=3, le=series.SERIES_MAX_POINTS)] = None,
+    bucket: Annotated[Optional[str], Query(pattern="^(day|week|month)$")] = None,
+    date_from: Annotated[Optional[datetime.date], Query(alias="from")] = None,
+    date_to: Annotated[Optional[datetime.date], Query(alias="to")] = None,
+    current_user: dict = Depends(get_current_user),
+    connection=Depends(get_connection),
+    etag: str = Depends(conditional.data_etag),
+):
+    # bucket= groups readings into calendar buckets (points caps how many of the
+    # most recent buckets are returned); otherwise the history is downsampled
+    # to points readings with LTTB
+    if bucket:
+        limit = points or series.SERIES_MAX_POINTS
+        rows = await connection.fetch(
+            series.BUCKET_SERIES_QUERY, current_user["id"], date_from, date_to, bucket, limit
+        )
+        return JSONResponse(
+            {"bucket": bucket, "series": series.format_buckets(rows)}, headers=conditional.cache_headers(etag)
+        )
+
+    points = points or series.SERIES_DEFAULT_POINTS
+    rows = await connection.fetch(series.RAW_SERIES_QUERY, current_user["id"], date_from, date_to)
+    return JSONResponse(
+        {"points": points, "series": series.downsample(rows, points)}, headers=conditional.cache_headers(etag)
+    )
 
 @router.get("/trends")
-async def get_trends(current_user: dict = Depends(get_current_user)):
-    # Get user info for BMI
-    user_query = "SELECT height, age FROM users WHERE id = $1"
-    async with database.pool.acquire() as connection:
-        user = await connection.fetchrow(user_query, current_user["id"])
-        measurements = await connection.fetch("""
-            SELECT measurement_date, weight FROM weight_measurements
-            WHERE user_id = $1 ORDER BY measurement_date
-        """, current_user["id"])
-
-    if user is None:
-        raise HTTPException(status_code=404, detail="User not found")
-
-    if not measurements:
-        return {"trends": {}}
-
-    weights = [float(m["weight"]) for m in measurements]
-    dates = [m["measurement_date"] for m in measurements]
-
-    # Calculate averages
-    avg_weight = sum(weights) / len(weights)
-    weekly_avg = avg_weight  # placeholder
-    monthly_avg = avg_weight  # placeholder
-
-    # BMI if height available
-    bmi = None
-    if user["height"]:
-        latest_weight = weights[-1]
-        height_m = float(user["height"]) / 100
-        bmi = latest_weight / (height_m ** 2)
-
-    # Trend: simple linear regression slope
-    if len(weights) > 1:
-        x = list(range(len(weights)))
-        slope = (sum((xi - sum(x)/len(x)) * (yi - avg_weight) for xi, yi in zip(x, weights)) /
-                 sum((xi - sum(x)/len(x))**2 for xi in x)) if sum((xi - sum(x)/len(x))**2 for xi in x) != 0 else 0
+@replica_read
+async def get_trends(
+    current_user: dict = Depends(get_current_user),
+    connection=Depends(get_connection),
+    etag: str = Depends(conditional.data_etag),
+):
+    summary_query = analytics.TRENDS_ENGINE_QUERIES.get(analytics.TRENDS_ENGINE)
+    if summary_query:
+        summary = await connection.fetchrow(summary_query, current_user["id"])
+        if summary is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        trends = analytics.trends_from_summary(summary)
     else:
-        slope = 0
-
-    # Calculate streak: consecutive days with measurements
-    streak = 0
-    if dates:
-        sorted_dates = sorted(set(dates))
-        current_streak = 0
-        for i in range(len(sorted_dates) - 1):
-            if (sorted_dates[i+1] - sorted_dates[i]).days == 1:
-                current_streak += 1
-            else:
-                current_streak = 0
-        streak = current_streak + 1 if sorted_dates else 0
-
-    return {
-        "trends": {
-            "average_weight": round(avg_weight, 2),
-            "weekly_average": round(weekly_avg, 2),  # TODO: calculate properly
-            "monthly_average": round(monthly_avg, 2),  # TODO
-            "bmi": round(bmi, 2) if bmi else None,
-            "trend_slope": round(slope, 4),  # kg per measurement
-            "total_measurements": len(weights),
-            "date_range": f"{dates[0]} to {dates[-1]}" if dates else None,
-            "current_streak": streak
-        }
-    }
+        # get_current_user already loaded the height, so the python engine needs
+        # a single round-trip as well
+        measurements = await connection.fetch(analytics.TRENDS_QUERY, current_user["id"])
+        trends = analytics.trends_from_records(measurements, current_user["height"])
+    return JSONResponse({"trends": trends}, headers=conditional.cache_headers(etag))
+
+def export_reads_only(request):
+    # background=true queues a job, a write that needs the primary
+    return request.query_params.get("background", "").lower() not in ("1", "true", "on", "yes")
 
 @router.get("/export")
-async def export_measurements(current_user: dict = Depends(get_current_user)):
-    query = """
-        SELECT measurement_date, weight, notes
-        FROM weight_measurements
-        WHERE user_id = $1
-        ORDER BY measurement_date
-    """
-    async with database.pool.acquire() as connection:
-        rows = await connection.fetch(query, current_user["id"])
+@replica_read(when=export_reads_only)
+async def export_measurements(
+    fmt: str = Query("csv", alias="format", pattern="^(csv|ndjson)$"),
+    date_from: Optional[datetime.date] = Query(None, alias="from"),
+    date_to: Optional[datetime.date] = Query(None, alias="to"),
+    legacy: bool = False,
+    background: bool = False,
+    current_user: dict = Depends(get_current_user),
+    connection=Depends(get_connection),
+):
+    # background=true queues the export and answers 202 with a job id; the
+    # file is then downloaded from /jobs/{id}/result
+    if background:
+        params = {"format": fmt, "from": date_from and date_from.isoformat(), "to": date_to and date_to.isoformat()}
+        return jobs.accepted(await jobs.enqueue(connection, current_user["id"], "export", params))
 
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(["Date", "Weight", "Notes"])
-    for row in rows:
-        writer.writerow([row["measurement_date"], row["weight"], row["notes"]])
+    # legacy=true keeps the old {"csv": "..."} response for existing clients
+    if legacy:
+        content = await exporter.export_legacy_csv(connection, current_user["id"], date_from, date_to)
+        return {"csv": content}
 
-    return {"csv": output.getvalue()}
+    media_type, filename = exporter.FORMATS[fmt]
+    return StreamingResponse(
+        exporter.stream_export(connection, current_user["id"], fmt, date_from, date_to),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
 
 @router.post("/import")
-async def import_measurements(file: UploadFile = File(...), current_user: dict = Depends(get_current_user)):
-    if not file.filename.endswith('.csv'):
+async def import_measurements(
+    file: UploadFile = File(...),
+    background: bool = False,
+    current_user: dict = Depends(get_current_user),
+    connection=Depends(get_connection),
+):
+    if not file.filename or not file.filename.endswith('.csv'):
         raise HTTPException(status_code=400, detail="File must be CSV")
 
-    content = await file.read()
-    csv_reader = csv.DictReader(io.StringIO(content.decode('utf-8')))
-
-    async with database.pool.acquire() as connection:
-        for row in csv_reader:
-            try:
-                date = datetime.datetime.strptime(row["Date"], "%Y-%m-%d").date()
-                weight = float(row["Weight"])
-                notes = row.get("Notes", "")
-                await connection.execute("""
-                    INSERT INTO weight_measurements (user_id, measurement_date, weight, notes)
-                    VALUES ($1, $2, $3, $4)
-                    ON CONFLICT DO NOTHING
-                """, current_user["id"], date, weight, notes)
-            except Exception as e:
-                continue  # Skip invalid rows
-
-    return {"message": "Import completed"}
+    await IMPORT_USER_LIMIT.check(current_user["id"], connection)
+    if background:
+        # Stored as uploaded and parsed by a job worker; see GET /jobs/{id}
+        data = await file.read(jobs.JOB_MAX_UPLOAD_BYTES + 1)
+        if len(data) > jobs.JOB_MAX_UPLOAD_BYTES:
+            raise HTTPException(status_code=413, detail=f"File is larger than {jobs.JOB_MAX_UPLOAD_BYTES} bytes")
+        job_id = await jobs.enqueue(connection, current_user["id"], "import", {"filename": file.filename}, data)
+        return jobs.accepted(job_id)
+
+    async with IMPORT_SLOTS.slot():
+        try:
+            result = await importer.import_csv(connection, current_user["id"], file)
+        except importer.CSVFormatError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid CSV file: {e}")
+
+    metrics.count_import_rows(result)
+    return {"message": "Import completed", **result}
 
 @router.post("/measurements")
-async def add_measurement(measurement: Measurement, current_user: dict = Depends(get_current_user)):
+async def add_measurement(measurement: Measurement, current_user: dict = Depends(get_current_user), connection=Depends(get_connection)):
     try:
         measurement_date = datetime.datetime.strptime(
             measurement.measurement_date, "%Y-%m-%d"
         ).date()
 
-        query = """
-            INSERT INTO weight_measurements (user_id, measurement_date, weight, notes)
-            VALUES ($1, $2, $3, $4);
-        """
-        async with database.pool.acquire() as connection:
-            await connection.execute(
-                query,
-                current_user["id"],
-                measurement_date,
-                measurement.weight,
-                measurement.notes,
-            )
+        await connection.execute(
+            INSERT_MEASUREMENT_QUERY,
+            current_user["id"],
+            measurement_date,
+            measurement.weight,
+            measurement.notes,
+        )
+    except UniqueViolationError:
+        raise HTTPException(status_code=400, detail="A measurement already exists for this date")
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error adding measurement: {e}")
     return {"message": "Measurement added successfully"}
 
+@router.post("/measurements/batch")
+async def add_measurements_batch(
+    measurements: list[Measurement],
+    current_user: dict = Depends(get_current_user),
+    connection=Depends(get_connection),
+):
+    # Upserts by date: a reading for a date that already exists replaces it.
+    # Invalid items are reported per index and do not fail the rest.
+    if len(measurements) > batch.MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413, detail=f"At most {batch.MAX_BATCH_SIZE} measurements per batch"
+        )
+    return await batch.upsert_measurements(connection, current_user["id"], measurements)
+
 @router.put("/measurements/{measurement_id}")
-async def update_measurement(measurement_id: int, measurement: Measurement, current_user: dict = Depends(get_current_user)):
+async def update_measurement(measurement_id: int, measurement: Measurement, current_user: dict = Depends(get_current_user), connection=Depends(get_connection)):
     try:
         measurement_date = datetime.datetime.strptime(
             measurement.measurement_date, "%Y-%m-%d"
         ).date()
 
-        query = """
-            UPDATE weight_measurements
-            SET measurement_date = $1, weight = $2, notes = $3
-            WHERE id = $4 AND user_id = $5;
-        """
-        async with database.pool.acquire() as connection:
-            result = await connection.execute(
-                query,
-                measurement_date,
-                measurement.weight,
-                measurement.notes,
-                measurement_id,
-                current_user["id"],
-            )
-            if result == "UPDATE 0":
-                raise HTTPException(status_code=404, detail="Measurement not found or not owned by user")
+        result = await connection.execute(
+            UPDATE_MEASUREMENT_QUERY,
+            measurement_date,
+            measurement.weight,
+            measurement.notes,
+            measurement_id,
+            current_user["id"],
+        )
+        if result == "UPDATE 0":
+            raise HTTPException(status_code=404, detail="Measurement not found or not owned by user")
     except HTTPException:
         raise
+    except UniqueViolationError:
+        raise HTTPException(status_code=400, detail="A measurement already exists for this date")
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error updating measurement: {e}")
     return {"message": "Measurement updated successfully"}
 
 @router.delete("/measurements/{measurement_id}")
-async def delete_measurement(measurement_id: int, current_user: dict = Depends(get_current_user)):
+async def delete_measurement(measurement_id: int, current_user: dict = Depends(get_current_user), connection=Depends(get_connection)):
     try:
-        query = """
-            DELETE FROM weight_measurements
-            WHERE id = $1 AND user_id = $2;
-        """
-        async with database.pool.acquire() as connection:
-            result = await connection.execute(
-                query,
-                measurement_id,
-                current_user["id"],
-            )
-            if result == "DELETE 0":
-                raise HTTPException(status_code=404, detail="Measurement not found or not owned by user")
+        result = await connection.execute(
+            DELETE_MEASUREMENT_QUERY,
+            measurement_id,
+            current_user["id"],
+        )
+        if result == "DELETE 0":
+            raise HTTPException(status_code=404, detail="Measurement not found or not owned by user")
     except HTTPException:
         raise
     except Exception as e:
@@ -0,0 +1,192 @@
+import os
+import re
+import time
+from functools import lru_cache
+from starlette.responses import Response
+import queries
+
+# Prometheus metrics, served at /metrics. With METRICS_ENABLED=false nothing
+# is registered, prometheus_client is never imported and the helpers below
+# return straight away, so instrumented code pays one flag check.
+#
+# Request latency is recorded per route template ("/measurements/{measurement_id}",
+# not the concrete path) to keep label cardinality bounded. Pool, cache and
+# password executor figures are read from their own counters at scrape time
+# rather than updated on every call.
+#
+# Under gunicorn with several workers, point PROMETHEUS_MULTIPROC_DIR at an
+# empty directory: counters and histograms are then kept in per-process files
+# and /metrics adds them up across workers. The pool, cache and executor
+# figures still describe only the worker that answers the scrape.
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+MULTIPROCESS = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+# What /metrics serves; instrument() swaps in an aggregating registry in
+# multiprocess mode
+scrape_registry = None
+
+if METRICS_ENABLED:
+    from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+    from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, SummaryMetricFamily
+
+    REQUEST_DURATION = Histogram(
+        "http_request_duration_seconds", "HTTP request latency by route template",
+        ["method", "route", "status"],
+    )
+    QUERY_DURATION = Histogram(
+        "db_query_duration_seconds", "Database query latency by statement", ["statement"],
+    )
+    QUERY_ERRORS = Counter("db_query_errors", "Database queries that raised, by statement", ["statement"])
+    PASSWORD_HASH_DURATION = Histogram(
+        "password_hash_duration_seconds", "bcrypt hash/verify latency including queueing",
+        ["operation"], buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+    )
+    IMPORT_ROWS = Counter("import_rows", "CSV import rows by outcome", ["result"])
+    AUTH_FAILURES = Counter("auth_failures", "Rejected authentication attempts", ["reason"])
+    ADMISSION_REJECTIONS = Counter(
+        "admission_rejections", "Requests turned away by rate or concurrency limits", ["limit", "reason"],
+    )
+    JOB_DURATION = Histogram(
+        "job_duration_seconds", "Background job run time by kind and outcome", ["kind", "status"],
+        buckets=(0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0, 900.0),
+    )
+
+# Statements are named as in the query registry (queries.py), e.g.
+# "analytics.trends_stats_query"; other queries are labelled "<verb> <table>".
+STATEMENT_VERB = re.compile(r"\s*([a-z]+)", re.IGNORECASE)
+STATEMENT_TABLE = re.compile(r"\b(?:from|into|update|join)\s+([a-z_][a-z0-9_]*)", re.IGNORECASE)
+
+
+@lru_cache(maxsize=256)
+def describe_query(query):
+    verb = STATEMENT_VERB.match(query)
+    verb = verb.group(1).lower() if verb else "unknown"
+    match = STATEMENT_TABLE.search(query)
+    return f"{verb} {match.group(1).lower()}" if match else verb
+
+
+def statement_name(query):
+    name = queries.name_of(query)
+    return name if name is not None else describe_query(query)
+
+
+def log_query(record):
+    # asyncpg query logger callback (Connection.add_query_logger)
+    name = statement_name(record.query)
+    QUERY_DURATION.labels(name).observe(record.elapsed)
+    if record.exception is not None:
+        QUERY_ERRORS.labels(name).inc()
+
+
+def observe_password_hash(operation, seconds):
+    if METRICS_ENABLED:
+        PASSWORD_HASH_DURATION.labels(operation).observe(seconds)
+
+
+def count_import_rows(result):
+    if METRICS_ENABLED:
+        for outcome in ("inserted", "duplicates", "rejected"):
+            IMPORT_ROWS.labels(outcome).inc(result[outcome])
+
+
+def count_auth_failure(reason):
+    if METRICS_ENABLED:
+        AUTH_FAILURES.labels(reason).inc()
+
+
+def count_admission_rejection(limit, reason):
+    if METRICS_ENABLED:
+        ADMISSION_REJECTIONS.labels(limit, reason).inc()
+
+
+def observe_job(kind, status, seconds):
+    if METRICS_ENABLED:
+        JOB_DURATION.labels(kind, status).observe(seconds)
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The router stores the matched route in the (shared) scope
+            route = scope.get("route")
+            template = getattr(route, "path", None) or "unmatched"
+            REQUEST_DURATION.labels(scope["method"], template, str(status)).observe(
+                time.perf_counter() - start
+            )
+
+
+class StatsCollector:
+    def __init__(self, database, caches, password_executor):
+        self.database = database
+        self.caches = caches
+        self.password_executor = password_executor
+
+    def collect(self):
+        stats = self.database.stats()
+        yield GaugeMetricFamily("db_pool_size", "Open connections in the pool", value=stats["size"])
+        yield GaugeMetricFamily("db_pool_free", "Idle connections in the pool", value=stats["free"])
+        yield GaugeMetricFamily("db_pool_max_size", "Pool size limit", value=stats["max_size"])
+        yield GaugeMetricFamily("db_pool_waiting", "Requests waiting for a connection", value=stats["waiting"])
+        yield SummaryMetricFamily(
+            "db_pool_acquire_wait_seconds", "Time spent waiting for a pooled connection",
+            count_value=self.database.acquire_count, sum_value=self.database.acquire_wait_total,
+        )
+        yield CounterMetricFamily(
+            "db_pool_acquire_timeouts", "Connection requests that timed out",
+            value=stats["acquire_timeouts"],
+        )
+
+        requests = CounterMetricFamily("cache_requests", "Cache lookups by result", labels=["cache", "result"])
+        entries = GaugeMetricFamily("cache_entries", "Entries held in the cache", labels=["cache"])
+        for name, cache in self.caches.items():
+            requests.add_metric([name, "hit"], cache.hits)
+            requests.add_metric([name, "miss"], cache.misses)
+            entries.add_metric([name], len(cache))
+        yield requests
+        yield entries
+
+        yield GaugeMetricFamily(
+            "password_hash_in_flight", "bcrypt jobs running or queued",
+            value=self.password_executor.in_flight,
+        )
+        yield CounterMetricFamily(
+            "password_hash_rejected", "Requests turned away because the bcrypt pool was full",
+            value=self.password_executor.rejected,
+        )
+
+
+async def metrics_endpoint(request):
+    return Response(generate_latest(scrape_registry), media_type=CONTENT_TYPE_LATEST)
+
+
+def instrument(app, database, caches, password_executor):
+    global scrape_registry
+    if not METRICS_ENABLED:
+        return
+    scrape_registry = REGISTRY
+    if MULTIPROCESS:
+        from prometheus_client import multiprocess
+        scrape_registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(scrape_registry)
+    app.add_middleware(MetricsMiddleware)
+    app.add_route("/metrics", metrics_endpoint, include_in_schema=False)
+    database.query_loggers.append(log_query)
+    scrape_registry.register(StatsCollector(database, caches, password_executor))
@@ -0,0 +1,130 @@
+import argparse
+import asyncio
+import os
+import re
+
+from database import database
+
+# Versioned schema migrations. Each migrations/NNNN_name.sql file runs once, in
+# its own transaction, and is recorded in schema_migrations. An advisory lock
+# serialises runners, so every worker can call apply_migrations at startup.
+#
+# A migration whose file has a "-- requires: <SQL condition>" line is skipped
+# while the condition is false, and the ones after it still apply; it runs on
+# the first start (or `python migrate.py`) that finds the condition true. Later
+# migrations must not depend on such a migration.
+#
+#   python migrate.py            # apply pending migrations
+#   python migrate.py status     # list applied and pending migrations
+#   python migrate.py --target 9 # apply pending migrations up to 0009
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+MIGRATION_FILE = re.compile(r"^(\d+)_(\w+)\.sql$")
+MIGRATION_LOCK_ID = 7_201_104  # arbitrary, shared by all runners
+MIGRATION_REQUIRES = re.compile(r"^-- requires: (.+)$", re.MULTILINE)
+
+CREATE_MIGRATIONS_TABLE = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+
+def load_migrations(directory=MIGRATIONS_DIR):
+    migrations = []
+    for filename in sorted(os.listdir(directory)):
+        match = MIGRATION_FILE.match(filename)
+        if not match:
+            continue
+        with open(os.path.join(directory, filename), encoding="utf-8") as f:
+            migrations.append((int(match.group(1)), match.group(2), f.read()))
+    versions = [version for version, _, _ in migrations]
+    if len(versions) != len(set(versions)):
+        raise RuntimeError(f"Duplicate migration versions in {directory}")
+    return migrations
+
+
+async def applied_versions(connection):
+    await connection.execute(CREATE_MIGRATIONS_TABLE)
+    rows = await connection.fetch("SELECT version FROM schema_migrations")
+    return {row["version"] for row in rows}
+
+
+async def unmet_requirement(connection, sql):
+    # The migration's "-- requires:" condition if it is not met yet, else None
+    match = MIGRATION_REQUIRES.search(sql)
+    if match is None or await connection.fetchval(f"SELECT {match.group(1)}"):
+        return None
+    return match.group(1)
+
+
+def print_notice(connection, message):
+    # Migrations report what they changed (e.g. rows moved) with RAISE NOTICE
+    print(f"  {message.message}")
+
+
+async def apply_migrations(connection, migrations=None):
+    migrations = load_migrations() if migrations is None else migrations
+    applied = []
+    await connection.execute("SELECT pg_advisory_lock($1)", MIGRATION_LOCK_ID)
+    try:
+        done = await applied_versions(connection)
+        for version, name, sql in migrations:
+            if version in done:
+                continue
+            requirement = await unmet_requirement(connection, sql)
+            if requirement is not None:
+                print(f"Waiting to apply migration {version:04d}_{name} until {requirement}")
+                continue
+            async with connection.transaction():
+                connection.add_log_listener(print_notice)
+                try:
+                    await connection.execute(sql)
+                finally:
+                    connection.remove_log_listener(print_notice)
+                await connection.execute(
+                    "INSERT INTO schema_migrations (version, name) VALUES ($1, $2)", version, name
+                )
+            print(f"Applied migration {version:04d}_{name}")
+            applied.append(version)
+    finally:
+        await connection.execute("SELECT pg_advisory_unlock($1)", MIGRATION_LOCK_ID)
+    return applied
+
+
+async def run(args):
+    await database.connect()
+    try:
+        async with database.acquire() as connection:
+            if args.command == "status":
+                done = await applied_versions(connection)
+                pending_before = False
+                for version, name, sql in load_migrations():
+                    state = "applied" if version in done else "pending"
+                    # A requirement may refer to tables an earlier pending migration creates
+                    if version not in done and not pending_before:
+                        requirement = await unmet_requirement(connection, sql)
+                        if requirement is not None:
+                            state = f"waiting until {requirement}"
+                    pending_before = pending_before or version not in done
+                    print(f"{version:04d}_{name}: {state}")
+            else:
+                migrations = [m for m in load_migrations() if args.target is None or m[0] <= args.target]
+                applied = await apply_migrations(connection, migrations)
+                if not applied and {m[0] for m in migrations} <= await applied_versions(connection):
+                    print("Database schema is up to date")
+    finally:
+        await database.disconnect()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply database schema migrations")
+    parser.add_argument("command", nargs="?", choices=["up", "status"], default="up")
+    parser.add_argument("--target", type=int, help="stop after this migration version")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
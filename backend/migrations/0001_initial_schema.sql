@@ -1,3 +1,5 @@
+-- Base tables. IF NOT EXISTS lets this adopt databases created by the old init.sql.
+
 -- Create the users table
 CREATE TABLE IF NOT EXISTS users (
     id SERIAL PRIMARY KEY,
@@ -28,12 +30,3 @@ CREATE TABLE IF NOT EXISTS goals (
     start_weight NUMERIC(5, 2) NOT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
-
--- Insert sample data idempotently
-INSERT INTO users (username, password_hash, email, height, age)
-SELECT 'johndoe', '$2b$12$mcHG8wpkKfssUh.67.U5sOnbhE827gW6hs8KmiS/1VNBZ8gRUNnx.', 'john@example.com', 175.0, 30
-WHERE NOT EXISTS (SELECT 1 FROM users WHERE username = 'johndoe');
-
-INSERT INTO weight_measurements (user_id, measurement_date, weight, notes)
-SELECT 1, '2024-11-11', 70.5, 'Morning weight'
-WHERE NOT EXISTS (SELECT 1 FROM weight_measurements WHERE user_id = 1 AND measurement_date = '2024-11-11');
@@ -0,0 +1,163 @@
+-- Per-user running statistics for /trends, kept in sync by statement-level
+-- triggers on weight_measurements. x is the day number since 2000-01-01 and y
+-- the weight, so the regression slope follows from the sums in O(1).
+CREATE TABLE IF NOT EXISTS user_weight_stats (
+    user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    measurement_count BIGINT NOT NULL DEFAULT 0,
+    sum_x NUMERIC NOT NULL DEFAULT 0,
+    sum_y NUMERIC NOT NULL DEFAULT 0,
+    sum_xx NUMERIC NOT NULL DEFAULT 0,
+    sum_xy NUMERIC NOT NULL DEFAULT 0,
+    sum_yy NUMERIC NOT NULL DEFAULT 0,
+    first_date DATE,
+    last_date DATE,
+    latest_weight NUMERIC(5, 2),
+    weekly_average NUMERIC,
+    monthly_average NUMERIC,
+    current_streak INTEGER NOT NULL DEFAULT 0,
+    -- First day of the run of consecutive days ending at last_date; every
+    -- day in [streak_start, last_date] has a measurement, or this is NULL
+    streak_start DATE
+);
+
+-- Fields anchored at the first/last measurement cannot be maintained from
+-- deltas alone; they are recomputed with per-user index lookups instead.
+-- The streak walks back from last_date one day at a time, but jumps over the
+-- stored [streak_start, last_date] run in one step, so a write only costs the
+-- days it added. A NULL streak_start (a fresh row, a rebuild, or a delete of
+-- the streak's first day) walks the whole streak once.
+CREATE OR REPLACE FUNCTION refresh_user_weight_anchors(uid INTEGER) RETURNS VOID AS $$
+    UPDATE user_weight_stats s
+    SET first_date = a.first_date,
+        last_date = a.last_date,
+        latest_weight = a.latest_weight,
+        weekly_average = a.weekly_average,
+        monthly_average = a.monthly_average,
+        streak_start = a.streak_start,
+        current_streak = coalesce(a.last_date - a.streak_start + 1, 0)
+    FROM (
+        SELECT
+            b.first_date,
+            b.last_date,
+            (SELECT weight FROM weight_measurements
+             WHERE user_id = uid
+             ORDER BY measurement_date DESC, id DESC LIMIT 1) AS latest_weight,
+            (SELECT avg(weight) FROM weight_measurements
+             WHERE user_id = uid AND measurement_date > b.last_date - 7) AS weekly_average,
+            (SELECT avg(weight) FROM weight_measurements
+             WHERE user_id = uid AND measurement_date > b.last_date - 30) AS monthly_average,
+            (WITH RECURSIVE walk(d) AS (
+                SELECT CASE WHEN b.last_date = k.known_end THEN k.known_start ELSE b.last_date END
+                WHERE b.last_date IS NOT NULL
+                UNION ALL
+                SELECT CASE WHEN walk.d - 1 = k.known_end THEN k.known_start ELSE walk.d - 1 END
+                FROM walk
+                WHERE EXISTS (
+                    SELECT 1 FROM weight_measurements
+                    WHERE user_id = uid AND measurement_date = walk.d - 1
+                )
+            ) SELECT min(d) FROM walk) AS streak_start
+        FROM (
+            SELECT min(measurement_date) AS first_date, max(measurement_date) AS last_date
+            FROM weight_measurements
+            WHERE user_id = uid
+        ) b
+        CROSS JOIN (
+            -- The run stored by the previous refresh; inserts only extend it
+            SELECT streak_start AS known_start,
+                   CASE WHEN streak_start IS NOT NULL THEN last_date END AS known_end
+            FROM user_weight_stats
+            WHERE user_id = uid
+        ) k
+    ) a
+    WHERE s.user_id = uid;
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION user_weight_stats_apply() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        INSERT INTO user_weight_stats AS s (user_id, measurement_count, sum_x, sum_y, sum_xx, sum_xy, sum_yy)
+        SELECT user_id, -count(*), -sum(x), -sum(y), -sum(x * x), -sum(x * y), -sum(y * y)
+        FROM (SELECT user_id, measurement_date - DATE '2000-01-01' AS x, weight AS y FROM old_rows) o
+        GROUP BY user_id
+        ON CONFLICT (user_id) DO UPDATE SET
+            measurement_count = s.measurement_count + EXCLUDED.measurement_count,
+            sum_x = s.sum_x + EXCLUDED.sum_x,
+            sum_y = s.sum_y + EXCLUDED.sum_y,
+            sum_xx = s.sum_xx + EXCLUDED.sum_xx,
+            sum_xy = s.sum_xy + EXCLUDED.sum_xy,
+            sum_yy = s.sum_yy + EXCLUDED.sum_yy;
+
+        -- A day that lost its only measurement cuts the stored run short at
+        -- the earliest such day, so the refresh below only trusts what is left
+        UPDATE user_weight_stats s
+        SET last_date = g.gap - 1,
+            streak_start = CASE WHEN g.gap > s.streak_start THEN s.streak_start END
+        FROM (
+            SELECT o.user_id, min(o.measurement_date) AS gap
+            FROM old_rows o
+            JOIN user_weight_stats k
+              ON k.user_id = o.user_id AND o.measurement_date BETWEEN k.streak_start AND k.last_date
+            WHERE NOT EXISTS (
+                SELECT 1 FROM weight_measurements w
+                WHERE w.user_id = o.user_id AND w.measurement_date = o.measurement_date
+            )
+            GROUP BY o.user_id
+        ) g
+        WHERE s.user_id = g.user_id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO user_weight_stats AS s (user_id, measurement_count, sum_x, sum_y, sum_xx, sum_xy, sum_yy)
+        SELECT user_id, count(*), sum(x), sum(y), sum(x * x), sum(x * y), sum(y * y)
+        FROM (SELECT user_id, measurement_date - DATE '2000-01-01' AS x, weight AS y FROM new_rows) n
+        GROUP BY user_id
+        ON CONFLICT (user_id) DO UPDATE SET
+            measurement_count = s.measurement_count + EXCLUDED.measurement_count,
+            sum_x = s.sum_x + EXCLUDED.sum_x,
+            sum_y = s.sum_y + EXCLUDED.sum_y,
+            sum_xx = s.sum_xx + EXCLUDED.sum_xx,
+            sum_xy = s.sum_xy + EXCLUDED.sum_xy,
+            sum_yy = s.sum_yy + EXCLUDED.sum_yy;
+    END IF;
+
+    IF TG_OP = 'INSERT' THEN
+        PERFORM refresh_user_weight_anchors(user_id) FROM (SELECT DISTINCT user_id FROM new_rows) u;
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM refresh_user_weight_anchors(user_id) FROM (SELECT DISTINCT user_id FROM old_rows) u;
+    ELSE
+        PERFORM refresh_user_weight_anchors(user_id)
+        FROM (SELECT user_id FROM old_rows UNION SELECT user_id FROM new_rows) u;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER weight_measurements_stats_insert
+    AFTER INSERT ON weight_measurements
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION user_weight_stats_apply();
+
+CREATE OR REPLACE TRIGGER weight_measurements_stats_update
+    AFTER UPDATE ON weight_measurements
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION user_weight_stats_apply();
+
+CREATE OR REPLACE TRIGGER weight_measurements_stats_delete
+    AFTER DELETE ON weight_measurements
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION user_weight_stats_apply();
+
+-- Backfill from existing measurements (same as weight_stats.py rebuild)
+INSERT INTO user_weight_stats AS s (user_id, measurement_count, sum_x, sum_y, sum_xx, sum_xy, sum_yy)
+SELECT user_id, count(*), sum(x), sum(y), sum(x * x), sum(x * y), sum(y * y)
+FROM (SELECT user_id, measurement_date - DATE '2000-01-01' AS x, weight AS y FROM weight_measurements) w
+GROUP BY user_id
+ON CONFLICT (user_id) DO UPDATE SET
+    measurement_count = EXCLUDED.measurement_count,
+    sum_x = EXCLUDED.sum_x,
+    sum_y = EXCLUDED.sum_y,
+    sum_xx = EXCLUDED.sum_xx,
+    sum_xy = EXCLUDED.sum_xy,
+    sum_yy = EXCLUDED.sum_yy;
+
+SELECT refresh_user_weight_anchors(user_id) FROM user_weight_stats;
@@ -0,0 +1,10 @@
+-- Seed a demo user and measurement if they are missing
+INSERT INTO users (username, password_hash, email, height, age)
+SELECT 'johndoe', '$2b$12$mcHG8wpkKfssUh.67.U5sOnbhE827gW6hs8KmiS/1VNBZ8gRUNnx.', 'john@example.com', 175.0, 30
+WHERE NOT EXISTS (SELECT 1 FROM users WHERE username = 'johndoe');
+
+INSERT INTO weight_measurements (user_id, measurement_date, weight, notes)
+SELECT u.id, '2024-11-11', 70.5, 'Morning weight'
+FROM users u
+WHERE u.username = 'johndoe'
+  AND NOT EXISTS (SELECT 1 FROM weight_measurements w WHERE w.user_id = u.id AND w.measurement_date = '2024-11-11');
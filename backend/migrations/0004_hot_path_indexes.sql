@@ -0,0 +1,40 @@
+-- Indexes for the per-user hot paths: measurements by date (listings, trends,
+-- export, import dedup) and goals by target date.
+
+-- Earlier imports and same-day entries could store several readings for one
+-- day. Keep the most recent so (user_id, measurement_date) can be unique and
+-- ON CONFLICT DO NOTHING in the import actually deduplicates. The older
+-- readings are kept in weight_measurements_duplicates for review, and the
+-- count is reported by migrate.py.
+CREATE TABLE IF NOT EXISTS weight_measurements_duplicates (
+    LIKE weight_measurements,
+    removed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+DO $$
+DECLARE
+    removed BIGINT;
+BEGIN
+    WITH deleted AS (
+        DELETE FROM weight_measurements w
+        USING weight_measurements newer
+        WHERE newer.user_id = w.user_id
+          AND newer.measurement_date = w.measurement_date
+          AND newer.id > w.id
+        RETURNING w.id, w.user_id, w.measurement_date, w.weight, w.notes, w.created_at
+    )
+    INSERT INTO weight_measurements_duplicates (id, user_id, measurement_date, weight, notes, created_at)
+    SELECT * FROM deleted;
+    GET DIAGNOSTICS removed = ROW_COUNT;
+    IF removed > 0 THEN
+        RAISE NOTICE 'Moved % same-day duplicate reading(s) to weight_measurements_duplicates', removed;
+    END IF;
+END
+$$;
+
+-- INCLUDE (weight) lets the trends queries run as index-only scans
+CREATE UNIQUE INDEX IF NOT EXISTS weight_measurements_user_date_key
+    ON weight_measurements (user_id, measurement_date) INCLUDE (weight);
+
+CREATE INDEX IF NOT EXISTS goals_user_target_date_idx
+    ON goals (user_id, target_date);
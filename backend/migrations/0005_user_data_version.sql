@@ -0,0 +1,51 @@
+-- Per-user data version for conditional GETs: any write to a user's
+-- measurements or goals bumps users.data_version, and read endpoints derive
+-- their ETag from it. Statement-level triggers cover every write path (single
+-- writes, CSV import, maintenance SQL) with one UPDATE per statement.
+ALTER TABLE users ADD COLUMN IF NOT EXISTS data_version BIGINT NOT NULL DEFAULT 0;
+
+CREATE OR REPLACE FUNCTION bump_user_data_version() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE users SET data_version = data_version + 1
+        WHERE id IN (SELECT user_id FROM new_rows);
+    ELSIF TG_OP = 'DELETE' THEN
+        UPDATE users SET data_version = data_version + 1
+        WHERE id IN (SELECT user_id FROM old_rows);
+    ELSE
+        UPDATE users SET data_version = data_version + 1
+        WHERE id IN (SELECT user_id FROM old_rows UNION SELECT user_id FROM new_rows);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER weight_measurements_version_insert
+    AFTER INSERT ON weight_measurements
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_user_data_version();
+
+CREATE OR REPLACE TRIGGER weight_measurements_version_update
+    AFTER UPDATE ON weight_measurements
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_user_data_version();
+
+CREATE OR REPLACE TRIGGER weight_measurements_version_delete
+    AFTER DELETE ON weight_measurements
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_user_data_version();
+
+CREATE OR REPLACE TRIGGER goals_version_insert
+    AFTER INSERT ON goals
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_user_data_version();
+
+CREATE OR REPLACE TRIGGER goals_version_update
+    AFTER UPDATE ON goals
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_user_data_version();
+
+CREATE OR REPLACE TRIGGER goals_version_delete
+    AFTER DELETE ON goals
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_user_data_version();
@@ -0,0 +1,30 @@
+-- Cross-worker cache invalidation (see invalidation.py): every change to a
+-- users row sends a NOTIFY on the user_changes channel. That includes the
+-- data_version bumps from migration 0005, so measurement and goal writes are
+-- announced too. Notifications are only delivered once the transaction
+-- commits. "profile" tells listeners whether the cached user fields changed.
+CREATE OR REPLACE FUNCTION notify_user_change() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('user_changes', json_build_object(
+            'id', OLD.id,
+            'username', OLD.username,
+            'data_version', NULL,
+            'profile', true
+        )::text);
+    ELSE
+        PERFORM pg_notify('user_changes', json_build_object(
+            'id', NEW.id,
+            'username', OLD.username,
+            'data_version', NEW.data_version,
+            'profile', (OLD.username, OLD.email, OLD.height, OLD.age)
+                IS DISTINCT FROM (NEW.username, NEW.email, NEW.height, NEW.age)
+        )::text);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER users_notify_change
+    AFTER UPDATE OR DELETE ON users
+    FOR EACH ROW EXECUTE FUNCTION notify_user_change();
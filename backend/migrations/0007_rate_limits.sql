@@ -0,0 +1,8 @@
+-- Token buckets for RATE_LIMIT_STORE=postgres (see admission.py), one row per
+-- limit and client key. UNLOGGED: the rows are rewritten on every checked
+-- request and losing them in a crash only refills the buckets.
+CREATE UNLOGGED TABLE IF NOT EXISTS rate_limits (
+    key TEXT PRIMARY KEY,
+    tokens DOUBLE PRECISION NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL
+);
@@ -0,0 +1,27 @@
+-- Background imports and exports (see jobs.py). Workers claim queued rows with
+-- FOR UPDATE SKIP LOCKED, so any number of processes can share the queue
+-- without a broker. A running job whose heartbeat stops (worker killed) is
+-- claimed again once it is stale. The uploaded CSV is kept in input until the
+-- job finishes; an export's file stays in output until the job is pruned.
+CREATE TABLE IF NOT EXISTS jobs (
+    id BIGSERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    kind TEXT NOT NULL CHECK (kind IN ('import', 'export')),
+    status TEXT NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'running', 'succeeded', 'failed')),
+    params JSONB NOT NULL DEFAULT '{}',
+    input BYTEA,
+    output BYTEA,
+    result JSONB,
+    error TEXT,
+    rows_processed INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMPTZ,
+    heartbeat_at TIMESTAMPTZ,
+    finished_at TIMESTAMPTZ
+);
+
+-- The claim query only looks at unfinished jobs, oldest first
+CREATE INDEX IF NOT EXISTS jobs_pending_idx ON jobs (id) WHERE status IN ('queued', 'running');
+CREATE INDEX IF NOT EXISTS jobs_user_id_idx ON jobs (user_id, id);
+CREATE INDEX IF NOT EXISTS jobs_finished_at_idx ON jobs (finished_at) WHERE finished_at IS NOT NULL;
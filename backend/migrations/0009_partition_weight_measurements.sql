@@ -0,0 +1,127 @@
+-- Step 1 of moving weight_measurements to a table partitioned by year of
+-- measurement_date (see partitions.py). Only the current and recent years
+-- take writes, so autovacuum and index maintenance stay on small partitions
+-- while older years are frozen once and left alone, or archived.
+--
+-- This creates the partitioned table next to the current one and a trigger
+-- that mirrors every write into it. `python partitions.py backfill` then
+-- copies the existing rows in small batches while the app keeps serving, and
+-- migration 0010 swaps the tables once the backfill is done. A small table is
+-- copied here, so new installs take both at once.
+
+CREATE TABLE IF NOT EXISTS weight_measurements_partitioned (
+    id INTEGER NOT NULL DEFAULT nextval('weight_measurements_id_seq'),
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    measurement_date DATE NOT NULL,
+    weight NUMERIC(5, 2) NOT NULL,
+    notes TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    -- Unique constraints must include the partition key, so id alone is no
+    -- longer enforced unique; ids still come from the one sequence
+    CONSTRAINT weight_measurements_partitioned_pkey PRIMARY KEY (id, measurement_date)
+) PARTITION BY RANGE (measurement_date);
+
+CREATE UNIQUE INDEX IF NOT EXISTS weight_measurements_partitioned_user_date_key
+    ON weight_measurements_partitioned (user_id, measurement_date) INCLUDE (weight);
+
+-- A few pages per year partition; serves date-range scans across users
+-- (archival, maintenance) without the size of a btree
+CREATE INDEX IF NOT EXISTS weight_measurements_partitioned_date_brin
+    ON weight_measurements_partitioned USING brin (measurement_date);
+
+-- Readings outside every yearly partition (far past or future dates)
+CREATE TABLE IF NOT EXISTS weight_measurements_default
+    PARTITION OF weight_measurements_partitioned DEFAULT;
+
+-- Creates the partition for one calendar year, named weight_measurements_yYYYY,
+-- with indexes named after it. Readings for that year already in the default
+-- partition move into it first. Safe to call concurrently and repeatedly.
+CREATE OR REPLACE FUNCTION create_weight_measurements_partition(year INTEGER) RETURNS TEXT AS $$
+DECLARE
+    parent REGCLASS := coalesce(to_regclass('weight_measurements_partitioned'), 'weight_measurements'::regclass);
+    partition TEXT := format('weight_measurements_y%s', year);
+    lower_bound DATE := make_date(year, 1, 1);
+    upper_bound DATE := make_date(year + 1, 1, 1);
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('create_weight_measurements_partition'));
+    IF to_regclass(partition) IS NOT NULL THEN
+        RETURN partition;
+    END IF;
+    EXECUTE format('CREATE TABLE %I (LIKE %s INCLUDING DEFAULTS)', partition, parent);
+    EXECUTE format('ALTER TABLE %I ADD CONSTRAINT %I PRIMARY KEY (id, measurement_date)', partition, partition || '_pkey');
+    EXECUTE format(
+        'CREATE UNIQUE INDEX %I ON %I (user_id, measurement_date) INCLUDE (weight)', partition || '_user_date_key', partition
+    );
+    EXECUTE format('CREATE INDEX %I ON %I USING brin (measurement_date)', partition || '_date_brin', partition);
+    EXECUTE format(
+        'WITH moved AS (DELETE FROM weight_measurements_default WHERE measurement_date >= $1 AND measurement_date < $2 RETURNING *) '
+        'INSERT INTO %I SELECT * FROM moved',
+        partition
+    ) USING lower_bound, upper_bound;
+    EXECUTE format(
+        'ALTER TABLE %s ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)', parent, partition, lower_bound, upper_bound
+    );
+    RETURN partition;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Only years that hold readings, plus this and next year; partitions.py
+-- ensure (run at startup) keeps adding the coming years. Every per-user
+-- query without a date bound visits each partition, so empty years stay in
+-- the default partition rather than costing an index scan each. This reads
+-- the whole table, before the trigger below starts blocking writes.
+SELECT create_weight_measurements_partition(year)
+FROM (
+    SELECT DISTINCT extract(year FROM measurement_date)::int AS year FROM weight_measurements
+    UNION
+    SELECT extract(year FROM CURRENT_DATE)::int + ahead FROM generate_series(0, 1) AS ahead
+) years
+ORDER BY year;
+
+-- Mirror every write on the current table until 0010 swaps the tables. An
+-- update deletes the old version and upserts the new one, so it also
+-- covers rows that move to another date (and partition).
+CREATE OR REPLACE FUNCTION mirror_weight_measurement() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        DELETE FROM weight_measurements_partitioned
+        WHERE id = OLD.id AND measurement_date = OLD.measurement_date;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO weight_measurements_partitioned (id, user_id, measurement_date, weight, notes, created_at)
+        VALUES (NEW.id, NEW.user_id, NEW.measurement_date, NEW.weight, NEW.notes, NEW.created_at)
+        ON CONFLICT (user_id, measurement_date) DO UPDATE
+            SET id = EXCLUDED.id, weight = EXCLUDED.weight, notes = EXCLUDED.notes, created_at = EXCLUDED.created_at;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER weight_measurements_mirror
+    AFTER INSERT OR UPDATE OR DELETE ON weight_measurements
+    FOR EACH ROW EXECUTE FUNCTION mirror_weight_measurement();
+
+-- Backfill progress: rows with id <= until_id existed before the trigger and
+-- are copied by the backfill; later ones are mirrored
+CREATE TABLE IF NOT EXISTS weight_measurements_backfill (
+    singleton BOOLEAN PRIMARY KEY DEFAULT true CHECK (singleton),
+    last_id INTEGER NOT NULL DEFAULT 0,
+    until_id INTEGER NOT NULL
+);
+
+INSERT INTO weight_measurements_backfill (until_id)
+SELECT coalesce(max(id), 0) FROM weight_measurements
+ON CONFLICT DO NOTHING;
+
+-- A small table (ids up to 10000, e.g. a new install with the demo user) is
+-- copied right here: the trigger above keeps writers waiting until this
+-- commits anyway, and 0010 can then follow at the same startup
+DO $$
+BEGIN
+    IF (SELECT until_id <= 10000 FROM weight_measurements_backfill) THEN
+        INSERT INTO weight_measurements_partitioned (id, user_id, measurement_date, weight, notes, created_at)
+        SELECT id, user_id, measurement_date, weight, notes, created_at FROM weight_measurements
+        ON CONFLICT DO NOTHING;
+        UPDATE weight_measurements_backfill SET last_id = until_id;
+    END IF;
+END $$;
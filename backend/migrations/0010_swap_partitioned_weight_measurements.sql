@@ -0,0 +1,54 @@
+-- Step 2 (see 0009): swap in the partitioned table. Copying the old rows
+-- here would block writers for a whole-table copy, so this waits (see
+-- migrate.py) until `python partitions.py backfill` has copied them; every
+-- row written since 0009 is already mirrored. The swap itself only holds its
+-- locks for the DROP and RENAMEs.
+-- requires: (SELECT last_id >= until_id FROM weight_measurements_backfill)
+LOCK TABLE weight_measurements IN EXCLUSIVE MODE;
+
+-- The sequence outlives the old table
+ALTER SEQUENCE weight_measurements_id_seq OWNED BY weight_measurements_partitioned.id;
+DROP TABLE weight_measurements;
+DROP TABLE weight_measurements_backfill;
+DROP FUNCTION mirror_weight_measurement();
+
+ALTER TABLE weight_measurements_partitioned RENAME TO weight_measurements;
+ALTER INDEX weight_measurements_partitioned_pkey RENAME TO weight_measurements_pkey;
+ALTER INDEX weight_measurements_partitioned_user_date_key RENAME TO weight_measurements_user_date_key;
+ALTER INDEX weight_measurements_partitioned_date_brin RENAME TO weight_measurements_date_brin;
+ALTER TABLE weight_measurements
+    RENAME CONSTRAINT weight_measurements_partitioned_user_id_fkey TO weight_measurements_user_id_fkey;
+
+-- The statement-level triggers from 0002 and 0005 went with the old table.
+-- On the partitioned table they fire once per statement for all partitions.
+CREATE TRIGGER weight_measurements_stats_insert
+    AFTER INSERT ON weight_measurements
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION user_weight_stats_apply();
+
+CREATE TRIGGER weight_measurements_stats_update
+    AFTER UPDATE ON weight_measurements
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION user_weight_stats_apply();
+
+CREATE TRIGGER weight_measurements_stats_delete
+    AFTER DELETE ON weight_measurements
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION user_weight_stats_apply();
+
+CREATE TRIGGER weight_measurements_version_insert
+    AFTER INSERT ON weight_measurements
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_user_data_version();
+
+CREATE TRIGGER weight_measurements_version_update
+    AFTER UPDATE ON weight_measurements
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_user_data_version();
+
+CREATE TRIGGER weight_measurements_version_delete
+    AFTER DELETE ON weight_measurements
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_user_data_version();
+
+ANALYZE weight_measurements;
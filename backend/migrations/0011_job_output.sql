@@ -0,0 +1,15 @@
+-- An export job's file, in the chunks the exporter produced (see jobs.py).
+-- The worker inserts them as it goes and /jobs/{id}/result streams them back,
+-- so neither side holds the whole file; jobs.output held it in one value.
+CREATE TABLE IF NOT EXISTS job_output (
+    job_id BIGINT NOT NULL REFERENCES jobs(id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    data BYTEA NOT NULL,
+    PRIMARY KEY (job_id, seq)
+);
+
+INSERT INTO job_output (job_id, seq, data)
+SELECT id, 0, output FROM jobs WHERE output IS NOT NULL AND output <> ''
+ON CONFLICT DO NOTHING;
+
+ALTER TABLE jobs DROP COLUMN IF EXISTS output;
@@ -0,0 +1,33 @@
+import datetime
+
+# Keyset cursors for measurement listings. A cursor is "YYYY-MM-DD:<id>", the
+# (measurement_date, id) of the last row on a page. A bare "YYYY-MM-DD" is also
+# accepted and bounds the listing by date alone.
+
+MAX_ID = 2 ** 31 - 1  # ids are SERIAL
+
+
+def parse_cursor(value, bare_date_id):
+    # bare_date_id fills in the id for a date-only cursor: 0 makes "before"
+    # exclude the whole day, MAX_ID does the same for "after"
+    date_text, _, id_text = value.partition(":")
+    try:
+        cursor_date = datetime.date.fromisoformat(date_text)
+        cursor_id = int(id_text) if id_text else bare_date_id
+    except ValueError:
+        raise ValueError(f"Invalid cursor: {value!r}")
+    return cursor_date, cursor_id
+
+
+def format_cursor(row):
+    return f"{row['measurement_date'].isoformat()}:{row['id']}"
+
+
+def parse_fields(value, allowed):
+    if not value:
+        return list(allowed)
+    fields = [field.strip() for field in value.split(",") if field.strip()]
+    unknown = [field for field in fields if field not in allowed]
+    if unknown or not fields:
+        raise ValueError(f"Invalid fields {value!r}; choose from {', '.join(allowed)}")
+    return fields
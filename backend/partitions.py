@@ -0,0 +1,183 @@
+import argparse
+import asyncio
+import datetime
+import os
+import re
+import time
+
+from database import database
+
+# Maintenance for the partitioned weight_measurements table (migrations 0009
+# and 0010): one partition per calendar year, weight_measurements_yYYYY, plus
+# weight_measurements_default for dates outside them.
+#
+#   python partitions.py status
+#   python partitions.py ensure                       # also run at startup
+#   python partitions.py backfill [--batch-size N]    # between 0009 and 0010
+#   python partitions.py archive --before 2020 [--tablespace cold] [--detach]
+#
+# archive handles cold years: it freezes their partitions so autovacuum has no
+# reason to visit them again and can move them to a cheaper tablespace; both
+# keep the readings available. --detach also moves the partitions out of the
+# table into the archive schema, after which the API no longer returns those
+# readings; run `python weight_stats.py rebuild` afterwards so /trends agrees.
+
+PARTITION_YEARS_AHEAD = int(os.getenv("PARTITION_YEARS_AHEAD", "1"))
+ARCHIVE_SCHEMA = "archive"
+YEARLY_PARTITION = re.compile(r"^weight_measurements_y(\d{4})$")
+
+ENSURE_PARTITIONS_QUERY = """
+    SELECT create_weight_measurements_partition(year::int)
+    FROM generate_series(
+        extract(year FROM CURRENT_DATE)::int, extract(year FROM CURRENT_DATE)::int + $1
+    ) AS year
+"""
+
+PARTITIONS_QUERY = """
+    SELECT c.relname AS name,
+           pg_get_expr(c.relpartbound, c.oid) AS bounds,
+           c.reltuples::bigint AS estimated_rows,
+           pg_total_relation_size(c.oid) AS bytes,
+           coalesce(t.spcname, 'pg_default') AS tablespace,
+           s.n_dead_tup AS dead_rows,
+           greatest(s.last_vacuum, s.last_autovacuum) AS last_vacuum,
+           age(c.relfrozenxid) AS xid_age
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    LEFT JOIN pg_tablespace t ON t.oid = c.reltablespace
+    LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+    WHERE i.inhparent = 'weight_measurements'::regclass
+    ORDER BY c.relname
+"""
+
+# Copies the next batch of pre-existing rows. FOR SHARE makes a concurrent
+# update or delete of those rows wait for the copy, so its mirror trigger
+# (0009) sees the copied row instead of racing with it.
+BACKFILL_BATCH_QUERY = """
+    WITH state AS (
+        SELECT last_id, until_id FROM weight_measurements_backfill FOR UPDATE
+    ), batch AS (
+        SELECT w.id, w.user_id, w.measurement_date, w.weight, w.notes, w.created_at
+        FROM weight_measurements w, state
+        WHERE w.id > state.last_id AND w.id <= state.until_id
+        ORDER BY w.id
+        LIMIT $1
+        FOR SHARE OF w
+    ), copied AS (
+        INSERT INTO weight_measurements_partitioned (id, user_id, measurement_date, weight, notes, created_at)
+        SELECT * FROM batch
+        ON CONFLICT DO NOTHING
+    )
+    UPDATE weight_measurements_backfill
+    SET last_id = coalesce((SELECT max(id) FROM batch), until_id)
+    RETURNING last_id, until_id
+"""
+
+
+def quote(identifier):
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+async def has_function(connection):
+    return await connection.fetchval(
+        "SELECT to_regprocedure('create_weight_measurements_partition(integer)') IS NOT NULL"
+    )
+
+
+async def ensure(connection, years_ahead=PARTITION_YEARS_AHEAD):
+    # Creates this year's partition and the next years_ahead ones if missing
+    if not await has_function(connection):
+        return []
+    return [row[0] for row in await connection.fetch(ENSURE_PARTITIONS_QUERY, years_ahead)]
+
+
+async def backfill(connection, batch_size=5000, pause=0.0):
+    if await connection.fetchval("SELECT to_regclass('weight_measurements_backfill')") is None:
+        print("Nothing to backfill: weight_measurements is not being partitioned (see migrations 0009/0010)")
+        return 0
+    while True:
+        start = time.perf_counter()
+        row = await connection.fetchrow(BACKFILL_BATCH_QUERY, batch_size)
+        print(f"Copied ids up to {row['last_id']} of {row['until_id']} ({time.perf_counter() - start:.2f}s)")
+        if row["last_id"] >= row["until_id"]:
+            return row["last_id"]
+        if pause:
+            # Leaves room for the app's queries between batches
+            await asyncio.sleep(pause)
+
+
+async def archive(connection, before, tablespace=None, detach=False):
+    if before > datetime.date.today().year:
+        raise ValueError("Only years before the current one can be archived")
+    archived = []
+    for partition in await connection.fetch(PARTITIONS_QUERY):
+        match = YEARLY_PARTITION.match(partition["name"])
+        if not match or int(match.group(1)) >= before:
+            continue
+        name = quote(partition["name"])
+        # Every row is frozen and all pages marked all-visible, so later
+        # vacuums skip the partition; it only costs again when it is written
+        await connection.execute(f"VACUUM (FREEZE, ANALYZE) {name}")
+        if tablespace:
+            await connection.execute(f"ALTER TABLE {name} SET TABLESPACE {quote(tablespace)}")
+            for index in await connection.fetch(
+                "SELECT indexrelid::regclass::text AS name FROM pg_index WHERE indrelid = $1::regclass",
+                partition["name"],
+            ):
+                await connection.execute(f"ALTER INDEX {index['name']} SET TABLESPACE {quote(tablespace)}")
+        if detach:
+            async with connection.transaction():
+                await connection.execute(f"CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA}")
+                await connection.execute(f"ALTER TABLE weight_measurements DETACH PARTITION {name}")
+                # Archived readings must not stop users from being deleted
+                for constraint in await connection.fetch(
+                    "SELECT conname FROM pg_constraint WHERE conrelid = $1::regclass AND contype = 'f'",
+                    partition["name"],
+                ):
+                    await connection.execute(f"ALTER TABLE {name} DROP CONSTRAINT {quote(constraint['conname'])}")
+                await connection.execute(f"ALTER TABLE {name} SET SCHEMA {ARCHIVE_SCHEMA}")
+        archived.append(partition["name"])
+    return archived
+
+
+async def run(args):
+    await database.connect()
+    try:
+        async with database.acquire() as connection:
+            if args.command == "ensure":
+                created = await ensure(connection, args.years_ahead)
+                print(f"Partitions present: {', '.join(created) or 'none (migration 0009 not applied)'}")
+            elif args.command == "backfill":
+                await backfill(connection, args.batch_size, args.pause)
+            elif args.command == "archive":
+                archived = await archive(connection, args.before, args.tablespace, args.detach)
+                print(f"Archived {len(archived)} partition(s): {', '.join(archived)}")
+            else:
+                for partition in await connection.fetch(PARTITIONS_QUERY):
+                    print(
+                        f"{partition['name']:<30} {partition['bounds']:<58} ~{max(partition['estimated_rows'], 0):>11} rows "
+                        f"{partition['bytes'] / 2**20:9.1f} MiB  dead={partition['dead_rows']}  "
+                        f"xid_age={partition['xid_age']}  {partition['tablespace']}"
+                    )
+    finally:
+        await database.disconnect()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the yearly partitions of weight_measurements")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    subcommands.add_parser("status", help="list partitions with size, dead rows and freeze age")
+    ensure_parser = subcommands.add_parser("ensure", help="create the partitions for this and coming years")
+    ensure_parser.add_argument("--years-ahead", type=int, default=PARTITION_YEARS_AHEAD)
+    backfill_parser = subcommands.add_parser("backfill", help="copy existing rows into the partitioned table")
+    backfill_parser.add_argument("--batch-size", type=int, default=5000)
+    backfill_parser.add_argument("--pause", type=float, default=0.0, help="seconds to sleep between batches")
+    archive_parser = subcommands.add_parser("archive", help="freeze, move or detach the partitions of cold years")
+    archive_parser.add_argument("--before", type=int, required=True, help="archive years before this one")
+    archive_parser.add_argument("--tablespace", help="move the partitions and their indexes here")
+    archive_parser.add_argument("--detach", action="store_true", help="move the partitions to the archive schema")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException
+import metrics
+
+# bcrypt is deliberately slow, so hashing runs on a small dedicated thread pool
+# (bcrypt releases the GIL) instead of blocking the event loop. Once the pool
+# and its queue are full, new requests are turned away immediately with a 503.
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_QUEUE = int(os.getenv("PASSWORD_HASH_QUEUE", str(PASSWORD_HASH_WORKERS * 4)))
+
+# Hashes made with a different cost are reported by verify_and_update, which
+# lets login rehash them transparently. passlib is imported on first use so
+# workers that never hash a password do not load it.
+pwd_context = None
+
+
+def password_context():
+    global pwd_context
+    if pwd_context is None:
+        from passlib.context import CryptContext
+        pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+    return pwd_context
+
+
+class BoundedExecutor:
+    def __init__(self, workers, queue_limit, thread_name_prefix="bcrypt"):
+        self.limit = workers + queue_limit
+        self.in_flight = 0
+        self.rejected = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=thread_name_prefix)
+
+    def check_capacity(self):
+        # Lets callers bail out before doing any other work for the request
+        if self.in_flight >= self.limit:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Server busy, please retry shortly",
+                headers={"Retry-After": "1"},
+            )
+
+    async def run(self, func, *args):
+        # in_flight is only touched from the event loop thread, so no lock
+        self.check_capacity()
+        self.in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        finally:
+            self.in_flight -= 1
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+password_executor = BoundedExecutor(PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE)
+
+
+async def hash_password(password):
+    start = time.perf_counter()
+    hashed = await password_executor.run(password_context().hash, password)
+    metrics.observe_password_hash("hash", time.perf_counter() - start)
+    return hashed
+
+
+async def verify_password(password, hashed_password):
+    # Returns (valid, new_hash); new_hash is set when the stored hash should be replaced
+    start = time.perf_counter()
+    result = await password_executor.run(password_context().verify_and_update, password, hashed_password)
+    metrics.observe_password_hash("verify", time.perf_counter() - start)
+    return result
@@ -0,0 +1,157 @@
+import os
+import textwrap
+import time
+
+import asyncpg
+
+# Central registry of the SQL the app runs. Modules keep their statements in
+# *_QUERY constants and main registers them with register_module(); queries
+# built at runtime (the measurement listing) call register() themselves.
+#
+# The pool hands out RegisteredConnection objects, which prepare every
+# registered statement when they connect, so requests reuse the server-side
+# statement from asyncpg's per-connection cache instead of parsing and
+# planning on first use. Registered texts passed to fetch, fetchrow, fetchval
+# or execute run in their normalized form (one cache entry per statement) and
+# are counted and timed under the statement's name (stats(), /health/queries).
+# Unregistered SQL takes the usual asyncpg path. DB_STATEMENT_CACHE_SIZE must
+# stay above the number of registered statements or they get evicted again.
+
+QUERY_PREPARE = os.getenv("QUERY_PREPARE", "true").lower() in ("1", "true", "yes")
+
+
+def normalize(sql):
+    # One canonical text per statement, whatever the indentation or a
+    # trailing semicolon in the source
+    return textwrap.dedent(sql).strip().rstrip(";").rstrip()
+
+
+class Statement:
+    def __init__(self, name, sql, prepare=True):
+        self.name = name
+        self.sql = normalize(sql)
+        self.prepare = prepare
+        self.prepare_failed = False
+        self.calls = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, elapsed, failed):
+        self.calls += 1
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+        if failed:
+            self.errors += 1
+
+
+# Source and normalized text -> Statement. Names need not be unique: variants
+# of one query share a name and are reported together.
+statements = {}
+registered = []
+
+
+def register(name, sql, prepare=True):
+    statement = statements.get(sql)
+    if statement is None:
+        statement = Statement(name, sql, prepare)
+        statements[sql] = statements[statement.sql] = statement
+        registered.append(statement)
+    return statement
+
+
+def register_module(module, prepare=True):
+    for attribute, value in vars(module).items():
+        if attribute.endswith("_QUERY") and isinstance(value, str):
+            register(f"{module.__name__}.{attribute.lower()}", value, prepare)
+
+
+def register_modules(*modules, prepare=True):
+    for module in modules:
+        register_module(module, prepare)
+
+
+def name_of(sql):
+    statement = statements.get(sql)
+    return statement.name if statement is not None else None
+
+
+def stats():
+    totals = {}
+    for statement in registered:
+        entry = totals.setdefault(statement.name, {"calls": 0, "errors": 0, "total": 0.0, "max": 0.0, "variants": 0})
+        entry["calls"] += statement.calls
+        entry["errors"] += statement.errors
+        entry["total"] += statement.total
+        entry["max"] = max(entry["max"], statement.max)
+        entry["variants"] += 1
+    return [
+        {
+            "name": name,
+            "calls": entry["calls"],
+            "errors": entry["errors"],
+            "total_ms": round(entry["total"] * 1000, 3),
+            "avg_ms": round(entry["total"] * 1000 / entry["calls"], 3) if entry["calls"] else 0.0,
+            "max_ms": round(entry["max"] * 1000, 3),
+            "variants": entry["variants"],
+        }
+        for name, entry in sorted(totals.items(), key=lambda item: item[1]["total"], reverse=True)
+    ]
+
+
+class RegisteredConnection(asyncpg.Connection):
+    async def prepare_registered(self):
+        # Called from the pool's init hook for every new connection.
+        # executemany() with no arguments parses the statement into asyncpg's
+        # statement cache without running it, so the first request using it
+        # skips the Parse/Describe round-trip.
+        if not QUERY_PREPARE:
+            return 0
+        prepared = 0
+        for statement in list(registered):
+            if not statement.prepare:
+                continue
+            try:
+                await self.executemany(statement.sql, [])
+                prepared += 1
+            except asyncpg.PostgresError as e:
+                # e.g. a table a pending migration creates; the statement is
+                # prepared on first use instead
+                if not statement.prepare_failed:
+                    print(f"Could not prepare {statement.name}: {e}")
+                    statement.prepare_failed = True
+        return prepared
+
+    async def run_registered(self, statement, method, query_args, kwargs):
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = await getattr(super(), method)(statement.sql, *query_args, **kwargs)
+            failed = False
+            return result
+        finally:
+            statement.record(time.perf_counter() - start, failed)
+
+    async def fetch(self, query, *args, timeout=None, record_class=None):
+        statement = statements.get(query)
+        if statement is None:
+            return await super().fetch(query, *args, timeout=timeout, record_class=record_class)
+        return await self.run_registered(statement, "fetch", args, {"timeout": timeout, "record_class": record_class})
+
+    async def fetchrow(self, query, *args, timeout=None, record_class=None):
+        statement = statements.get(query)
+        if statement is None:
+            return await super().fetchrow(query, *args, timeout=timeout, record_class=record_class)
+        return await self.run_registered(statement, "fetchrow", args, {"timeout": timeout, "record_class": record_class})
+
+    async def fetchval(self, query, *args, column=0, timeout=None):
+        statement = statements.get(query)
+        if statement is None:
+            return await super().fetchval(query, *args, column=column, timeout=timeout)
+        return await self.run_registered(statement, "fetchval", args, {"column": column, "timeout": timeout})
+
+    async def execute(self, query, *args, timeout=None):
+        statement = statements.get(query)
+        if statement is None:
+            return await super().execute(query, *args, timeout=timeout)
+        return await self.run_registered(statement, "execute", args, {"timeout": timeout})
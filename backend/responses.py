@@ -0,0 +1,25 @@
+from decimal import Decimal
+
+import orjson
+from asyncpg import Record
+from starlette.responses import JSONResponse as StarletteJSONResponse
+
+# The app's default response class: an orjson renderer like FastAPI's
+# ORJSONResponse (deprecated in newer FastAPI releases) that also handles
+# asyncpg records. Hot-path handlers return it directly with records in the
+# content, so FastAPI skips jsonable_encoder, which is the bulk of the cost for
+# large listings. Queries cast NUMERIC columns to float8, leaving Decimal
+# (which orjson does not support natively) as a fallback only.
+
+
+def encode_default(value):
+    if isinstance(value, Record):
+        return dict(value)
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+class JSONResponse(StarletteJSONResponse):
+    def render(self, content):
+        return orjson.dumps(content, default=encode_default, option=orjson.OPT_SERIALIZE_NUMPY)
@@ -0,0 +1,93 @@
+import datetime
+import os
+
+import numpy as np
+
+# Chart series with a bounded number of points. Either the raw history is
+# downsampled with Largest-Triangle-Three-Buckets (keeps the visual shape,
+# including peaks and dips), or Postgres groups it into calendar buckets with
+# min/avg/max per bucket.
+
+SERIES_DEFAULT_POINTS = int(os.getenv("SERIES_DEFAULT_POINTS", "500"))
+SERIES_MAX_POINTS = int(os.getenv("SERIES_MAX_POINTS", "2000"))
+BUCKETS = ("day", "week", "month")
+
+RAW_SERIES_QUERY = """
+    SELECT measurement_date - DATE '0001-01-01' + 1 AS day, weight::float8 AS weight
+    FROM weight_measurements
+    WHERE user_id = $1
+      AND ($2::date IS NULL OR measurement_date >= $2)
+      AND ($3::date IS NULL OR measurement_date <= $3)
+    ORDER BY measurement_date
+"""
+
+# Newest buckets first so LIMIT keeps the most recent part of a long history;
+# the handler flips them back into date order.
+BUCKET_SERIES_QUERY = """
+    SELECT date_trunc($4, measurement_date)::date AS bucket,
+           min(weight)::float8 AS min,
+           avg(weight)::float8 AS avg,
+           max(weight)::float8 AS max,
+           count(*) AS count
+    FROM weight_measurements
+    WHERE user_id = $1
+      AND ($2::date IS NULL OR measurement_date >= $2)
+      AND ($3::date IS NULL OR measurement_date <= $3)
+    GROUP BY bucket
+    ORDER BY bucket DESC
+    LIMIT $5
+"""
+
+
+def lttb(x, y, threshold):
+    # Returns the indices of the points to keep, always including both ends
+    size = x.size
+    if threshold >= size or threshold < 3:
+        return np.arange(size)
+    every = (size - 2) / (threshold - 2)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = size - 1
+    a = 0
+    for i in range(threshold - 2):
+        # Candidates for this bucket, and the average of the next one
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, size)
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+        areas = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(np.argmax(areas))
+        selected[i + 1] = a
+    return selected
+
+
+def downsample(records, points):
+    if not records:
+        return []
+    count = len(records)
+    days = np.fromiter((r["day"] for r in records), dtype=np.float64, count=count)
+    weights = np.fromiter((r["weight"] for r in records), dtype=np.float64, count=count)
+    return [
+        {
+            "measurement_date": datetime.date.fromordinal(int(days[i])),
+            "weight": float(weights[i]),
+        }
+        for i in lttb(days, weights, points)
+    ]
+
+
+def format_buckets(rows):
+    return [
+        {
+            "date": row["bucket"],
+            "min": row["min"],
+            "avg": round(row["avg"], 2),
+            "max": row["max"],
+            "count": row["count"],
+        }
+        for row in reversed(rows)
+    ]
@@ -0,0 +1,71 @@
+import asyncpg
+import uuid
+import pytest
+import pytest_asyncio
+from unittest.mock import MagicMock
+
+import database as database_settings
+import migrate
+from database import database
+
+
+@pytest.fixture(autouse=True)
+def mock_pool(monkeypatch):
+    # Code that acquires through database.acquire() needs a pool object to exist
+    monkeypatch.setattr(database, "pool", MagicMock())
+    return database.pool
+
+
+async def open_connection():
+    try:
+        return await asyncpg.connect(
+            host=database_settings.DB_HOST,
+            database=database_settings.DB_NAME,
+            user=database_settings.DB_USER,
+            password=database_settings.DB_PASSWORD,
+            port=database_settings.DB_PORT,
+            timeout=2,
+        )
+    except (OSError, asyncpg.PostgresError, TimeoutError):
+        pytest.skip("database not available")
+
+
+async def create_user(connection, height=None):
+    name = f"test_{uuid.uuid4().hex[:12]}"
+    return await connection.fetchval(
+        "INSERT INTO users (username, password_hash, email, height) VALUES ($1, 'x', $2, $3) RETURNING id",
+        name, f"{name}@example.com", height,
+    )
+
+
+@pytest.fixture
+def connect():
+    # Opens real connections outside the db_connection transaction, for tests
+    # that need committed data; they close them and clean up themselves.
+    # Skips when no database is reachable.
+    return open_connection
+
+
+@pytest_asyncio.fixture
+async def db_connection():
+    # A real connection for tests that need Postgres, wrapped in a transaction
+    # that is rolled back afterwards. Skips when no database is reachable.
+    connection = await open_connection()
+    transaction = connection.transaction()
+    await transaction.start()
+    yield connection
+    await transaction.rollback()
+    await connection.close()
+
+
+@pytest.fixture
+def make_user():
+    # create_user(connection, height=None) -> id of a new user with a unique name
+    return create_user
+
+
+@pytest_asyncio.fixture
+async def db_user(db_connection):
+    # A new user in the migrated db_connection database
+    await migrate.apply_migrations(db_connection)
+    return await create_user(db_connection)
@@ -0,0 +1,238 @@
+import asyncio
+import uuid
+import httpx
+import pytest
+from fastapi import FastAPI, HTTPException
+
+import admission
+import migrate
+from admission import ConcurrencyLimit, MemoryStore, PostgresStore, RateLimit
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_parse_rate():
+    assert admission.parse_rate("30/minute") == (0.5, 30)
+    assert admission.parse_rate(" 10 / hour ") == (10 / 3600, 10)
+    assert admission.parse_rate("") is None
+    assert admission.parse_rate("0/second") is None
+    with pytest.raises(ValueError):
+        admission.parse_rate("30 per minute")
+
+
+@pytest.mark.asyncio
+async def test_memory_bucket_refills_over_time():
+    clock = FakeClock()
+    store = MemoryStore(clock=clock)
+
+    for _ in range(3):
+        assert (await store.take("k", 1.0, 3))[0]
+    allowed, retry_after = await store.take("k", 1.0, 3)
+    assert not allowed
+    assert retry_after == pytest.approx(1.0)
+
+    clock.now += 1.5
+    assert (await store.take("k", 1.0, 3))[0]
+    assert not (await store.take("k", 1.0, 3))[0]
+    # Other keys have their own bucket
+    assert (await store.take("other", 1.0, 3))[0]
+
+
+@pytest.mark.asyncio
+async def test_memory_store_forgets_least_recently_used_keys():
+    store = MemoryStore(max_keys=2, clock=FakeClock())
+    for key in ("a", "b", "c"):
+        await store.take(key, 1.0, 1)
+    assert len(store) == 2
+    # "a" was dropped, so its bucket starts full again
+    assert (await store.take("a", 1.0, 1))[0]
+    assert not (await store.take("c", 1.0, 1))[0]
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_raises_429_with_retry_after(monkeypatch):
+    rejections = []
+    monkeypatch.setattr(admission.metrics, "count_admission_rejection", lambda *labels: rejections.append(labels))
+    limit = RateLimit("test_login", "2/minute", store=MemoryStore(clock=FakeClock()))
+
+    await limit.check("10.0.0.1")
+    await limit.check("10.0.0.1")
+    with pytest.raises(HTTPException) as exc:
+        await limit.check("10.0.0.1")
+    assert exc.value.status_code == 429
+    assert exc.value.headers["Retry-After"] == "30"
+    assert rejections == [("test_login", "rate_limited")]
+    assert limit.stats()["rejected"] == 1
+
+    await limit.check("10.0.0.2")
+
+
+@pytest.mark.asyncio
+async def test_disabled_rate_limit_never_touches_the_store():
+    class FailingStore:
+        async def take(self, *args):
+            raise AssertionError("store used")
+
+    await RateLimit("off", "", store=FailingStore()).check("key")
+
+
+@pytest.mark.asyncio
+async def test_postgres_store_shares_buckets_through_the_table(db_connection):
+    await migrate.apply_migrations(db_connection)
+    store = PostgresStore(database=None)
+    key = f"test:{uuid.uuid4()}"
+
+    assert await store.take(key, 1 / 60, 2, connection=db_connection) == (True, 0.0)
+    assert (await store.take(key, 1 / 60, 2, connection=db_connection))[0]
+    allowed, retry_after = await store.take(key, 1 / 60, 2, connection=db_connection)
+    assert not allowed
+    assert 0 < retry_after <= 60
+
+    # A bucket last touched long enough ago is full again
+    await db_connection.execute(
+        "UPDATE rate_limits SET updated_at = updated_at - interval '5 minutes' WHERE key = $1", key
+    )
+    assert (await store.take(key, 1 / 60, 2, connection=db_connection))[0]
+    tokens = await db_connection.fetchval("SELECT tokens FROM rate_limits WHERE key = $1", key)
+    assert tokens == pytest.approx(1.0, abs=0.01)
+
+
+@pytest.mark.asyncio
+async def test_postgres_store_prunes_idle_buckets_as_it_goes(db_connection):
+    await migrate.apply_migrations(db_connection)
+    store = PostgresStore(database=None, prune_every=3, idle_seconds=3600)
+    stale, fresh = f"test:{uuid.uuid4()}", f"test:{uuid.uuid4()}"
+    await store.take(stale, 1.0, 5, connection=db_connection)
+    await store.take(fresh, 1.0, 5, connection=db_connection)
+    await db_connection.execute(
+        "UPDATE rate_limits SET updated_at = updated_at - interval '2 hours' WHERE key = $1", stale
+    )
+
+    # The third check prunes before charging its own bucket
+    await store.take(fresh, 1.0, 5, connection=db_connection)
+
+    keys = await db_connection.fetch("SELECT key FROM rate_limits WHERE key = ANY($1)", [stale, fresh])
+    assert [row["key"] for row in keys] == [fresh]
+
+
+@pytest.mark.asyncio
+async def test_concurrency_limit_rejects_when_full():
+    limit = ConcurrencyLimit("test_import", 1, retry_after=3)
+
+    async with limit.slot():
+        assert limit.stats()["active"] == 1
+        with pytest.raises(HTTPException) as exc:
+            await limit.acquire()
+        assert exc.value.status_code == 503
+        assert exc.value.headers["Retry-After"] == "3"
+    assert limit.stats() == {"limit": 1, "active": 0, "rejected": 1}
+
+    async with limit.slot():
+        pass
+
+
+@pytest.mark.asyncio
+async def test_concurrency_limit_queues_up_to_the_timeout():
+    limit = ConcurrencyLimit("test_queue", 1, queue_timeout=1.0)
+    await limit.acquire()
+    waiter = asyncio.create_task(limit.acquire())
+    await asyncio.sleep(0.01)
+    limit.release()
+    await waiter
+    assert limit.active == 1
+    limit.release()
+
+
+def overload_app(limit, release):
+    # Four "pooled connections" shared by a slow route and a cheap one, as in
+    # the real app where /import and GET /measurements share the pool. Imports
+    # hold their connection until release is set. Latency under this load is
+    # measured by benchmarks/bench_overload.py.
+    app = FastAPI()
+    app.state.settled = 0
+    pool = asyncio.Semaphore(4)
+
+    @app.post("/import")
+    async def expensive():
+        # Counted once the import holds a connection or has been turned away
+        try:
+            async with limit.slot():
+                async with pool:
+                    app.state.settled += 1
+                    await release.wait()
+        except HTTPException:
+            app.state.settled += 1
+            raise
+        return {"ok": True}
+
+    @app.get("/measurements")
+    async def cheap():
+        async with pool:
+            return {"ok": True}
+
+    return app
+
+
+async def settle(condition):
+    # Lets the in-flight requests run until condition() holds
+    for _ in range(1000):
+        if condition():
+            return
+        await asyncio.sleep(0)
+    raise AssertionError("requests did not settle")
+
+
+async def flood(client, app, imports):
+    tasks = [asyncio.create_task(client.post("/import")) for _ in range(imports)]
+    await settle(lambda: app.state.settled == imports)
+    return tasks
+
+
+@pytest.mark.asyncio
+async def test_cheap_route_is_admitted_while_the_expensive_slots_are_full():
+    limit = ConcurrencyLimit("overload", 2)
+    release = asyncio.Event()
+    app = overload_app(limit, release)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        imports = await flood(client, app, 10)
+        await settle(lambda: sum(task.done() for task in imports) == 8)
+
+        assert limit.active == 2
+        rejected = [task.result() for task in imports if task.done()]
+        assert len(rejected) == 8
+        assert {response.status_code for response in rejected} == {503}
+        assert limit.rejected == 8
+        # Two connections are still free for the cheap route
+        response = await asyncio.wait_for(client.get("/measurements"), 1)
+        assert response.status_code == 200
+
+        release.set()
+        accepted = await asyncio.gather(*(task for task in imports if not task.done()))
+    assert [response.status_code for response in accepted] == [200, 200]
+
+
+@pytest.mark.asyncio
+async def test_without_a_limit_the_cheap_route_waits_for_the_pool():
+    release = asyncio.Event()
+    app = overload_app(ConcurrencyLimit("unlimited", 0), release)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        # Four imports hold the whole pool and six more queue for it
+        imports = [asyncio.create_task(client.post("/import")) for _ in range(10)]
+        await settle(lambda: app.state.settled == 4)
+
+        cheap = asyncio.create_task(client.get("/measurements"))
+        for _ in range(100):
+            await asyncio.sleep(0)
+        assert not cheap.done()
+
+        release.set()
+        assert (await cheap).status_code == 200
+        await asyncio.gather(*imports)
@@ -0,0 +1,64 @@
+import pytest
+from datetime import date, timedelta
+from decimal import Decimal
+
+import analytics
+
+
+def make_records(start, offsets, weights):
+    return [
+        {"day": (start + timedelta(days=offset)).toordinal(), "weight": float(weight)}
+        for offset, weight in zip(offsets, weights)
+    ]
+
+
+def test_trends_empty_history():
+    assert analytics.trends_from_records([], 180) == {}
+
+
+def test_trends_single_measurement():
+    records = make_records(date(2024, 1, 1), [0], [81])
+
+    trends = analytics.trends_from_records(records, Decimal("180.00"))
+
+    assert trends == {
+        "average_weight": 81.0,
+        "weekly_average": 81.0,
+        "monthly_average": 81.0,
+        "bmi": 25.0,
+        "trend_slope": 0.0,
+        "total_measurements": 1,
+        "date_range": "2024-01-01 to 2024-01-01",
+        "current_streak": 1,
+    }
+
+
+def test_slope_is_per_day_not_per_measurement():
+    # Two readings ten days apart, one kilogram lost
+    records = make_records(date(2024, 1, 1), [0, 10], [80, 79])
+
+    trends = analytics.trends_from_records(records)
+
+    assert trends["trend_slope"] == pytest.approx(-0.1)
+    assert trends["bmi"] is None
+
+
+def test_window_averages_and_streak():
+    # Days 0..39 weigh 100, then a gap, then days 50..54 weigh 90
+    offsets = list(range(40)) + list(range(50, 55))
+    weights = [100] * 40 + [90] * 5
+    records = make_records(date(2024, 1, 1), offsets, weights)
+
+    trends = analytics.trends_from_records(records)
+
+    assert trends["weekly_average"] == 90.0
+    # Window days 25..54 holds 15 readings at 100 and 5 at 90
+    assert trends["monthly_average"] == pytest.approx((15 * 100 + 5 * 90) / 20, abs=0.01)
+    assert trends["current_streak"] == 5
+    assert trends["date_range"] == "2024-01-01 to 2024-02-24"
+
+
+def test_streak_ignores_duplicate_dates():
+    records = make_records(date(2024, 3, 1), [0, 1, 1, 2, 2, 2], [70, 70, 71, 70, 70, 70])
+
+    assert analytics.trends_from_records(records)["current_streak"] == 3
@@ -0,0 +1,85 @@
+import pytest
+from unittest.mock import AsyncMock
+from datetime import date
+from decimal import Decimal
+from fastapi import HTTPException
+
+import batch
+from models import Measurement
+
+
+def test_validate():
+    row, error = batch.validate(Measurement(measurement_date="2024-01-15", weight=75.456))
+    assert error is None
+    assert row == (date(2024, 1, 15), Decimal("75.46"), "")
+
+    for measurement in (
+        Measurement(measurement_date="15/01/2024", weight=75),
+        Measurement(measurement_date="2024-01-15", weight=0),
+        Measurement(measurement_date="2024-01-15", weight=1000),
+    ):
+        assert batch.validate(measurement)[0] is None
+
+
+@pytest.mark.asyncio
+async def test_upsert_sends_one_statement_and_reports_each_item():
+    connection = AsyncMock()
+    connection.fetch = AsyncMock(return_value=[
+        {"id": 11, "measurement_date": date(2024, 1, 1), "inserted": True},
+        {"id": 7, "measurement_date": date(2024, 1, 2), "inserted": False},
+    ])
+    measurements = [
+        Measurement(measurement_date="2024-01-01", weight=80),
+        Measurement(measurement_date="2024-01-02", weight=81),
+        Measurement(measurement_date="not-a-date", weight=81),
+        Measurement(measurement_date="2024-01-03", weight=82),
+        Measurement(measurement_date="2024-01-02", weight=79.5, notes="later"),
+    ]
+
+    result = await batch.upsert_measurements(connection, 1, measurements)
+
+    connection.fetch.assert_awaited_once()
+    _, user_id, dates, weights, notes = connection.fetch.call_args.args
+    assert user_id == 1
+    assert dates == [date(2024, 1, 1), date(2024, 1, 2), date(2024, 1, 3)]
+    assert weights == [Decimal("80.00"), Decimal("79.50"), Decimal("82.00")]
+    assert notes == ["", "later", ""]
+    assert [r["status"] for r in result["results"]] == ["created", "superseded", "invalid", "unchanged", "updated"]
+    assert result["results"][1]["by"] == 4
+    assert result["results"][4]["id"] == 7
+    assert (result["created"], result["updated"], result["unchanged"], result["invalid"]) == (1, 1, 1, 1)
+
+
+@pytest.mark.asyncio
+async def test_batch_endpoint_rejects_oversized_batches(monkeypatch):
+    from measurements import add_measurements_batch
+    monkeypatch.setattr(batch, "MAX_BATCH_SIZE", 2)
+    measurements = [Measurement(measurement_date=f"2024-01-0{day}", weight=80) for day in (1, 2, 3)]
+
+    with pytest.raises(HTTPException) as exc_info:
+        await add_measurements_batch(measurements, current_user={"id": 1}, connection=AsyncMock())
+
+    assert exc_info.value.status_code == 413
+
+
+@pytest.mark.asyncio
+async def test_upsert_against_database(db_connection, db_user):
+    user_id = db_user
+    first = [Measurement(measurement_date=f"2024-01-0{day}", weight=80 + day) for day in (1, 2, 3)]
+    second = [
+        Measurement(measurement_date="2024-01-01", weight=81),
+        Measurement(measurement_date="2024-01-02", weight=90, notes="fixed"),
+        Measurement(measurement_date="2024-01-04", weight=84),
+    ]
+
+    created = await batch.upsert_measurements(db_connection, user_id, first)
+    again = await batch.upsert_measurements(db_connection, user_id, second)
+
+    assert created["created"] == 3
+    assert [r["status"] for r in again["results"]] == ["unchanged", "updated", "created"]
+    rows = await db_connection.fetch(
+        "SELECT measurement_date, weight, notes FROM weight_measurements WHERE user_id = $1 ORDER BY 1", user_id
+    )
+    assert [(r["weight"], r["notes"]) for r in rows] == [
+        (Decimal("81.00"), ""), (Decimal("90.00"), "fixed"), (Decimal("83.00"), ""), (Decimal("84.00"), ""),
+    ]
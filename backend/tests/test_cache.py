@@ -0,0 +1,105 @@
+import pytest
+from unittest.mock import AsyncMock, patch
+from fastapi import HTTPException
+from jose import jwt
+
+from cache import TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_ttl_cache_expires_entries():
+    clock = FakeClock()
+    cache = TTLCache(maxsize=10, ttl=5, clock=clock)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=1)
+
+    clock.now = 2
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+
+    clock.now = 6
+    assert cache.get("a") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 2
+    assert len(cache) == 0
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_ttl_cache_disabled():
+    cache = TTLCache(maxsize=0, ttl=60)
+    cache.set("a", 1)
+
+    assert cache.get("a") is None
+
+
+@pytest.fixture
+def auth_caches():
+    import auth
+    auth.user_cache.clear()
+    auth.token_cache.clear()
+    yield auth
+    auth.user_cache.clear()
+    auth.token_cache.clear()
+
+
+@pytest.mark.asyncio
+async def test_get_current_user_caches_lookup(auth_caches):
+    auth = auth_caches
+    token = auth.create_access_token({"sub": "johndoe"})
+    user_row = {"id": 1, "username": "johndoe", "email": "john@example.com", "height": 175.0, "age": 30}
+    mock_connection = AsyncMock()
+    mock_connection.fetchrow = AsyncMock(return_value=user_row)
+
+    with patch("jose.jwt.decode", wraps=jwt.decode) as decode:
+        first = await auth.get_current_user(token, mock_connection)
+        second = await auth.get_current_user(token, mock_connection)
+
+    assert first == second == user_row
+    mock_connection.fetchrow.assert_awaited_once()
+    decode.assert_called_once()
+    assert auth.user_cache.stats()["hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_get_current_user_rejects_bad_token(auth_caches):
+    with pytest.raises(HTTPException) as exc_info:
+        await auth_caches.get_current_user("not-a-token")
+
+    assert exc_info.value.status_code == 401
+    assert len(auth_caches.token_cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_update_profile_invalidates_cached_user(auth_caches):
+    from models import UserCreate
+    auth = auth_caches
+    auth.user_cache.set("johndoe", {"id": 1, "username": "johndoe", "email": "old@example.com"})
+    updated = {"id": 1, "username": "johndoe", "email": "new@example.com", "height": None, "age": None}
+    mock_connection = AsyncMock()
+    mock_connection.fetchrow = AsyncMock(return_value=updated)
+
+    await auth.update_user_profile(
+        UserCreate(username="johndoe", password="x", email="new@example.com"),
+        current_user={"id": 1, "username": "johndoe"},
+        connection=mock_connection,
+    )
+
+    assert auth.user_cache.get("johndoe") is None
@@ -0,0 +1,73 @@
+import pytest
+from datetime import date
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+from fastapi import HTTPException
+
+import conditional
+
+
+def make_request(path="/measurements", query="limit=50", if_none_match=None):
+    headers = {"if-none-match": if_none_match} if if_none_match else {}
+    return SimpleNamespace(url=SimpleNamespace(path=path, query=query), headers=headers)
+
+
+def test_etag_depends_on_version_and_parameters():
+    request = make_request()
+    etag = conditional.make_etag(1, 5, request)
+
+    assert etag.startswith('"1-5-') and etag.endswith('"')
+    assert conditional.make_etag(1, 6, request) != etag
+    assert conditional.make_etag(1, 5, make_request(query="limit=100")) != etag
+    assert conditional.make_etag(1, 5, make_request()) == etag
+
+
+def test_etag_matches():
+    etag = '"1-5-abc"'
+
+    assert conditional.etag_matches('"1-5-abc"', etag)
+    assert conditional.etag_matches('"0-1-x", W/"1-5-abc"', etag)
+    assert conditional.etag_matches("*", etag)
+    assert not conditional.etag_matches('"1-4-abc"', etag)
+    assert not conditional.etag_matches(None, etag)
+
+
+@pytest.mark.asyncio
+async def test_data_etag_answers_304_when_unchanged():
+    connection = AsyncMock()
+    connection.fetchval = AsyncMock(return_value=7)
+    etag = await conditional.data_etag(make_request(), {"id": 1}, connection)
+
+    with pytest.raises(HTTPException) as exc_info:
+        await conditional.data_etag(make_request(if_none_match=etag), {"id": 1}, connection)
+
+    assert exc_info.value.status_code == 304
+    assert exc_info.value.headers["ETag"] == etag
+    connection.fetchval.assert_awaited_with(conditional.VERSION_QUERY, 1)
+
+
+@pytest.mark.asyncio
+async def test_writes_bump_data_version(db_connection, db_user):
+    user_id = db_user
+
+    async def version():
+        return await db_connection.fetchval(conditional.VERSION_QUERY, user_id)
+
+    start = await version()
+    await db_connection.executemany(
+        "INSERT INTO weight_measurements (user_id, measurement_date, weight) VALUES ($1, $2, 80)",
+        [(user_id, date(2024, 1, day)) for day in (1, 2)],
+    )
+    after_inserts = await version()
+    await db_connection.execute("UPDATE weight_measurements SET weight = 79 WHERE user_id = $1", user_id)
+    await db_connection.execute(
+        "INSERT INTO goals (user_id, target_weight, target_date, start_weight) VALUES ($1, 70, '2025-01-01', 80)",
+        user_id,
+    )
+    after_goal = await version()
+    # Statements that touch no rows leave the version alone
+    await db_connection.execute("DELETE FROM goals WHERE user_id = $1 AND target_weight = 1", user_id)
+
+    assert after_inserts > start
+    assert after_goal == after_inserts + 2
+    assert await version() == after_goal
@@ -0,0 +1,328 @@
+import asyncio
+import time
+import asyncpg
+import pytest
+from unittest.mock import AsyncMock
+from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi.testclient import TestClient
+
+import database as database_module
+from database import Database, get_connection, replica_read
+
+
+class FakePool:
+    def __init__(self, size=2):
+        self.free = [object() for _ in range(size)]
+        self.size = size
+        self.acquired = 0
+
+    async def acquire(self, timeout=None):
+        if not self.free:
+            raise asyncio.TimeoutError()
+        self.acquired += 1
+        return self.free.pop()
+
+    async def release(self, connection):
+        self.free.append(connection)
+
+    def get_size(self):
+        return self.size
+
+    def get_idle_size(self):
+        return len(self.free)
+
+
+@pytest.mark.asyncio
+async def test_acquire_records_wait_and_releases():
+    db = Database()
+    db.pool = FakePool()
+
+    async with db.acquire() as connection:
+        assert connection is not None
+        assert db.stats()["free"] == 1
+
+    stats = db.stats()
+    assert stats["free"] == 2
+    assert stats["acquired"] == 1
+    assert stats["waiting"] == 0
+    assert stats["acquire_wait_max_ms"] >= 0
+
+
+@pytest.mark.asyncio
+async def test_get_connection_returns_503_when_pool_is_exhausted(monkeypatch):
+    db = Database()
+    db.pool = FakePool(size=0)
+    monkeypatch.setattr(database_module, "database", db)
+
+    with pytest.raises(HTTPException) as exc_info:
+        await anext(get_connection(Request({"type": "http", "method": "GET", "headers": []})))
+
+    assert exc_info.value.status_code == 503
+    assert exc_info.value.headers["Retry-After"] == "1"
+    assert db.stats()["acquire_timeouts"] == 1
+
+
+def test_request_shares_one_connection(monkeypatch):
+    db = Database()
+    db.pool = FakePool()
+    monkeypatch.setattr(database_module, "database", db)
+
+    async def current_user(connection=Depends(get_connection)):
+        return connection
+
+    app = FastAPI()
+
+    @app.get("/")
+    async def handler(user_connection=Depends(current_user), connection=Depends(get_connection)):
+        return {"shared": user_connection is connection}
+
+    with TestClient(app) as client:
+        assert client.get("/").json() == {"shared": True}
+
+    assert db.pool.acquired == 1
+    assert db.stats()["free"] == 2
+
+
+@pytest.mark.asyncio
+async def test_connect_retries_with_growing_delay(monkeypatch):
+    pool = FakePool()
+    attempts = []
+    delays = []
+
+    async def create_pool(**kwargs):
+        attempts.append(kwargs)
+        if len(attempts) < 3:
+            raise OSError("connection refused")
+        return pool
+
+    async def sleep(delay):
+        delays.append(delay)
+
+    monkeypatch.setattr(database_module, "create_pool", create_pool)
+    monkeypatch.setattr(database_module, "DB_POOL_WARMUP", 0)
+    monkeypatch.setattr(database_module.asyncio, "sleep", sleep)
+    db = Database()
+    await db.connect()
+
+    assert db.pool is pool
+    assert delays == [0.1, 0.2]
+
+
+@pytest.mark.asyncio
+async def test_warm_up_opens_connections_and_releases_them():
+    db = Database()
+    db.pool = FakePool(3)
+    db.pool.free = [AsyncMock() for _ in range(3)]
+
+    await db.warm_up(3)
+
+    assert db.pool.acquired == 3
+    assert len(db.pool.free) == 3
+    for connection in db.pool.free:
+        connection.execute.assert_awaited_once_with("SELECT 1")
+
+
+@pytest.mark.asyncio
+async def test_warm_up_releases_connections_on_failure():
+    db = Database()
+    db.pool = FakePool(2)
+    db.pool.free = [AsyncMock() for _ in range(2)]
+
+    with pytest.raises(asyncio.TimeoutError):
+        await db.warm_up(3)
+
+    assert len(db.pool.free) == 2
+
+
+class FailingPool(FakePool):
+    async def acquire(self, timeout=None):
+        raise ConnectionRefusedError("replica down")
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def replicated(*replica_pools, clock=time.monotonic):
+    db = Database(replica_hosts=[f"replica{i}:5433" for i in range(len(replica_pools))], clock=clock)
+    db.pool = FakePool()
+    for replica, pool in zip(db.replicas, replica_pools):
+        replica.pool = pool
+        replica.healthy = True
+    return db
+
+
+@pytest.mark.asyncio
+async def test_reads_rotate_over_healthy_replicas():
+    first, second = FakePool(), FakePool()
+    db = replicated(first, second)
+    db.replicas[1].healthy = False
+
+    for _ in range(3):
+        async with db.acquire(read_only=True, key="jane"):
+            pass
+    db.replicas[1].healthy = True
+    for _ in range(2):
+        async with db.acquire(read_only=True, key="jane"):
+            pass
+    async with db.acquire():
+        pass
+
+    assert (first.acquired, second.acquired, db.pool.acquired) == (4, 1, 1)
+    assert db.replicas[0].name == "replica0:5433"
+    assert [len(pool.free) for pool in (first, second, db.pool)] == [2, 2, 2]
+
+
+@pytest.mark.asyncio
+async def test_recent_writers_read_from_the_primary():
+    clock = FakeClock()
+    db = replicated(FakePool(), clock=clock)
+
+    db.mark_written("jane")
+    async with db.acquire(read_only=True, key="jane"):
+        pass
+    async with db.acquire(read_only=True, key="john"):
+        pass
+    assert (db.pool.acquired, db.replicas[0].pool.acquired) == (1, 1)
+    assert db.stats()["sticky_users"] == 1
+
+    clock.now += database_module.DB_REPLICA_STICKY_SECONDS
+    async with db.acquire(read_only=True, key="jane"):
+        pass
+    assert db.replicas[0].pool.acquired == 2
+
+    # Changes announced by other workers pin the user too, and a listener
+    # reset (missed announcements) pins everyone for one window
+    db.note_change({"id": 1, "username": "john", "profile": False})
+    assert db.wrote_recently("john")
+    db.forget_writes()
+    assert db.wrote_recently("anyone")
+
+
+@pytest.mark.asyncio
+async def test_unreachable_replica_falls_back_to_the_primary(capsys):
+    db = replicated(FailingPool())
+
+    async with db.acquire(read_only=True, key="jane"):
+        pass
+    async with db.acquire(read_only=True, key="jane"):
+        pass
+
+    assert db.pool.acquired == 2
+    assert not db.replicas[0].healthy
+    stats = db.stats()
+    assert stats["replica_fallbacks"] == 1
+    assert stats["replicas"][0]["failures"] == 1
+    assert "replica0:5433 taken out of rotation" in capsys.readouterr().out
+
+
+class BusyPool(FakePool):
+    # Every connection is checked out: acquire waits out its timeout
+    def __init__(self):
+        super().__init__(size=0)
+        self.timeouts = []
+
+    async def acquire(self, timeout=None):
+        self.timeouts.append(timeout)
+        await asyncio.sleep(timeout)
+        raise asyncio.TimeoutError()
+
+
+@pytest.mark.asyncio
+async def test_busy_replica_stays_healthy_and_fallback_keeps_the_budget():
+    db = replicated(BusyPool())
+    primary = db.pool
+    primary_timeouts = []
+
+    async def acquire(timeout=None):
+        primary_timeouts.append(timeout)
+        return await FakePool.acquire(primary, timeout)
+
+    primary.acquire = acquire
+
+    async with db.acquire(timeout=0.2, read_only=True, key="jane"):
+        pass
+
+    replica = db.replicas[0]
+    assert replica.healthy
+    assert replica.failures == 0
+    assert db.stats()["replica_fallbacks"] == 1
+    assert replica.pool.timeouts == [0.1]
+    assert 0 < primary_timeouts[0] <= 0.1
+    assert db.stats()["acquire_wait_max_ms"] < 200
+
+
+def test_get_connection_routes_marked_reads_and_pins_writers(monkeypatch):
+    replica_pool = FakePool()
+    db = replicated(replica_pool)
+    db.session_key = lambda request: request.headers.get("x-user")
+    monkeypatch.setattr(database_module, "database", db)
+    app = FastAPI()
+
+    @app.get("/read")
+    @replica_read
+    async def read(connection=Depends(get_connection)):
+        return {}
+
+    @app.get("/status")
+    async def status(connection=Depends(get_connection)):
+        return {}
+
+    @app.post("/write")
+    async def write(connection=Depends(get_connection)):
+        return {}
+
+    with TestClient(app) as client:
+        client.get("/read", headers={"x-user": "jane"})
+        client.get("/status", headers={"x-user": "jane"})
+        assert (replica_pool.acquired, db.pool.acquired) == (1, 1)
+
+        client.post("/write", headers={"x-user": "jane"})
+        client.get("/read", headers={"x-user": "jane"})
+        client.get("/read", headers={"x-user": "john"})
+        assert (replica_pool.acquired, db.pool.acquired) == (2, 3)
+
+
+def test_replica_read_condition_keeps_writing_requests_on_the_primary(monkeypatch):
+    replica_pool = FakePool()
+    db = replicated(replica_pool)
+    monkeypatch.setattr(database_module, "database", db)
+    app = FastAPI()
+
+    @app.get("/export")
+    @replica_read(when=lambda request: "background" not in request.query_params)
+    async def export(connection=Depends(get_connection)):
+        return {}
+
+    with TestClient(app) as client:
+        client.get("/export")
+        assert (replica_pool.acquired, db.pool.acquired) == (1, 0)
+        client.get("/export?background=true")
+        assert (replica_pool.acquired, db.pool.acquired) == (1, 1)
+
+
+@pytest.mark.asyncio
+async def test_replica_checks_against_a_stand_in_database(monkeypatch):
+    # The primary itself stands in for a replica; it is not in recovery, so
+    # its lag is 0. Nothing listens on port 1.
+    monkeypatch.setattr(database_module, "DB_REPLICA_CHECK_INTERVAL", 2)
+    db = Database(replica_hosts=[f"{database_module.DB_HOST}:{database_module.DB_PORT}", f"{database_module.DB_HOST}:1"])
+    try:
+        await db.check_replicas()
+        stand_in, missing = db.replicas
+        if not stand_in.healthy:
+            pytest.skip("database not available")
+        assert stand_in.lag == 0
+        assert not missing.healthy and missing.pool is None
+
+        async with db.acquire(read_only=True) as connection:
+            assert await connection.fetchval("SHOW transaction_read_only") == "on"
+            with pytest.raises(asyncpg.ReadOnlySQLTransactionError):
+                await connection.execute("CREATE TEMPORARY TABLE replica_write_check (id int)")
+        assert stand_in.acquired == 1
+    finally:
+        await db.disconnect()
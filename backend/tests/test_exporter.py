@@ -0,0 +1,117 @@
+import json
+import pytest
+from contextlib import asynccontextmanager
+from datetime import date
+from decimal import Decimal
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import auth
+import database as database_module
+import exporter
+import measurements
+from database import Database
+
+
+async def aiter_rows(rows):
+    for row in rows:
+        yield row
+
+
+def make_rows(count):
+    return [
+        {"measurement_date": date(2024, 1, 1 + i), "weight": Decimal("80.50") - i, "notes": f"day {i}"}
+        for i in range(count)
+    ]
+
+
+async def collect(rows, fmt, chunk_size):
+    return [chunk async for chunk in exporter.iter_chunks(aiter_rows(rows), fmt, chunk_size)]
+
+
+@pytest.mark.asyncio
+async def test_iter_chunks_csv():
+    chunks = await collect(make_rows(3), "csv", chunk_size=1024)
+
+    assert chunks == [
+        "Date,Weight,Notes\r\n"
+        "2024-01-01,80.50,day 0\r\n"
+        "2024-01-02,79.50,day 1\r\n"
+        "2024-01-03,78.50,day 2\r\n"
+    ]
+
+
+@pytest.mark.asyncio
+async def test_iter_chunks_ndjson_is_bounded():
+    chunks = await collect(make_rows(20), "ndjson", chunk_size=100)
+
+    assert len(chunks) > 1
+    assert all(len(chunk) < 200 for chunk in chunks)
+    lines = "".join(chunks).splitlines()
+    assert len(lines) == 20
+    assert json.loads(lines[1]) == {"measurement_date": "2024-01-02", "weight": 79.5, "notes": "day 1"}
+
+
+@pytest.mark.asyncio
+async def test_iter_chunks_empty_csv_has_header():
+    chunks = await collect([], "csv", chunk_size=1024)
+
+    assert chunks == ["Date,Weight,Notes\r\n"]
+
+
+class ExportConnection:
+    # Serves make_rows(5) through transaction() and cursor(), noting how many
+    # pooled connections are out while each row is read
+    def __init__(self, pool):
+        self.pool = pool
+        self.held_while_streaming = []
+
+    @asynccontextmanager
+    async def transaction(self, readonly=False):
+        yield
+
+    async def cursor(self, query, *args, prefetch=None):
+        for row in make_rows(5):
+            self.held_while_streaming.append(self.pool.size - len(self.pool.free))
+            yield row
+
+
+class ExportPool:
+    def __init__(self, size=2):
+        self.free = [ExportConnection(self) for _ in range(size)]
+        self.size = size
+        self.acquired = 0
+
+    async def acquire(self, timeout=None):
+        self.acquired += 1
+        return self.free.pop()
+
+    async def release(self, connection):
+        self.free.append(connection)
+
+
+def test_streamed_export_holds_only_the_request_connection(monkeypatch):
+    db = Database()
+    db.pool = ExportPool()
+    monkeypatch.setattr(database_module, "database", db)
+    auth.user_cache.set("jane", {"id": 7, "username": "jane", "email": "jane@example.com", "height": None})
+    app = FastAPI()
+    app.include_router(measurements.router)
+    connections = list(db.pool.free)
+
+    try:
+        with TestClient(app) as client:
+            response = client.get(
+                "/export", headers={"Authorization": f"Bearer {auth.create_access_token({'sub': 'jane'})}"}
+            )
+    finally:
+        auth.user_cache.pop("jane")
+
+    assert response.status_code == 200
+    assert len(response.text.splitlines()) == 6
+    # The rows came off the request's connection, still checked out, and no
+    # second connection was taken for the stream
+    held = [count for connection in connections for count in connection.held_while_streaming]
+    assert held == [1] * 5
+    assert db.pool.acquired == 1
+    assert len(db.pool.free) == db.pool.size
@@ -0,0 +1,86 @@
+import orjson
+import pytest
+from datetime import date, timedelta
+from unittest.mock import AsyncMock
+
+import goals
+
+
+async def add_goal(connection, user_id, target, start, target_date):
+    return await connection.fetchval(
+        "INSERT INTO goals (user_id, target_weight, target_date, start_weight) VALUES ($1, $2, $3, $4) RETURNING id",
+        user_id, target, target_date, start,
+    )
+
+
+async def progress(connection, user_id, slope_days=30):
+    rows = await connection.fetch(goals.GOAL_PROGRESS_QUERY, user_id, slope_days, goals.GOAL_PROJECTION_MAX_DAYS)
+    return {row["id"]: dict(row) for row in rows}
+
+
+@pytest.mark.asyncio
+async def test_goal_progress(db_connection, db_user):
+    user_id = db_user
+    start = date(2024, 1, 1)
+    # An old reading outside the slope window, then 10 days losing 0.2 kg a day
+    await db_connection.execute(
+        "INSERT INTO weight_measurements (user_id, measurement_date, weight) VALUES ($1, $2, 100)",
+        user_id, start - timedelta(days=200),
+    )
+    await db_connection.executemany(
+        "INSERT INTO weight_measurements (user_id, measurement_date, weight) VALUES ($1, $2, $3)",
+        [(user_id, start + timedelta(days=day), 90 - 0.2 * day) for day in range(10)],
+    )
+    latest = start + timedelta(days=9)  # 88.2 kg
+    loss = await add_goal(db_connection, user_id, 80, 90, date(2024, 3, 1))
+    reached = await add_goal(db_connection, user_id, 89, 90, date(2024, 2, 1))
+    gain = await add_goal(db_connection, user_id, 95, 85, date(2024, 6, 1))
+
+    result = await progress(db_connection, user_id)
+
+    assert result[loss]["current_weight"] == pytest.approx(88.2)
+    assert result[loss]["latest_date"] == latest
+    assert result[loss]["slope"] == pytest.approx(-0.2)
+    assert result[loss]["percent_complete"] == pytest.approx(18.0)
+    assert result[loss]["kg_remaining"] == pytest.approx(8.2)
+    assert result[loss]["reached"] is False
+    assert result[loss]["estimated_date"] == latest + timedelta(days=41)
+
+    assert result[reached]["reached"] is True
+    assert result[reached]["percent_complete"] == 100.0
+    assert result[reached]["kg_remaining"] == 0
+    assert result[reached]["estimated_date"] is None
+
+    # Losing weight moves away from a gain goal, so there is no projection
+    assert result[gain]["percent_complete"] == pytest.approx(32.0)
+    assert result[gain]["kg_remaining"] == pytest.approx(6.8)
+    assert result[gain]["estimated_date"] is None
+
+
+@pytest.mark.asyncio
+async def test_goal_progress_without_measurements(db_connection, db_user):
+    user_id = db_user
+    goal_id = await add_goal(db_connection, user_id, 80, 90, date(2024, 3, 1))
+
+    result = await progress(db_connection, user_id)
+
+    assert result[goal_id]["current_weight"] is None
+    assert result[goal_id]["percent_complete"] is None
+    assert result[goal_id]["kg_remaining"] is None
+    assert result[goal_id]["estimated_date"] is None
+
+
+@pytest.mark.asyncio
+async def test_get_goals_with_progress_uses_single_query():
+    connection = AsyncMock()
+    connection.fetch.return_value = []
+
+    response = await goals.get_goals(
+        include="progress", current_user={"id": 7}, connection=connection, etag='"7-1-x"'
+    )
+
+    connection.fetch.assert_awaited_once_with(
+        goals.GOAL_PROGRESS_QUERY, 7, goals.GOAL_SLOPE_DAYS, goals.GOAL_PROJECTION_MAX_DAYS
+    )
+    assert orjson.loads(response.body) == {"goals": []}
+    assert response.headers["etag"] == '"7-1-x"'
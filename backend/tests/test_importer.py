@@ -0,0 +1,117 @@
+import io
+import pytest
+from datetime import date
+from decimal import Decimal
+from unittest.mock import AsyncMock, MagicMock
+from fastapi import UploadFile
+
+import importer
+
+
+def make_upload(text, filename="measurements.csv"):
+    return UploadFile(file=io.BytesIO(text.encode("utf-8")), filename=filename)
+
+
+async def collect(file, **kwargs):
+    rows, rejected = [], 0
+    async for batch, batch_rejected in importer.iter_batches(file, **kwargs):
+        rows.extend(batch)
+        rejected += batch_rejected
+    return rows, rejected
+
+
+@pytest.mark.asyncio
+async def test_iter_batches_validates_rows():
+    upload = make_upload(
+        "Date,Weight,Notes\n"
+        "2024-01-01,80.5,Morning\n"
+        "2024-01-02,not-a-number,\n"
+        "20240103,80.1,\n"
+        "2024-01-04,-1,\n"
+        "\n"
+        "2024-01-05,79.999,Evening\n"
+    )
+
+    rows, rejected = await collect(upload)
+
+    assert rows == [
+        (1, date(2024, 1, 1), Decimal("80.50"), "Morning"),
+        (5, date(2024, 1, 5), Decimal("80.00"), "Evening"),
+    ]
+    assert rejected == 3
+
+
+@pytest.mark.asyncio
+async def test_iter_batches_handles_chunk_boundaries_and_quoted_newlines():
+    lines = [f"{70 + i / 10:.1f},2024-02-{i + 1:02d},\r\n" for i in range(20)]
+    lines[0] = '70.0,2024-02-01,"two\nlines, ""quoted"""\r\n'
+    text = "\ufeffWeight,Date,Notes\r\n" + "".join(lines)
+    upload = make_upload(text)
+
+    rows, rejected = await collect(upload, batch_size=7, chunk_size=5)
+
+    assert rejected == 0
+    assert len(rows) == 20
+    assert rows[0] == (1, date(2024, 2, 1), Decimal("70.00"), 'two\nlines, "quoted"')
+    assert rows[-1][1] == date(2024, 2, 20)
+
+
+@pytest.mark.asyncio
+async def test_iter_batches_requires_header_columns():
+    with pytest.raises(importer.CSVFormatError):
+        await collect(make_upload("Day,Kg\n2024-01-01,80\n"))
+    with pytest.raises(importer.CSVFormatError):
+        await collect(make_upload(""))
+
+
+@pytest.mark.asyncio
+async def test_import_csv_reports_counts():
+    upload = make_upload(
+        "Date,Weight\n"
+        "2024-01-01,80\n"
+        "2024-01-01,81\n"
+        "2024-01-02,79\n"
+        "bad,79\n"
+    )
+
+    mock_connection = AsyncMock()
+    mock_connection.execute = AsyncMock(side_effect=["CREATE TABLE", "INSERT 0 1"])
+    mock_transaction = MagicMock()
+    mock_transaction.__aenter__.return_value = None
+    mock_transaction.__aexit__.return_value = None
+    mock_connection.transaction = MagicMock(return_value=mock_transaction)
+
+    result = await importer.import_csv(mock_connection, 1, upload, batch_size=2)
+
+    assert result == {"inserted": 1, "duplicates": 2, "rejected": 1}
+    assert mock_connection.copy_records_to_table.await_count == 2
+    merge_args = mock_connection.execute.await_args_list[1].args
+    assert merge_args[1] == 1
+
+
+@pytest.mark.asyncio
+async def test_non_utf8_upload_is_a_format_error():
+    text = "Date,Weight,Notes\n2024-01-01,80,\n2024-01-02,79,Pesée après café\n"
+    data = text.encode("latin-1")
+
+    offset = data.index("é".encode("latin-1"))
+
+    with pytest.raises(importer.CSVFormatError) as exc_info:
+        await collect(UploadFile(file=io.BytesIO(data), filename="latin1.csv"), chunk_size=7)
+    assert str(exc_info.value) == f"file is not UTF-8 encoded (invalid byte at offset {offset}, line 3)"
+
+    # The import endpoint answers 400 rather than failing with a 500
+    from fastapi import HTTPException
+    from measurements import import_measurements
+    mock_connection = AsyncMock()
+    mock_transaction = MagicMock()
+    mock_transaction.__aenter__.return_value = None
+    mock_transaction.__aexit__.return_value = None
+    mock_connection.transaction = MagicMock(return_value=mock_transaction)
+    with pytest.raises(HTTPException) as exc_info:
+        await import_measurements(
+            file=UploadFile(file=io.BytesIO(data), filename="latin1.csv"),
+            current_user={"id": 1}, connection=mock_connection,
+        )
+    assert exc_info.value.status_code == 400
+    assert exc_info.value.detail.startswith("Invalid CSV file: file is not UTF-8 encoded")
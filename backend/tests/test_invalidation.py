@@ -0,0 +1,105 @@
+import asyncio
+import json
+import uuid
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+import migrate
+import auth
+from invalidation import InvalidationBus
+
+
+def make_bus():
+    database = MagicMock()
+    connection = MagicMock()
+    connection.add_listener = AsyncMock()
+    connection.remove_listener = AsyncMock()
+    database.acquire_connection = AsyncMock(return_value=connection)
+    database.release = AsyncMock()
+    return InvalidationBus(database), database, connection
+
+
+@pytest.mark.asyncio
+async def test_dispatch_passes_changes_to_subscribers():
+    bus, _, connection = make_bus()
+    changes = []
+    bus.subscribe(changes.append, lambda: None)
+    await bus.start()
+
+    bus.dispatch(connection, 1, "user_changes", '{"id": 3, "username": "jane", "profile": true}')
+    bus.dispatch(connection, 1, "user_changes", "not json")
+
+    connection.add_listener.assert_awaited_once_with("user_changes", bus.dispatch)
+    assert changes == [{"id": 3, "username": "jane", "profile": True}]
+    assert bus.stats() == {"listening": True, "received": 2, "resets": 0}
+
+
+@pytest.mark.asyncio
+async def test_lost_connection_relistens_and_resets_subscribers():
+    bus, database, connection = make_bus()
+    reset = MagicMock()
+    bus.subscribe(lambda change: None, reset)
+    await bus.start()
+
+    bus.connection_lost(connection)
+    await bus._reconnect_task
+
+    database.release.assert_awaited_once_with(connection)
+    assert database.acquire_connection.await_count == 2
+    reset.assert_called_once_with()
+    assert bus.stats()["listening"] is True
+
+
+@pytest.mark.asyncio
+async def test_stop_releases_listener_connection():
+    bus, database, connection = make_bus()
+    await bus.start()
+
+    await bus.stop()
+
+    connection.remove_listener.assert_awaited_once_with("user_changes", bus.dispatch)
+    database.release.assert_awaited_once_with(connection)
+    assert bus.stats()["listening"] is False
+
+
+def test_forget_user_only_drops_profile_changes():
+    auth.user_cache.set("jane", {"id": 3})
+    auth.forget_user({"id": 3, "username": "jane", "profile": False})
+    assert auth.user_cache.get("jane") == {"id": 3}
+
+    auth.forget_user({"id": 3, "username": "jane", "profile": True})
+    assert auth.user_cache.get("jane") is None
+
+
+@pytest.mark.asyncio
+async def test_user_changes_are_notified_on_commit(connect):
+    # Notifications are only sent on commit, so this cannot use the rolled
+    # back db_connection fixture; the test cleans up after itself instead
+    writer = await connect()
+    listener = await connect()
+    received = asyncio.Queue()
+    name = f"notify_{uuid.uuid4().hex[:12]}"
+    try:
+        await migrate.apply_migrations(writer)
+        await listener.add_listener("user_changes", lambda *args: received.put_nowait(json.loads(args[3])))
+        user_id = await writer.fetchval(
+            "INSERT INTO users (username, password_hash, email) VALUES ($1, 'x', $2) RETURNING id",
+            name, f"{name}@example.com",
+        )
+        await writer.execute("UPDATE users SET age = 40 WHERE id = $1", user_id)
+        await writer.execute(
+            "INSERT INTO weight_measurements (user_id, measurement_date, weight) VALUES ($1, '2024-01-01', 80)",
+            user_id,
+        )
+        profile = await asyncio.wait_for(received.get(), 5)
+        data = await asyncio.wait_for(received.get(), 5)
+    finally:
+        await writer.execute(
+            "DELETE FROM weight_measurements WHERE user_id IN (SELECT id FROM users WHERE username = $1)", name
+        )
+        await writer.execute("DELETE FROM users WHERE username = $1", name)
+        await writer.close()
+        await listener.close()
+
+    assert profile == {"id": user_id, "username": name, "data_version": 0, "profile": True}
+    assert data == {"id": user_id, "username": name, "data_version": 1, "profile": False}
@@ -0,0 +1,242 @@
+import asyncio
+import functools
+import json
+import pytest
+from contextlib import asynccontextmanager
+from unittest.mock import AsyncMock, MagicMock
+from fastapi import HTTPException
+
+import exporter
+import jobs
+import migrate
+from jobs import JobRunner, UploadedFile
+
+
+class ConnectionDatabase:
+    # Hands the runner one fixed connection instead of a pool
+    def __init__(self, connection):
+        self.connection = connection
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield self.connection
+
+
+async def run_next(runner):
+    job = await runner.claim()
+    assert job is not None
+    runner.progress[job["id"]] = 0
+    await runner.run(job)
+    return job["id"]
+
+
+async def job_row(connection, job_id):
+    return await connection.fetchrow("SELECT * FROM jobs WHERE id = $1", job_id)
+
+
+@pytest.mark.asyncio
+async def test_uploaded_file_reads_in_chunks():
+    upload = UploadedFile(b"Date,Weight\n2024-01-01,80\n")
+    assert await upload.read(5) == b"Date,"
+    assert await upload.read() == b"Weight\n2024-01-01,80\n"
+    assert await upload.read(5) == b""
+
+
+@pytest.mark.asyncio
+async def test_import_and_export_jobs_run_to_completion(db_connection, db_user):
+    user_id = db_user
+    runner = JobRunner(ConnectionDatabase(db_connection), workers=1)
+
+    upload = b"Date,Weight,Notes\n2024-01-01,80.5,first\n2024-01-02,80.1,\nbad,1,\n"
+    job_id = await jobs.enqueue(db_connection, user_id, "import", {"filename": "w.csv"}, upload)
+    assert (await job_row(db_connection, job_id))["status"] == "queued"
+    assert await run_next(runner) == job_id
+
+    job = await job_row(db_connection, job_id)
+    assert job["status"] == "succeeded"
+    assert json.loads(job["result"]) == {"inserted": 2, "duplicates": 0, "rejected": 1}
+    assert job["rows_processed"] == 3
+    assert job["attempts"] == 1
+    assert job["input"] is None
+
+    job_id = await jobs.enqueue(db_connection, user_id, "export", {"format": "csv", "from": "2024-01-02", "to": None})
+    await run_next(runner)
+
+    job = await job_row(db_connection, job_id)
+    assert job["status"] == "succeeded"
+    output = b"".join([chunk async for chunk in jobs.stream_output(db_connection, job_id)])
+    assert json.loads(job["result"]) == {"format": "csv", "rows": 1, "bytes": len(output)}
+    assert output.decode("utf-8").splitlines() == ["Date,Weight,Notes", "2024-01-02,80.10,"]
+    assert runner.stats()["succeeded"] == 2
+
+
+@pytest.mark.asyncio
+async def test_export_job_writes_its_file_in_chunks(db_connection, db_user, monkeypatch):
+    monkeypatch.setattr(exporter, "iter_chunks", functools.partial(exporter.iter_chunks, chunk_size=64))
+    await db_connection.execute(
+        """
+        INSERT INTO weight_measurements (user_id, measurement_date, weight, notes)
+        SELECT $1, DATE '2024-01-01' + day, 80, 'note'
+        FROM generate_series(0, 19) AS day
+        """,
+        db_user,
+    )
+    runner = JobRunner(ConnectionDatabase(db_connection), workers=1)
+    job_id = await jobs.enqueue(db_connection, db_user, "export", {"format": "ndjson"})
+    # Output left behind by an earlier run that died before finishing the job
+    await db_connection.execute(jobs.WRITE_JOB_OUTPUT_QUERY, job_id, 0, b"stale")
+    await run_next(runner)
+
+    chunks = await db_connection.fetch("SELECT data FROM job_output WHERE job_id = $1 ORDER BY seq", job_id)
+    assert len(chunks) > 1
+    assert all(len(row["data"]) < 200 for row in chunks)
+    output = b"".join(row["data"] for row in chunks)
+    assert len(output.splitlines()) == 20
+    assert json.loads((await job_row(db_connection, job_id))["result"])["bytes"] == len(output)
+
+    await db_connection.execute("DELETE FROM jobs WHERE id = $1", job_id)
+    assert await db_connection.fetchval("SELECT count(*) FROM job_output WHERE job_id = $1", job_id) == 0
+
+
+@pytest.mark.asyncio
+async def test_invalid_csv_fails_without_retrying(db_connection, db_user):
+    user_id = db_user
+    runner = JobRunner(ConnectionDatabase(db_connection), workers=1)
+
+    job_id = await jobs.enqueue(db_connection, user_id, "import", {}, b"Day,Kilos\n2024-01-01,80\n")
+    await run_next(runner)
+
+    job = await job_row(db_connection, job_id)
+    assert job["status"] == "failed"
+    assert job["error"] == "Invalid CSV file: header must contain Date and Weight columns"
+    assert job["finished_at"] is not None
+
+    # A file in another encoding is just as final
+    job_id = await jobs.enqueue(db_connection, user_id, "import", {}, "Date,Weight\n2024-01-01,80 é\n".encode("latin-1"))
+    await run_next(runner)
+
+    job = await job_row(db_connection, job_id)
+    assert (job["status"], job["attempts"]) == ("failed", 1)
+    assert job["error"].startswith("Invalid CSV file: file is not UTF-8 encoded")
+
+
+@pytest.mark.asyncio
+async def test_stale_running_jobs_are_reclaimed_until_attempts_run_out(db_connection, db_user, monkeypatch):
+    user_id = db_user
+    runner = JobRunner(ConnectionDatabase(db_connection), workers=1)
+    monkeypatch.setattr(jobs, "JOB_MAX_ATTEMPTS", 2)
+
+    job_id = await jobs.enqueue(db_connection, user_id, "export", {"format": "ndjson"})
+    stale = "UPDATE jobs SET heartbeat_at = now() - interval '1 hour' WHERE id = $1"
+    # A worker claimed it and died twice
+    for attempt in (1, 2):
+        claimed = await runner.claim()
+        assert (claimed["id"], claimed["attempts"]) == (job_id, attempt)
+        await db_connection.execute(stale, job_id)
+
+    assert await runner.claim() is None
+    job = await job_row(db_connection, job_id)
+    assert job["status"] == "failed"
+    assert job["error"] == "Gave up after 2 attempts"
+
+
+@pytest.mark.asyncio
+async def test_concurrent_claims_skip_locked_jobs(connect, make_user):
+    # Needs committed jobs visible to two connections; both claims are rolled
+    # back and the user (with its jobs) deleted afterwards
+    first = await connect()
+    second = await connect()
+    user_id = None
+    try:
+        await migrate.apply_migrations(first)
+        if await first.fetchval("SELECT count(*) FROM jobs WHERE status IN ('queued', 'running')"):
+            pytest.skip("other jobs are pending in this database")
+        user_id = await make_user(first)
+        job_ids = [await jobs.enqueue(first, user_id, "export", {}) for _ in range(2)]
+
+        first_claim = first.transaction()
+        second_claim = second.transaction()
+        await first_claim.start()
+        await second_claim.start()
+        claimed = [
+            await first.fetchval(jobs.CLAIM_JOB_QUERY, jobs.JOB_STALE_AFTER),
+            await second.fetchval(jobs.CLAIM_JOB_QUERY, jobs.JOB_STALE_AFTER),
+        ]
+        await first_claim.rollback()
+        await second_claim.rollback()
+    finally:
+        await first.execute("DELETE FROM users WHERE id = $1", user_id)
+        await first.close()
+        await second.close()
+
+    assert claimed == job_ids
+
+
+@pytest.mark.asyncio
+async def test_stop_requeues_interrupted_jobs(monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_SHUTDOWN_TIMEOUT", 0.01)
+    connection = MagicMock()
+    connection.execute = AsyncMock()
+    runner = JobRunner(ConnectionDatabase(connection), workers=1)
+    started = asyncio.Event()
+
+    async def hang(connection, job):
+        started.set()
+        await asyncio.Event().wait()
+
+    runner.execute = hang
+    job = {"id": 7, "user_id": 1, "kind": "import", "params": "{}", "input": b"", "attempts": 1}
+    runner.progress[7] = 0
+    runner.tasks[7] = asyncio.create_task(runner.run(job))
+    await started.wait()
+
+    await runner.stop()
+
+    connection.execute.assert_awaited_once_with(jobs.REQUEUE_JOBS_QUERY, [7])
+    assert runner.stats()["running"] == 0
+
+
+@pytest.mark.asyncio
+async def test_get_job_is_scoped_to_the_user():
+    connection = MagicMock()
+    connection.fetchrow = AsyncMock(return_value=None)
+    with pytest.raises(HTTPException) as exc:
+        await jobs.get_job(5, current_user={"id": 2}, connection=connection)
+    assert exc.value.status_code == 404
+    connection.fetchrow.assert_awaited_once_with(jobs.JOB_STATUS_QUERY, 5, 2)
+
+    connection.fetchrow = AsyncMock(return_value={
+        "id": 5, "kind": "export", "status": "succeeded", "params": '{"format": "csv"}',
+        "result": '{"rows": 3}', "error": None, "rows_processed": 3, "attempts": 1,
+        "created_at": None, "started_at": None, "finished_at": None, "has_output": True,
+    })
+    job = await jobs.get_job(5, current_user={"id": 2}, connection=connection)
+    assert job["params"] == {"format": "csv"}
+    assert job["result"] == {"rows": 3}
+    assert job["result_url"] == "/jobs/5/result"
+    assert "has_output" not in job
+
+
+@pytest.mark.asyncio
+async def test_job_result_waits_for_the_export():
+    connection = MagicMock()
+    connection.fetchrow = AsyncMock(return_value={"kind": "export", "status": "running", "params": "{}"})
+    with pytest.raises(HTTPException) as exc:
+        await jobs.get_job_result(5, current_user={"id": 2}, connection=connection)
+    assert exc.value.status_code == 409
+
+    connection.fetchrow = AsyncMock(return_value={"kind": "import", "status": "succeeded", "params": "{}"})
+    with pytest.raises(HTTPException) as exc:
+        await jobs.get_job_result(5, current_user={"id": 2}, connection=connection)
+    assert exc.value.status_code == 404
+
+    async def cursor(query, job_id, prefetch=None):
+        for data in (b'{"weight": 80.0}\n', b'{"weight": 79.5}\n'):
+            yield {"data": data}
+
+    connection.fetchrow = AsyncMock(return_value={"kind": "export", "status": "succeeded", "params": '{"format": "ndjson"}'})
+    connection.transaction = MagicMock(return_value=MagicMock(__aenter__=AsyncMock(), __aexit__=AsyncMock(return_value=None)))
+    connection.cursor = cursor
+    response = await jobs.get_job_result(5, current_user={"id": 2}, connection=connection)
+    assert response.media_type == "application/x-ndjson"
+    assert [chunk async for chunk in response.body_iterator] == [b'{"weight": 80.0}\n', b'{"weight": 79.5}\n']
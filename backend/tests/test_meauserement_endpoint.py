@@ -1,5 +1,6 @@
+import orjson
 import pytest
-from unittest.mock import AsyncMock, MagicMock, patch
+from unittest.mock import AsyncMock
 from fastapi import HTTPException
 from datetime import date
 
@@ -17,18 +18,14 @@ async def test_get_measurements():
     mock_connection = AsyncMock()
     mock_connection.fetch = AsyncMock(return_value=mock_rows)
 
-    mock_acquire = MagicMock()
-    mock_acquire.__aenter__.return_value = mock_connection
-    mock_acquire.__aexit__.return_value = None
+    from measurements import get_measurements
 
-    with patch("measurements.database.pool.acquire", return_value=mock_acquire):
-        from measurements import get_measurements
+    response = await get_measurements(current_user={"id": 1}, connection=mock_connection, etag='"1-1-x"')
+    result = orjson.loads(response.body)
 
-        result = await get_measurements(current_user={"id": 1})
-
-        assert len(result["measurements"]) == 1
-        assert result["measurements"][0]["weight"] == 75.5
-        mock_connection.fetch.assert_called_once()
+    assert len(result["measurements"]) == 1
+    assert result["measurements"][0]["weight"] == 75.5
+    mock_connection.fetch.assert_called_once()
 
 
 @pytest.mark.asyncio
@@ -43,17 +40,12 @@ async def test_add_measurement():
     mock_connection = AsyncMock()
     mock_connection.execute = AsyncMock(return_value=None)
 
-    mock_acquire = MagicMock()
-    mock_acquire.__aenter__.return_value = mock_connection
-    mock_acquire.__aexit__.return_value = None
-
-    with patch("measurements.database.pool.acquire", return_value=mock_acquire):
-        from measurements import add_measurement
+    from measurements import add_measurement
 
-        result = await add_measurement(mock_measurement, current_user={"id": 1})
+    result = await add_measurement(mock_measurement, current_user={"id": 1}, connection=mock_connection)
 
-        assert result == {"message": "Measurement added successfully"}
-        mock_connection.execute.assert_called_once()
+    assert result == {"message": "Measurement added successfully"}
+    mock_connection.execute.assert_called_once()
 
 
 @pytest.mark.asyncio
@@ -72,3 +64,91 @@ async def test_add_measurement_invalid_date():
         await add_measurement(mock_measurement, current_user={"id": 1})
 
     assert exc_info.value.status_code == 400
+
+
+def make_connection(rows):
+    mock_connection = AsyncMock()
+    mock_connection.fetch = AsyncMock(return_value=rows)
+    return mock_connection
+
+
+@pytest.mark.asyncio
+async def test_get_measurements_keyset_page():
+    mock_rows = [
+        {"id": 10 - i, "measurement_date": date(2023, 1, 20 - i), "weight": 75.5, "notes": ""}
+        for i in range(3)
+    ]
+    mock_connection = make_connection(mock_rows)
+    from measurements import get_measurements
+
+    response = await get_measurements(
+        limit=2, before="2023-01-21:11", fields="measurement_date,weight",
+        current_user={"id": 1}, connection=mock_connection, etag='"1-1-x"',
+    )
+
+    assert orjson.loads(response.body) == {
+        "measurements": [
+            {"measurement_date": "2023-01-20", "weight": 75.5},
+            {"measurement_date": "2023-01-19", "weight": 75.5},
+        ],
+        "next_cursor": "2023-01-19:9",
+    }
+    query, *args = mock_connection.fetch.call_args.args
+    assert "(measurement_date, id) < ($2, $3)" in query
+    assert "DESC" in query
+    assert args == [1, date(2023, 1, 21), 11, 3]
+
+
+@pytest.mark.asyncio
+async def test_get_measurements_after_cursor_returns_newest_first():
+    # after= walks forward in time, so the query runs ascending
+    mock_rows = [
+        {"id": i, "measurement_date": date(2023, 1, i), "weight": 70.0, "notes": ""}
+        for i in range(6, 9)
+    ]
+    mock_connection = make_connection(mock_rows)
+    from measurements import get_measurements
+
+    response = await get_measurements(
+        limit=2, after="2023-01-05", current_user={"id": 1}, connection=mock_connection, etag='"1-1-x"'
+    )
+    result = orjson.loads(response.body)
+
+    assert [m["id"] for m in result["measurements"]] == [7, 6]
+    assert result["next_cursor"] == "2023-01-07:7"
+    query, *args = mock_connection.fetch.call_args.args
+    assert "ASC" in query
+    assert args == [1, date(2023, 1, 5), 2 ** 31 - 1, 3]
+
+
+@pytest.mark.asyncio
+async def test_get_measurements_rejects_bad_parameters():
+    from measurements import get_measurements
+
+    for kwargs in ({"fields": "weight,password_hash"}, {"before": "yesterday"}):
+        with pytest.raises(HTTPException) as exc_info:
+            await get_measurements(current_user={"id": 1}, **kwargs)
+        assert exc_info.value.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_field_order_does_not_create_new_statements():
+    import itertools
+    import measurements
+    import queries
+
+    texts = set()
+    for fields in itertools.permutations(["weight", "measurement_date", "id"]):
+        mock_connection = make_connection([{"id": 1, "measurement_date": date(2023, 1, 1), "weight": 70.0}])
+        response = await measurements.get_measurements(
+            fields=",".join(fields), current_user={"id": 1}, connection=mock_connection, etag='"1-1-x"',
+        )
+        # Keys come back in the order they were asked for
+        assert list(orjson.loads(response.body)["measurements"][0]) == list(fields)
+        texts.add(mock_connection.fetch.call_args.args[0])
+
+    assert len(texts) == 1
+    # Only the full-column listing is prepared on every connection
+    assert not queries.statements[texts.pop()].prepare
+    full = measurements.list_query(measurements.MEASUREMENT_FIELDS, False, False, True)
+    assert queries.statements[full].prepare
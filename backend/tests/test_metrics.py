@@ -0,0 +1,83 @@
+from types import SimpleNamespace
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+
+import metrics
+import queries
+from cache import TTLCache
+from database import Database
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_statement_names():
+    module = SimpleNamespace(__name__="analytics", TRENDS_QUERY="SELECT 1 FROM weight_measurements", LIMIT=5)
+    queries.register_module(module)
+
+    assert metrics.statement_name(module.TRENDS_QUERY) == "analytics.trends_query"
+    assert metrics.statement_name("\n  SELECT id FROM goals WHERE user_id = $1") == "select goals"
+    assert metrics.statement_name("INSERT INTO users (username) VALUES ($1)") == "insert users"
+    assert metrics.statement_name("COMMIT;") == "commit"
+
+
+def test_log_query_times_statement():
+    before = sample("db_query_duration_seconds_count", statement="update users")
+    record = SimpleNamespace(query="UPDATE users SET age = $1", elapsed=0.002, exception=ValueError())
+
+    metrics.log_query(record)
+
+    assert sample("db_query_duration_seconds_count", statement="update users") == before + 1
+    assert sample("db_query_errors_total", statement="update users") >= 1
+
+
+def test_middleware_labels_by_route_template():
+    app = FastAPI()
+    app.add_middleware(metrics.MetricsMiddleware)
+
+    @app.get("/items/{item_id}")
+    async def read_item(item_id: int):
+        return {"id": item_id}
+
+    labels = {"method": "GET", "route": "/items/{item_id}", "status": "200"}
+    before = sample("http_request_duration_seconds_count", **labels)
+    with TestClient(app) as client:
+        client.get("/items/1")
+        client.get("/items/2")
+        client.get("/nowhere")
+
+    assert sample("http_request_duration_seconds_count", **labels) == before + 2
+    assert sample("http_request_duration_seconds_count", method="GET", route="unmatched", status="404") >= 1
+
+
+def test_stats_collector_reads_counters():
+    database = Database()
+    database.acquire_count = 3
+    database.acquire_wait_total = 0.5
+    cache = TTLCache(10, 60)
+    cache.set("a", 1)
+    cache.get("a")
+    cache.get("b")
+    executor = SimpleNamespace(in_flight=2, rejected=7)
+
+    families = {family.name: family for family in metrics.StatsCollector(database, {"user": cache}, executor).collect()}
+
+    assert families["db_pool_size"].samples[0].value == 0
+    wait = {s.name: s.value for s in families["db_pool_acquire_wait_seconds"].samples}
+    assert wait == {"db_pool_acquire_wait_seconds_count": 3, "db_pool_acquire_wait_seconds_sum": 0.5}
+    lookups = {s.labels["result"]: s.value for s in families["cache_requests"].samples}
+    assert lookups == {"hit": 1, "miss": 1}
+    assert families["password_hash_rejected"].samples[0].value == 7
+
+
+def test_main_app_serves_metrics():
+    import main
+
+    # No "with": the lifespan (database connection, migrations) is not needed here
+    response = TestClient(main.app).get("/metrics")
+
+    assert response.status_code == 200
+    assert "db_pool_size" in response.text
+    assert "cache_requests_total" in response.text
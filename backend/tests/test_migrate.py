@@ -0,0 +1,83 @@
+import pytest
+
+import migrate
+
+
+def test_load_migrations_is_ordered_and_unique():
+    migrations = migrate.load_migrations()
+
+    versions = [version for version, _, _ in migrations]
+    assert versions == sorted(versions)
+    assert len(versions) == len(set(versions))
+    assert all(sql.strip() for _, _, sql in migrations)
+
+
+def test_load_migrations_rejects_duplicate_versions(tmp_path):
+    (tmp_path / "0001_first.sql").write_text("SELECT 1;")
+    (tmp_path / "0001_second.sql").write_text("SELECT 2;")
+    (tmp_path / "README.md").write_text("ignored")
+
+    with pytest.raises(RuntimeError):
+        migrate.load_migrations(str(tmp_path))
+
+
+@pytest.mark.asyncio
+async def test_apply_migrations_runs_each_version_once(db_connection):
+    await migrate.apply_migrations(db_connection)
+    extra = [(9999, "test_only", "CREATE TABLE migrate_test_only (id INTEGER)")]
+
+    assert await migrate.apply_migrations(db_connection, extra) == [9999]
+    assert await migrate.apply_migrations(db_connection, extra) == []
+    assert await db_connection.fetchval("SELECT to_regclass('migrate_test_only') IS NOT NULL")
+
+
+@pytest.mark.asyncio
+async def test_migration_waits_for_its_requirement(db_connection, capsys):
+    await migrate.apply_migrations(db_connection)
+    await db_connection.execute("CREATE TABLE migrate_test_ready (ready BOOLEAN)")
+    await db_connection.execute("INSERT INTO migrate_test_ready VALUES (false)")
+    extra = [
+        (9998, "test_waits", "-- requires: (SELECT ready FROM migrate_test_ready)\nCREATE TABLE migrate_test_waited (id INTEGER)"),
+        (9999, "test_after", "CREATE TABLE migrate_test_after (id INTEGER)"),
+    ]
+
+    assert await migrate.apply_migrations(db_connection, extra) == [9999]
+    assert "Waiting to apply migration 9998_test_waits until (SELECT ready FROM migrate_test_ready)" in capsys.readouterr().out
+
+    await db_connection.execute("UPDATE migrate_test_ready SET ready = true")
+    assert await migrate.apply_migrations(db_connection, extra) == [9998]
+
+
+@pytest.mark.asyncio
+async def test_duplicate_readings_are_kept_aside_and_reported(db_connection, capsys):
+    # Replays the migrations in a scratch schema to get the table as it was
+    # before 0004 made (user_id, measurement_date) unique
+    await db_connection.execute("CREATE SCHEMA migrate_test_duplicates")
+    await db_connection.execute("SET LOCAL search_path TO migrate_test_duplicates")
+    migrations = migrate.load_migrations()
+    await migrate.apply_migrations(db_connection, [m for m in migrations if m[0] <= 3])
+    user_id = await db_connection.fetchval(
+        "INSERT INTO users (username, password_hash, email) VALUES ('dup', 'x', 'dup@example.com') RETURNING id"
+    )
+    await db_connection.execute(
+        """
+        INSERT INTO weight_measurements (user_id, measurement_date, weight, notes)
+        VALUES ($1, '2024-01-01', 80, 'first'), ($1, '2024-01-01', 81, 'second'),
+               ($1, '2024-01-01', 82, 'third'), ($1, '2024-01-02', 79, '')
+        """,
+        user_id,
+    )
+    capsys.readouterr()
+
+    await migrate.apply_migrations(db_connection, [m for m in migrations if m[0] == 4])
+
+    kept = await db_connection.fetch(
+        "SELECT measurement_date, notes FROM weight_measurements WHERE user_id = $1 ORDER BY measurement_date", user_id
+    )
+    assert [row["notes"] for row in kept] == ["third", ""]
+    removed = await db_connection.fetch(
+        "SELECT notes, removed_at FROM weight_measurements_duplicates WHERE user_id = $1 ORDER BY id", user_id
+    )
+    assert [row["notes"] for row in removed] == ["first", "second"]
+    assert all(row["removed_at"] is not None for row in removed)
+    assert "Moved 2 same-day duplicate reading(s) to weight_measurements_duplicates" in capsys.readouterr().out
@@ -0,0 +1,119 @@
+import uuid
+import pytest
+from datetime import date
+from unittest.mock import AsyncMock, MagicMock
+
+import migrate
+import partitions
+
+
+async def partition_of(connection, user_id, measurement_date):
+    return await connection.fetchval(
+        "SELECT tableoid::regclass::text FROM weight_measurements WHERE user_id = $1 AND measurement_date = $2",
+        user_id, measurement_date,
+    )
+
+
+@pytest.mark.asyncio
+async def test_readings_are_routed_to_yearly_partitions(db_connection, db_user):
+    user_id = db_user
+    this_year = date.today().year
+    await db_connection.execute(
+        """
+        INSERT INTO weight_measurements (user_id, measurement_date, weight)
+        VALUES ($1, $2, 80), ($1, '1990-06-01', 90)
+        """,
+        user_id, date(this_year, 3, 1),
+    )
+
+    assert await partition_of(db_connection, user_id, date(this_year, 3, 1)) == f"weight_measurements_y{this_year}"
+    assert await partition_of(db_connection, user_id, date(1990, 6, 1)) == "weight_measurements_default"
+
+    # Creating the year's partition moves its readings out of the default one
+    await db_connection.fetchval("SELECT create_weight_measurements_partition(1990)")
+    assert await partition_of(db_connection, user_id, date(1990, 6, 1)) == "weight_measurements_y1990"
+    # The statement triggers still maintain the summary on the partitioned table
+    assert await db_connection.fetchval(
+        "SELECT measurement_count FROM user_weight_stats WHERE user_id = $1", user_id
+    ) == 2
+
+
+@pytest.mark.asyncio
+async def test_ensure_creates_coming_years(db_connection):
+    await migrate.apply_migrations(db_connection)
+    this_year = date.today().year
+
+    created = await partitions.ensure(db_connection, years_ahead=2)
+
+    assert created == [f"weight_measurements_y{year}" for year in range(this_year, this_year + 3)]
+
+
+@pytest.mark.asyncio
+async def test_ensure_is_a_no_op_before_the_migration():
+    connection = MagicMock()
+    connection.fetchval = AsyncMock(return_value=False)
+    connection.fetch = AsyncMock()
+
+    assert await partitions.ensure(connection) == []
+    connection.fetch.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_online_move_keeps_rows_written_during_the_backfill(db_connection, make_user):
+    # Replays the migrations in a scratch schema, stopping after 0009 to
+    # write to the old table while the backfill runs
+    schema = f"partition_test_{uuid.uuid4().hex[:8]}"
+    await db_connection.execute(f"CREATE SCHEMA {schema}")
+    await db_connection.execute(f"SET LOCAL search_path TO {schema}")
+    migrations = migrate.load_migrations()
+    await migrate.apply_migrations(db_connection, [m for m in migrations if m[0] <= 8])
+    # Past the size 0009 copies by itself
+    await db_connection.execute("SELECT setval('weight_measurements_id_seq', 100000)")
+    user_id = await make_user(db_connection)
+    await db_connection.execute(
+        """
+        INSERT INTO weight_measurements (user_id, measurement_date, weight, notes)
+        SELECT $1, DATE '2023-12-25' + day, 80 + day / 10.0, ''
+        FROM generate_series(0, 9) AS day
+        """,
+        user_id,
+    )
+
+    await migrate.apply_migrations(db_connection, [m for m in migrations if m[0] == 9])
+    await db_connection.execute(
+        "UPDATE weight_measurements SET measurement_date = '2025-01-01' WHERE user_id = $1 AND measurement_date = '2023-12-25'",
+        user_id,
+    )
+    await db_connection.execute(
+        "DELETE FROM weight_measurements WHERE user_id = $1 AND measurement_date = '2024-01-03'", user_id
+    )
+    await db_connection.execute(
+        "INSERT INTO weight_measurements (user_id, measurement_date, weight) VALUES ($1, '2024-02-01', 70)", user_id
+    )
+    # The swap waits for the backfill rather than copying the rows itself
+    assert await migrate.apply_migrations(db_connection, [m for m in migrations if m[0] == 10]) == []
+    await partitions.backfill(db_connection, batch_size=4)
+    readings = "SELECT id, measurement_date, weight FROM weight_measurements WHERE user_id = $1 ORDER BY id"
+    expected = await db_connection.fetch(readings, user_id)
+    await migrate.apply_migrations(db_connection, [m for m in migrations if m[0] == 10])
+
+    assert await db_connection.fetchval(
+        "SELECT relkind::text FROM pg_class WHERE oid = 'weight_measurements'::regclass"
+    ) == "p"
+    moved = await db_connection.fetch(readings, user_id)
+    assert moved == expected
+    assert len(moved) == 10
+    # Partitions exist for the years that held readings when 0009 ran, and
+    # for this and next year; other dates wait in the default partition
+    this_year = date.today().year
+    years = {2023, 2024, this_year, this_year + 1}
+    assert await db_connection.fetchval(
+        "SELECT array_agg(inhrelid::regclass::text ORDER BY inhrelid::regclass::text) FROM pg_inherits "
+        "WHERE inhparent = 'weight_measurements'::regclass"
+    ) == sorted(["weight_measurements_default", *(f"weight_measurements_y{year}" for year in years)])
+    assert await partition_of(db_connection, user_id, date(2025, 1, 1)) == (
+        "weight_measurements_y2025" if 2025 in years else "weight_measurements_default"
+    )
+    assert await db_connection.fetchval(
+        "SELECT measurement_count FROM user_weight_stats WHERE user_id = $1", user_id
+    ) == 10
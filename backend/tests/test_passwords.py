@@ -0,0 +1,45 @@
+import asyncio
+import threading
+import pytest
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+import passwords
+
+
+@pytest.mark.asyncio
+async def test_bounded_executor_rejects_when_full():
+    executor = passwords.BoundedExecutor(workers=1, queue_limit=1)
+    release = threading.Event()
+    try:
+        running = [asyncio.ensure_future(executor.run(release.wait)) for _ in range(2)]
+        await asyncio.sleep(0)
+
+        with pytest.raises(HTTPException) as exc_info:
+            await executor.run(release.wait)
+
+        assert exc_info.value.status_code == 503
+        assert exc_info.value.headers["Retry-After"] == "1"
+        assert executor.rejected == 1
+
+        release.set()
+        assert await asyncio.gather(*running) == [True, True]
+        assert executor.in_flight == 0
+    finally:
+        release.set()
+        executor.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_verify_password_reports_outdated_hash(monkeypatch):
+    old_hash = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash("secret")
+    monkeypatch.setattr(passwords, "pwd_context", CryptContext(schemes=["bcrypt"], bcrypt__rounds=5))
+
+    valid, new_hash = await passwords.verify_password("secret", old_hash)
+    assert valid
+    assert new_hash.startswith("$2b$05$")
+
+    valid, new_hash = await passwords.verify_password("secret", new_hash)
+    assert valid and new_hash is None
+
+    assert await passwords.verify_password("wrong", old_hash) == (False, None)
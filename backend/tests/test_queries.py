@@ -0,0 +1,85 @@
+import pytest
+import pytest_asyncio
+from types import SimpleNamespace
+
+import asyncpg
+import database as database_settings
+import queries
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    monkeypatch.setattr(queries, "statements", {})
+    monkeypatch.setattr(queries, "registered", [])
+    return queries
+
+
+def test_register_normalizes_text(registry):
+    statement = registry.register("goals.delete", """
+        DELETE FROM goals
+        WHERE id = $1;
+    """)
+
+    assert statement.sql == "DELETE FROM goals\nWHERE id = $1"
+    assert registry.name_of(statement.sql) == "goals.delete"
+    assert registry.register("other", "\n        DELETE FROM goals\n        WHERE id = $1;\n    ") is statement
+
+
+def test_register_module_names_query_constants(registry):
+    module = SimpleNamespace(__name__="goals", GOALS_QUERY="SELECT 1", GOAL_SLOPE_DAYS=30)
+
+    registry.register_module(module, prepare=False)
+
+    assert registry.name_of("SELECT 1") == "goals.goals_query"
+    assert registry.registered[0].prepare is False
+
+
+def test_stats_groups_variants_by_name(registry):
+    first = registry.register("measurements.list", "SELECT 1")
+    second = registry.register("measurements.list", "SELECT 2")
+    first.record(0.002, False)
+    second.record(0.004, True)
+
+    assert registry.stats() == [{
+        "name": "measurements.list", "calls": 2, "errors": 1,
+        "total_ms": 6.0, "avg_ms": 3.0, "max_ms": 4.0, "variants": 2,
+    }]
+
+
+@pytest_asyncio.fixture
+async def registered_connection():
+    try:
+        connection = await asyncpg.connect(
+            host=database_settings.DB_HOST,
+            database=database_settings.DB_NAME,
+            user=database_settings.DB_USER,
+            password=database_settings.DB_PASSWORD,
+            port=database_settings.DB_PORT,
+            timeout=2,
+            connection_class=queries.RegisteredConnection,
+        )
+    except (OSError, asyncpg.PostgresError, TimeoutError):
+        pytest.skip("database not available")
+    yield connection
+    await connection.close()
+
+
+PREPARED_QUERY = "SELECT count(*) FROM pg_prepared_statements WHERE statement = $1"
+
+
+@pytest.mark.asyncio
+async def test_registered_statements_are_prepared_on_connect(registry, registered_connection):
+    statement = registry.register("test.lookup", "\n    SELECT $1::int + 1;\n")
+    registry.register("test.broken", "SELECT * FROM no_such_table WHERE id = $1")
+
+    assert await registered_connection.prepare_registered() == 1
+    assert await registered_connection.fetchval(PREPARED_QUERY, statement.sql) == 1
+
+    assert await registered_connection.fetchval("\n    SELECT $1::int + 1;\n", 41) == 42
+    # Still the one statement prepared on connect
+    assert await registered_connection.fetchval(PREPARED_QUERY, statement.sql) == 1
+    assert (statement.calls, statement.errors) == (1, 0)
+
+    with pytest.raises(asyncpg.PostgresError):
+        await registered_connection.fetchval("\n    SELECT $1::int + 1;\n", "x")
+    assert statement.errors == 1
@@ -0,0 +1,102 @@
+import json
+import re
+import pytest
+import pytest_asyncio
+from datetime import date
+
+import analytics
+import exporter
+import goals
+import importer
+import measurements
+import migrate
+
+# EXPLAIN checks that the per-user hot queries are served by the indexes from
+# migrations/0004 (on weight_measurements, one per yearly partition since 0009). Sequential and bitmap scans are switched off so the test
+# tables being tiny does not matter: if the planner still finds a plan without
+# a Sort, the index provides both the filter and the order.
+
+
+@pytest_asyncio.fixture
+async def plan_connection(db_connection):
+    await migrate.apply_migrations(db_connection)
+    await db_connection.execute("SET LOCAL enable_seqscan = off")
+    await db_connection.execute("SET LOCAL enable_bitmapscan = off")
+    return db_connection
+
+
+async def explain(connection, query, *args):
+    plan = await connection.fetchval(f"EXPLAIN (FORMAT JSON) {query}", *args)
+    return json.loads(plan)[0]["Plan"]
+
+
+def walk(node):
+    yield node
+    for child in node.get("Plans", []):
+        yield from walk(child)
+
+
+# weight_measurements_y2024_user_date_key -> weight_measurements_user_date_key
+PARTITION_INDEX = re.compile(r"^weight_measurements_y\d{4}_")
+
+
+def assert_uses_index(plan, index_name, sorted_by_index=True):
+    nodes = list(walk(plan))
+    used = {PARTITION_INDEX.sub("weight_measurements_", node.get("Index Name", "")) for node in nodes}
+    assert index_name in used, json.dumps(plan, indent=2)
+    assert not any(
+        node["Node Type"] == "Seq Scan" and node.get("Relation Name", "").startswith(("weight_measurements", "goals"))
+        for node in nodes
+    )
+    if sorted_by_index:
+        assert not any(node["Node Type"] == "Sort" for node in nodes), json.dumps(plan, indent=2)
+
+
+@pytest.mark.asyncio
+async def test_measurement_listing_uses_user_date_index(plan_connection):
+    query = measurements.list_query(measurements.MEASUREMENT_FIELDS, True, False, True)
+    plan = await explain(plan_connection, query, 1, date(2024, 1, 1), 10, 101)
+
+    # The id tie-break is finished off by an Incremental Sort on top of the index order
+    assert_uses_index(plan, "weight_measurements_user_date_key", sorted_by_index=False)
+    assert not any(node["Node Type"] == "Sort" for node in walk(plan))
+
+
+@pytest.mark.asyncio
+async def test_trends_query_is_index_only(plan_connection):
+    plan = await explain(plan_connection, analytics.TRENDS_QUERY, 1)
+
+    assert_uses_index(plan, "weight_measurements_user_date_key")
+    assert any(node["Node Type"] == "Index Only Scan" for node in walk(plan))
+
+
+@pytest.mark.asyncio
+async def test_export_query_uses_user_date_index(plan_connection):
+    plan = await explain(plan_connection, exporter.EXPORT_QUERY, 1, None, None)
+
+    assert_uses_index(plan, "weight_measurements_user_date_key")
+
+
+@pytest.mark.asyncio
+async def test_import_dedup_probes_user_date_index(plan_connection):
+    await plan_connection.execute(importer.CREATE_STAGING_QUERY)
+    plan = await explain(plan_connection, importer.MERGE_STAGING_QUERY, 1)
+
+    # The staging table itself is scanned and sorted; only the dedup probe matters
+    assert_uses_index(plan, "weight_measurements_user_date_key", sorted_by_index=False)
+
+
+@pytest.mark.asyncio
+async def test_goals_listing_uses_user_target_date_index(plan_connection):
+    plan = await explain(plan_connection, goals.GOALS_QUERY, 1)
+
+    assert_uses_index(plan, "goals_user_target_date_idx")
+
+
+@pytest.mark.asyncio
+async def test_goal_progress_probes_user_date_index(plan_connection):
+    plan = await explain(plan_connection, goals.GOAL_PROGRESS_QUERY, 1, 30, 3650)
+
+    # Both lateral lookups are bounded index scans, whatever the history size
+    assert_uses_index(plan, "goals_user_target_date_idx", sorted_by_index=False)
+    assert_uses_index(plan, "weight_measurements_user_date_key", sorted_by_index=False)
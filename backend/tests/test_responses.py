@@ -0,0 +1,31 @@
+import orjson
+import pytest
+from datetime import date
+from decimal import Decimal
+
+from responses import JSONResponse
+
+
+def test_renders_dates_and_decimals():
+    response = JSONResponse({"date": date(2024, 1, 15), "weight": Decimal("75.50")})
+
+    assert response.body == b'{"date":"2024-01-15","weight":75.5}'
+    assert response.media_type == "application/json"
+
+
+def test_rejects_unknown_types():
+    with pytest.raises(TypeError):
+        JSONResponse({"value": object()})
+
+
+@pytest.mark.asyncio
+async def test_renders_records_without_conversion(db_connection):
+    rows = await db_connection.fetch(
+        "SELECT 1 AS id, DATE '2024-01-15' AS measurement_date, 75.5::float8 AS weight, '' AS notes"
+    )
+
+    response = JSONResponse({"measurements": rows})
+
+    assert orjson.loads(response.body) == {
+        "measurements": [{"id": 1, "measurement_date": "2024-01-15", "weight": 75.5, "notes": ""}]
+    }
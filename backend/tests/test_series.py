@@ -0,0 +1,56 @@
+import numpy as np
+from datetime import date, timedelta
+
+import series
+
+
+def test_lttb_keeps_ends_and_bounds_size():
+    x = np.arange(1000, dtype=np.float64)
+    y = np.sin(x / 50)
+
+    selected = series.lttb(x, y, 100)
+
+    assert selected.size == 100
+    assert selected[0] == 0 and selected[-1] == 999
+    assert np.all(np.diff(selected) > 0)
+
+
+def test_lttb_keeps_spikes():
+    x = np.arange(500, dtype=np.float64)
+    y = np.full(500, 80.0)
+    y[123] = 95.0
+    y[321] = 60.0
+
+    selected = set(series.lttb(x, y, 20).tolist())
+
+    assert {123, 321} <= selected
+
+
+def test_lttb_returns_everything_below_threshold():
+    x = np.arange(5, dtype=np.float64)
+
+    assert series.lttb(x, x, 10).tolist() == [0, 1, 2, 3, 4]
+
+
+def test_downsample_records():
+    start = date(2024, 1, 1)
+    records = [{"day": (start + timedelta(days=i)).toordinal(), "weight": 80.0 - i / 10} for i in range(50)]
+
+    points = series.downsample(records, 10)
+
+    assert len(points) == 10
+    assert points[0] == {"measurement_date": start, "weight": 80.0}
+    assert points[-1]["measurement_date"] == start + timedelta(days=49)
+    assert series.downsample([], 10) == []
+
+
+def test_format_buckets_restores_date_order():
+    rows = [
+        {"bucket": date(2024, 2, 1), "min": 79.0, "avg": 79.456, "max": 80.0, "count": 3},
+        {"bucket": date(2024, 1, 1), "min": 80.0, "avg": 81.0, "max": 82.0, "count": 2},
+    ]
+
+    assert series.format_buckets(rows) == [
+        {"date": date(2024, 1, 1), "min": 80.0, "avg": 81.0, "max": 82.0, "count": 2},
+        {"date": date(2024, 2, 1), "min": 79.0, "avg": 79.46, "max": 80.0, "count": 3},
+    ]
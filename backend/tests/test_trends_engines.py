@@ -0,0 +1,138 @@
+import random
+import pytest
+from datetime import date, timedelta
+
+import analytics
+import weight_stats
+
+# Checks the SQL and stats trends engines against the NumPy one on a real database;
+# db_connection skips these when no Postgres is reachable.
+
+
+async def all_engines(connection, user_id):
+    user = await connection.fetchrow("SELECT height FROM users WHERE id = $1", user_id)
+    records = await connection.fetch(analytics.TRENDS_QUERY, user_id)
+    results = {"python": analytics.trends_from_records(records, user["height"])}
+    for engine, query in analytics.TRENDS_ENGINE_QUERIES.items():
+        results[engine] = analytics.trends_from_summary(await connection.fetchrow(query, user_id))
+    return results
+
+
+def assert_engines_agree(results):
+    expected = results.pop("python")
+    for engine, trends in results.items():
+        assert trends.keys() == expected.keys(), engine
+        for key, value in expected.items():
+            if isinstance(value, float):
+                assert trends[key] == pytest.approx(value, abs=1e-4), (engine, key)
+            else:
+                assert trends[key] == value, (engine, key)
+
+
+async def seed_history(connection, user_id, seed, points):
+    rng = random.Random(seed)
+    day = date(2023, 1, 1)
+    rows = []
+    for _ in range(points):
+        # mostly daily, with the odd gap
+        day += timedelta(days=rng.choice([1, 1, 1, 1, 2, 5]))
+        rows.append((user_id, day, round(rng.uniform(60, 90), 2), ""))
+    await connection.executemany(
+        "INSERT INTO weight_measurements (user_id, measurement_date, weight, notes) VALUES ($1, $2, $3, $4)",
+        rows,
+    )
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("seed,points", [(1, 1), (2, 2), (3, 40), (4, 400)])
+async def test_engines_agree(db_connection, make_user, seed, points):
+    user_id = await make_user(db_connection, 170 + seed)
+    await seed_history(db_connection, user_id, seed, points)
+
+    assert_engines_agree(await all_engines(db_connection, user_id))
+
+
+@pytest.mark.asyncio
+async def test_stats_follow_updates_and_deletes(db_connection, make_user):
+    user_id = await make_user(db_connection, 180)
+    await seed_history(db_connection, user_id, 5, 60)
+
+    # Break the streak in the middle, move the latest reading and bulk delete
+    await db_connection.execute("""
+        DELETE FROM weight_measurements
+        WHERE id = (SELECT id FROM weight_measurements WHERE user_id = $1 ORDER BY measurement_date DESC OFFSET 3 LIMIT 1)
+    """, user_id)
+    await db_connection.execute("""
+        UPDATE weight_measurements SET measurement_date = measurement_date + 3, weight = 55
+        WHERE id = (SELECT id FROM weight_measurements WHERE user_id = $1 ORDER BY measurement_date DESC LIMIT 1)
+    """, user_id)
+    await db_connection.execute("""
+        DELETE FROM weight_measurements
+        WHERE user_id = $1 AND measurement_date < (SELECT min(measurement_date) + 20 FROM weight_measurements WHERE user_id = $1)
+    """, user_id)
+    assert_engines_agree(await all_engines(db_connection, user_id))
+
+    await db_connection.execute("DELETE FROM weight_measurements WHERE user_id = $1", user_id)
+    results = await all_engines(db_connection, user_id)
+    assert results == {"python": {}, "stats": {}, "sql": {}}
+
+
+@pytest.mark.asyncio
+async def test_rebuild_repairs_drift(db_connection, make_user):
+    user_id = await make_user(db_connection, 165)
+    await seed_history(db_connection, user_id, 6, 30)
+    await db_connection.execute(
+        "UPDATE user_weight_stats SET measurement_count = 1, sum_y = 0, current_streak = 0 WHERE user_id = $1",
+        user_id,
+    )
+
+    assert await weight_stats.rebuild(db_connection, user_id) == 1
+
+    assert_engines_agree(await all_engines(db_connection, user_id))
+
+
+@pytest.mark.asyncio
+async def test_engines_empty_history(db_connection, make_user):
+    user_id = await make_user(db_connection)
+
+    results = await all_engines(db_connection, user_id)
+
+    assert results == {"python": {}, "stats": {}, "sql": {}}
+
+
+@pytest.mark.asyncio
+async def test_streak_follows_writes_around_the_stored_run(db_connection, make_user):
+    user_id = await make_user(db_connection, 175)
+    start = date(2024, 1, 1)
+    insert = "INSERT INTO weight_measurements (user_id, measurement_date, weight, notes) VALUES ($1, $2, 70, '')"
+    await db_connection.executemany(insert, [(user_id, start + timedelta(days=i)) for i in range(30) if i != 9])
+
+    async def streak():
+        return await db_connection.fetchval(
+            "SELECT current_streak FROM user_weight_stats WHERE user_id = $1", user_id
+        )
+
+    assert await streak() == 20
+    # Appending a day, filling the gap and skipping ahead
+    await db_connection.execute(insert, user_id, start + timedelta(days=30))
+    assert await streak() == 21
+    await db_connection.execute(insert, user_id, start + timedelta(days=9))
+    assert await streak() == 31
+    await db_connection.executemany(insert, [(user_id, start + timedelta(days=i)) for i in (32, 33)])
+    assert await streak() == 2
+    await db_connection.execute(insert, user_id, start + timedelta(days=31))
+    assert await streak() == 34
+    # Editing a weight keeps the run; deleting the latest day, a middle day or the first day cuts it
+    await db_connection.execute(
+        "UPDATE weight_measurements SET weight = 71 WHERE user_id = $1 AND measurement_date = $2",
+        user_id, start + timedelta(days=20),
+    )
+    assert await streak() == 34
+    delete = "DELETE FROM weight_measurements WHERE user_id = $1 AND measurement_date = $2"
+    await db_connection.execute(delete, user_id, start + timedelta(days=33))
+    assert await streak() == 33
+    await db_connection.execute(delete, user_id, start + timedelta(days=25))
+    assert await streak() == 7
+    await db_connection.execute(delete, user_id, start + timedelta(days=26))
+    assert await streak() == 6
+    assert_engines_agree(await all_engines(db_connection, user_id))
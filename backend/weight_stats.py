@@ -0,0 +1,69 @@
+import argparse
+import asyncio
+
+from database import database
+
+# Maintenance for the user_weight_stats summary table. The triggers from
+# migrations/0002 keep it current on every write; rebuild recomputes it from
+# weight_measurements to backfill existing data or repair drift.
+#
+#   python weight_stats.py rebuild [--user-id ID]
+
+REBUILD_QUERY = """
+    INSERT INTO user_weight_stats AS s (user_id, measurement_count, sum_x, sum_y, sum_xx, sum_xy, sum_yy)
+    SELECT u.id, count(w.y), coalesce(sum(w.x), 0), coalesce(sum(w.y), 0),
+           coalesce(sum(w.x * w.x), 0), coalesce(sum(w.x * w.y), 0), coalesce(sum(w.y * w.y), 0)
+    FROM users u
+    LEFT JOIN (
+        SELECT user_id, measurement_date - DATE '2000-01-01' AS x, weight AS y
+        FROM weight_measurements
+    ) w ON w.user_id = u.id
+    WHERE $1::integer IS NULL OR u.id = $1
+    GROUP BY u.id
+    ON CONFLICT (user_id) DO UPDATE SET
+        measurement_count = EXCLUDED.measurement_count,
+        sum_x = EXCLUDED.sum_x,
+        sum_y = EXCLUDED.sum_y,
+        sum_xx = EXCLUDED.sum_xx,
+        sum_xy = EXCLUDED.sum_xy,
+        sum_yy = EXCLUDED.sum_yy,
+        streak_start = NULL  -- recount the streak from scratch
+"""
+
+REFRESH_ANCHORS_QUERY = """
+    SELECT refresh_user_weight_anchors(user_id)
+    FROM user_weight_stats
+    WHERE $1::integer IS NULL OR user_id = $1
+"""
+
+
+async def rebuild(connection, user_id=None):
+    async with connection.transaction():
+        # Writers block on this lock in their stats trigger until the rebuild
+        # commits, so their deltas land on top of the recomputed totals.
+        await connection.execute("LOCK TABLE user_weight_stats IN EXCLUSIVE MODE")
+        status = await connection.execute(REBUILD_QUERY, user_id)
+        await connection.execute(REFRESH_ANCHORS_QUERY, user_id)
+    return int(status.split()[-1])
+
+
+async def run(args):
+    await database.connect()
+    try:
+        async with database.acquire() as connection:
+            count = await rebuild(connection, args.user_id)
+        print(f"Rebuilt weight statistics for {count} user(s)")
+    finally:
+        await database.disconnect()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the user_weight_stats table")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    rebuild_parser = subcommands.add_parser("rebuild", help="recompute statistics from weight_measurements")
+    rebuild_parser.add_argument("--user-id", type=int, default=None, help="only rebuild this user")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,8 +4,11 @@ import { Paper, Typography, Table, TableBody, TableCell, TableContainer, TableHe
 import EditIcon from '@mui/icons-material/Edit';
 import DeleteIcon from '@mui/icons-material/Delete';
 
+const PAGE_SIZE = 100;
+
 const DisplayMeasurements = ({ refresh }) => {
     const [measurements, setMeasurements] = useState([]);
+    const [nextCursor, setNextCursor] = useState(null);
     const [error, setError] = useState(null);
     const [loading, setLoading] = useState(true);
     const [editDialog, setEditDialog] = useState({ open: false, measurement: null });
@@ -15,13 +18,16 @@ const DisplayMeasurements = ({ refresh }) => {
     const backendApiUrl = process.env.REACT_APP_BACKEND_API_URL || 'http://backend:8000';
     const token = localStorage.getItem('token');
 
-    const fetchData = () => {
+    const fetchData = (cursor = null) => {
         setLoading(true);
         axios.get(`${backendApiUrl}/measurements`, {
-            headers: { Authorization: `Bearer ${token}` }
+            headers: { Authorization: `Bearer ${token}` },
+            params: cursor ? { limit: PAGE_SIZE, before: cursor } : { limit: PAGE_SIZE }
         })
             .then(response => {
-                setMeasurements(response.data.measurements || []);
+                const page = response.data.measurements || [];
+                setMeasurements(previous => (cursor ? [...previous, ...page] : page));
+                setNextCursor(response.data.next_cursor || null);
                 setError(null);
             })
             .catch(error => {
@@ -119,6 +125,11 @@ const DisplayMeasurements = ({ refresh }) => {
                     </Table>
                 </TableContainer>
             )}
+            {!loading && nextCursor && (
+                <Box sx={{ display: 'flex', justifyContent: 'center', mt: 2 }}>
+                    <Button onClick={() => fetchData(nextCursor)}>Load more</Button>
+                </Box>
+            )}
 
             {/* Edit Dialog */}
             <Dialog open={editDialog.open} onClose={() => setEditDialog({ open: false, measurement: null })}>
@@ -2,6 +2,20 @@ import React, { useState, useEffect, useCallback } from 'react';
 import axios from 'axios';
 import { Paper, Typography, TextField, Button, Box, Alert, List, ListItem, ListItemText, Divider, Switch, FormControlLabel } from '@mui/material';
 
+const describeProgress = (goal) => {
+    const parts = [`Started from: ${goal.start_weight} kg`];
+    if (goal.current_weight === null || goal.current_weight === undefined) {
+        return parts.join(' · ');
+    }
+    if (goal.reached) {
+        parts.push('Reached!');
+    } else {
+        parts.push(`${goal.percent_complete}% done, ${goal.kg_remaining} kg to go`);
+        parts.push(goal.estimated_date ? `on pace for ${goal.estimated_date}` : 'not on pace yet');
+    }
+    return parts.join(' · ');
+};
+
 const Goals = () => {
     const [goals, setGoals] = useState([]);
     const [targetWeight, setTargetWeight] = useState('');
@@ -18,7 +32,8 @@ const Goals = () => {
         const token = localStorage.getItem('token');
         try {
             const response = await axios.get(`${backendApiUrl}/goals`, {
-                headers: { Authorization: `Bearer ${token}` }
+                headers: { Authorization: `Bearer ${token}` },
+                params: { include: 'progress' }
             });
             setGoals(response.data.goals || []);
         } catch (err) {
@@ -58,9 +73,10 @@ const Goals = () => {
         const token = localStorage.getItem('token');
         try {
             const response = await axios.get(`${backendApiUrl}/export`, {
-                headers: { Authorization: `Bearer ${token}` }
+                headers: { Authorization: `Bearer ${token}` },
+                responseType: 'blob'
             });
-            const blob = new Blob([response.data.csv], { type: 'text/csv' });
+            const blob = new Blob([response.data], { type: 'text/csv' });
             const url = window.URL.createObjectURL(blob);
             const a = document.createElement('a');
             a.href = url;
@@ -164,7 +180,7 @@ const Goals = () => {
                         <ListItem>
                             <ListItemText
                                 primary={`Target: ${goal.target_weight} kg by ${goal.target_date}`}
-                                secondary={`Started from: ${goal.start_weight} kg`}
+                                secondary={describeProgress(goal)}
                             />
                         </ListItem>
                         <Divider />
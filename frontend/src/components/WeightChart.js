@@ -3,6 +3,8 @@ import { LineChart, Line, XAxis, YAxis, CartesianGrid, Tooltip, Legend, Responsi
 import axios from 'axios';
 import { Paper, Typography, Grid, Box } from '@mui/material';
 
+const CHART_POINTS = 365;
+
 const WeightChart = ({ refresh }) => {
     const [data, setData] = useState([]);
     const [changeData, setChangeData] = useState([]);
@@ -14,15 +16,14 @@ const WeightChart = ({ refresh }) => {
             const backendApiUrl = process.env.REACT_APP_BACKEND_API_URL || 'http://backend:8000';
             const token = localStorage.getItem('token');
 
-            // Fetch measurements
-            axios.get(`${backendApiUrl}/measurements`, {
-                headers: { Authorization: `Bearer ${token}` }
+            // Fetch a downsampled series; the backend keeps it to CHART_POINTS readings
+            axios.get(`${backendApiUrl}/measurements/series`, {
+                headers: { Authorization: `Bearer ${token}` },
+                params: { points: CHART_POINTS }
             })
                 .then(response => {
-                    const measurements = response.data.measurements || [];
-                    // Sort by date
-                    const sortedMeasurements = measurements
-                        .sort((a, b) => new Date(a.measurement_date) - new Date(b.measurement_date));
+                    // Already in date order
+                    const sortedMeasurements = response.data.series || [];
 
                     // Format for weight chart
                     const chartData = sortedMeasurements.map(m => ({
@@ -135,7 +136,9 @@ const WeightChart = ({ refresh }) => {
                         <Typography variant="h6">Trends</Typography>
                         <Typography>Average Weight: {trends.average_weight || 'N/A'} kg</Typography>
                         <Typography>BMI: {trends.bmi || 'N/A'}</Typography>
-                        <Typography>Trend Slope: {trends.trend_slope || 'N/A'} kg/measurement</Typography>
+                        <Typography>7-Day Average: {trends.weekly_average || 'N/A'} kg</Typography>
+                        <Typography>30-Day Average: {trends.monthly_average || 'N/A'} kg</Typography>
+                        <Typography>Trend Slope: {trends.trend_slope || 'N/A'} kg/day</Typography>
                         <Typography>Total Measurements: {trends.total_measurements || 0}</Typography>
                         <Typography>Current Streak: {trends.current_streak || 0} days</Typography>
                         <Typography>Date Range: {trends.date_range || 'N/A'}</Typography>